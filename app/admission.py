@@ -0,0 +1,88 @@
+import asyncio
+
+from fastapi import HTTPException, status
+
+from app import config
+
+
+class AdmissionGate:
+    """Caps concurrent requests; callers wait up to `wait_budget` seconds, then get a 503."""
+
+    def __init__(self, name, limit, wait_budget):
+        self.name = name
+        self.limit = limit
+        self.wait_budget = wait_budget
+        self._semaphore = None  # created on first use so it binds to the running loop
+        self.in_flight = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    async def acquire(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+        else:
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.wait_budget)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail=f"Server busy ({self.name}), retry later",
+                    headers={"Retry-After": str(config.ADMISSION_RETRY_AFTER)},
+                )
+            finally:
+                self.waiting -= 1
+        self.in_flight += 1
+        self.admitted += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def status(self):
+        return {
+            "gate": self.name,
+            "limit": self.limit,
+            "wait_budget_seconds": self.wait_budget,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+db_gate = AdmissionGate("db", config.ADMISSION_MAX_IN_FLIGHT, config.ADMISSION_WAIT_BUDGET)
+report_gate = AdmissionGate("reports", config.ADMISSION_REPORT_MAX_IN_FLIGHT, config.ADMISSION_REPORT_WAIT_BUDGET)
+
+
+# Dependency for ordinary routers: one slot of the global limit
+async def admit_db():
+    await db_gate.acquire()
+    try:
+        yield
+    finally:
+        db_gate.release()
+
+
+# Dependency for heavy report routers: a report slot first, then a global slot
+async def admit_report():
+    await report_gate.acquire()
+    try:
+        await db_gate.acquire()
+        try:
+            yield
+        finally:
+            db_gate.release()
+    finally:
+        report_gate.release()
+
+
+def admission_status():
+    return [db_gate.status(), report_gate.status()]
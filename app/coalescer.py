@@ -0,0 +1,95 @@
+"""Group commit for adjustments of hot inventory rows.
+
+Every stock adjustment locks its (item, branch) inventory row until it
+commits, so a row adjusted hundreds of times a minute is limited by that
+lock. With STOCK_COALESCE_WINDOW_MS set, submit() queues a line per pair
+instead: the first request for a pair becomes the batch leader, waits the
+window (or until STOCK_COALESCE_MAX_BATCH lines are queued), then applies the
+whole batch with stock.apply_lines() in one lock and one commit. Each line
+still gets its own stock_movements row with the previous/new stock it saw in
+arrival order, and each caller gets its own result.
+
+If a line would leave negative stock the batch is rolled back and its lines
+are applied one transaction each, so only that caller gets the
+InsufficientStockError.
+"""
+import threading
+from concurrent.futures import Future
+
+from app import config, stock
+from app.database import get_connection
+
+_pending = {}  # (item_id, branch_id) -> _Batch still accepting lines
+_lock = threading.Lock()
+
+
+class _Batch:
+    def __init__(self):
+        self.entries = []  # (line, Future)
+        self.full = threading.Event()
+
+
+def enabled():
+    return config.STOCK_COALESCE_WINDOW_MS > 0
+
+
+def submit(line):
+    """Apply one stock.apply_lines() line through the group commit; returns its result.
+
+    Blocks until the batch holding the line has committed (or failed).
+    """
+    pair = (line["item_id"], line["branch_id"])
+    future = Future()
+    with _lock:
+        batch = _pending.get(pair)
+        leader = batch is None
+        if leader:
+            batch = _pending[pair] = _Batch()
+        batch.entries.append((line, future))
+        if len(batch.entries) >= config.STOCK_COALESCE_MAX_BATCH:
+            del _pending[pair]  # later lines start the next batch
+            batch.full.set()
+    if leader:
+        batch.full.wait(config.STOCK_COALESCE_WINDOW_MS / 1000)
+        with _lock:
+            if _pending.get(pair) is batch:
+                del _pending[pair]
+        _flush(batch.entries)
+    return future.result()
+
+
+def _flush(entries):
+    try:
+        connection = get_connection()
+    except Exception as err:
+        for _, future in entries:
+            future.set_exception(err)
+        return
+    try:
+        connection.route = "stock-coalescer"
+        try:
+            results = stock.apply_lines(connection, [line for line, _ in entries])
+            connection.commit()
+        except stock.InsufficientStockError:
+            connection.rollback()
+            _flush_one_by_one(connection, entries)
+            return
+        for (_, future), result in zip(entries, results):
+            future.set_result(result)
+    except Exception as err:
+        for _, future in entries:
+            if not future.done():
+                future.set_exception(err)
+    finally:
+        connection.close()
+
+
+def _flush_one_by_one(connection, entries):
+    for line, future in entries:
+        try:
+            result = stock.apply_lines(connection, [line])[0]
+            connection.commit()
+            future.set_result(result)
+        except stock.InsufficientStockError as err:
+            connection.rollback()
+            future.set_exception(err)
@@ -0,0 +1,137 @@
+import os
+
+# Database connection settings (override with environment variables)
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = int(os.getenv("DB_PORT", "3306"))
+DB_USER = os.getenv("DB_USER", "root")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "")
+DB_NAME = os.getenv("DB_NAME", "inventory_management_system")
+
+# Connection pool settings
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))            # connections kept open
+DB_POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "10"))  # extra connections under load
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))      # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))      # reconnect connections idle longer than this
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"  # ping on checkout
+# Separate small pool for the short statements run while a request already
+# holds a pooled connection (Idempotency-Key claims, document number blocks,
+# name lookups), so they never wait for a slot that request-holders fill
+DB_AUX_POOL_SIZE = int(os.getenv("DB_AUX_POOL_SIZE", "4"))
+
+# Worker threads that run the (blocking) route handlers. Defaults to one per
+# pooled connection so handlers never queue on the pool while holding a thread.
+DB_EXECUTOR_THREADS = int(os.getenv("DB_EXECUTOR_THREADS", str(DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW)))
+
+# Admission control: cap in-flight DB work and shed load with 503 once the
+# wait budget (seconds) is exceeded. Heavy report routers get their own,
+# smaller limit so they can never occupy every slot.
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", str(DB_EXECUTOR_THREADS)))
+ADMISSION_WAIT_BUDGET = float(os.getenv("ADMISSION_WAIT_BUDGET", "2"))
+ADMISSION_REPORT_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_REPORT_MAX_IN_FLIGHT", str(max(1, ADMISSION_MAX_IN_FLIGHT // 4))))
+ADMISSION_REPORT_WAIT_BUDGET = float(os.getenv("ADMISSION_REPORT_WAIT_BUDGET", "0.5"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))  # seconds, sent in Retry-After
+
+# Read replicas for GET endpoints, as "host:port,host:port" (same credentials
+# as the primary). Replicas lagging more than DB_REPLICA_MAX_LAG seconds are
+# skipped, and a client that wrote recently reads from the primary for
+# DB_READ_AFTER_WRITE_WINDOW seconds.
+DB_REPLICAS = [r.strip() for r in os.getenv("DB_REPLICAS", "").split(",") if r.strip()]
+DB_REPLICA_POOL_SIZE = int(os.getenv("DB_REPLICA_POOL_SIZE", str(DB_POOL_SIZE)))
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))
+DB_REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_LAG_CHECK_INTERVAL", "5"))
+DB_REPLICA_LAG_CHECK = os.getenv("DB_REPLICA_LAG_CHECK", "true").lower() == "true"  # false: trust replicas blindly
+DB_READ_AFTER_WRITE_WINDOW = float(os.getenv("DB_READ_AFTER_WRITE_WINDOW", str(DB_REPLICA_MAX_LAG)))
+
+# Stock-writing handlers (app/retry.py) are re-run after an InnoDB deadlock or
+# lock wait timeout up to DB_RETRY_ATTEMPTS more times, sleeping a random
+# 0..min(DB_RETRY_MAX_DELAY, DB_RETRY_BASE_DELAY * 2**attempt) seconds between.
+# Their Idempotency-Key responses are replayed for IDEMPOTENCY_KEY_TTL seconds.
+DB_RETRY_ATTEMPTS = int(os.getenv("DB_RETRY_ATTEMPTS", "3"))
+DB_RETRY_BASE_DELAY = float(os.getenv("DB_RETRY_BASE_DELAY", "0.05"))
+DB_RETRY_MAX_DELAY = float(os.getenv("DB_RETRY_MAX_DELAY", "1"))
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", "86400"))
+
+# Slow-query log: statements slower than SLOW_QUERY_THRESHOLD seconds (0 disables)
+# are kept in a ring buffer and logged, and EXPLAINed once per
+# SLOW_QUERY_EXPLAIN_INTERVAL seconds on a background thread.
+SLOW_QUERY_THRESHOLD = float(os.getenv("SLOW_QUERY_THRESHOLD", "0.5"))
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", "200"))
+# Bound values can be secrets (password hashes, tokens); only log them when debugging
+SLOW_QUERY_LOG_PARAMS = os.getenv("SLOW_QUERY_LOG_PARAMS", "false").lower() == "true"
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() == "true"
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300"))
+SLOW_QUERY_EXPLAIN_QUEUE_SIZE = int(os.getenv("SLOW_QUERY_EXPLAIN_QUEUE_SIZE", "50"))
+SLOW_QUERY_PLAN_CACHE_SIZE = int(os.getenv("SLOW_QUERY_PLAN_CACHE_SIZE", "200"))  # distinct SQL texts, least recently used dropped
+
+# Stock movement listings: default and maximum page size (keyset pagination)
+MOVEMENT_PAGE_SIZE = int(os.getenv("MOVEMENT_PAGE_SIZE", "100"))
+MOVEMENT_PAGE_SIZE_MAX = int(os.getenv("MOVEMENT_PAGE_SIZE_MAX", "1000"))
+
+# Streaming exports: rows fetched from the server-side cursor per chunk
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+
+# Schema migrations (migrations/*.sql). At startup the indexes they declare are
+# checked against the live schema; missing ones are logged, or fail startup
+# with MIGRATIONS_REQUIRE_INDEXES. MIGRATIONS_AUTO_APPLY applies pending files first,
+# stopping at the first one marked `-- offline`.
+MIGRATIONS_DIR = os.getenv("MIGRATIONS_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations"))
+MIGRATIONS_CHECK_ON_STARTUP = os.getenv("MIGRATIONS_CHECK_ON_STARTUP", "true").lower() == "true"
+MIGRATIONS_AUTO_APPLY = os.getenv("MIGRATIONS_AUTO_APPLY", "false").lower() == "true"
+MIGRATIONS_REQUIRE_INDEXES = os.getenv("MIGRATIONS_REQUIRE_INDEXES", "false").lower() == "true"
+MIGRATION_LOCK_WAIT_TIMEOUT = int(os.getenv("MIGRATION_LOCK_WAIT_TIMEOUT", "5"))  # seconds to wait for a metadata lock
+
+# Bulk stock movement ingestion: rows accepted per request, rows per multi-row INSERT
+BULK_MOVEMENT_MAX_ROWS = int(os.getenv("BULK_MOVEMENT_MAX_ROWS", "5000"))
+BULK_MOVEMENT_CHUNK_SIZE = int(os.getenv("BULK_MOVEMENT_CHUNK_SIZE", "500"))
+
+# Bulk transfer request creation: transfer requests accepted per request, rows per multi-row INSERT
+BULK_TRANSFER_MAX_REQUESTS = int(os.getenv("BULK_TRANSFER_MAX_REQUESTS", "1000"))
+BULK_TRANSFER_CHUNK_SIZE = int(os.getenv("BULK_TRANSFER_CHUNK_SIZE", "500"))
+
+
+# Item/branch/user names used to enrich stock movement rows are cached per worker;
+# this worker's updates invalidate immediately, other workers' after the TTL (seconds)
+DIMENSION_CACHE_TTL = float(os.getenv("DIMENSION_CACHE_TTL", "300"))
+
+# Monthly stock_movements partitions (app/partitions.py): how many months ahead
+# to keep created, and how often to check, in seconds (0 disables the background job)
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_MAINTENANCE_INTERVAL = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "21600"))
+
+# Ledger balance checkpoints (app/ledger.py): written every CHECKPOINT_INTERVAL
+# seconds (0 disables the background job); movements younger than
+# CHECKPOINT_SETTLE_SECONDS are left for the next run
+CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", "3600"))
+CHECKPOINT_SETTLE_SECONDS = int(os.getenv("CHECKPOINT_SETTLE_SECONDS", "60"))
+
+# Background reconciliation jobs (app/reconciliation.py): inventory rows per
+# chunk, chunks reconciled in parallel across all jobs (each holds a connection
+# from a pool of that size, separate from the request pool), and how many
+# finished jobs each worker keeps for status polling
+RECONCILE_CHUNK_SIZE = int(os.getenv("RECONCILE_CHUNK_SIZE", "500"))
+RECONCILE_WORKERS = int(os.getenv("RECONCILE_WORKERS", "4"))
+RECONCILE_JOBS_KEPT = int(os.getenv("RECONCILE_JOBS_KEPT", "50"))
+
+# Per-branch stock snapshots for point-in-time queries (app/snapshots.py),
+# taken every SNAPSHOT_INTERVAL seconds (0 disables the background job)
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "86400"))
+
+# In-memory item x branch stock matrix (app/stock_matrix.py) serving the hot
+# inventory reads. Refreshed incrementally every STOCK_MATRIX_REFRESH_INTERVAL
+# seconds and fully every STOCK_MATRIX_RELOAD_INTERVAL; requests fall back to
+# SQL when the last refresh is older than STOCK_MATRIX_MAX_STALENESS seconds.
+STOCK_MATRIX_ENABLED = os.getenv("STOCK_MATRIX_ENABLED", "true").lower() == "true"
+STOCK_MATRIX_REFRESH_INTERVAL = float(os.getenv("STOCK_MATRIX_REFRESH_INTERVAL", "1"))
+STOCK_MATRIX_RELOAD_INTERVAL = float(os.getenv("STOCK_MATRIX_RELOAD_INTERVAL", "300"))
+STOCK_MATRIX_OVERLAP_SECONDS = int(os.getenv("STOCK_MATRIX_OVERLAP_SECONDS", "5"))
+STOCK_MATRIX_MAX_STALENESS = float(os.getenv("STOCK_MATRIX_MAX_STALENESS", "10"))
+# Group commit for stock adjustments (app/coalescer.py). When
+# STOCK_COALESCE_WINDOW_MS is above 0, concurrent adjustments of the same
+# (item, branch) wait that long for each other and are applied in one
+# transaction of at most STOCK_COALESCE_MAX_BATCH lines. 0 (default) disables it.
+STOCK_COALESCE_WINDOW_MS = float(os.getenv("STOCK_COALESCE_WINDOW_MS", "0"))
+STOCK_COALESCE_MAX_BATCH = int(os.getenv("STOCK_COALESCE_MAX_BATCH", "100"))
+
+# Document numbers (app/sequences.py): each worker reserves this many numbers
+# per prefix and day at a time; numbers left unused at restart are skipped
+DOCUMENT_NUMBER_BLOCK = int(os.getenv("DOCUMENT_NUMBER_BLOCK", "10"))
@@ -1,15 +1,657 @@
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
 import mysql.connector
-from fastapi import HTTPException
+from fastapi import HTTPException, Request, status
+
+from app import config, metrics, slow_queries
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class AutoIncrementError(Exception):
+    """The server may give one multi-row INSERT non-consecutive auto-increment ids."""
+
+
+class _PoolEntry:
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.prepared = {}  # query name -> prepared cursor, lives as long as the connection
+
+
+class TrackedCursor:
+    """Thin cursor wrapper that counts and times the statements run on its connection.
+
+    Prepared cursors are labelled with their registry name; anything else is
+    labelled by verb and table (see metrics.statement_label).
+    """
+
+    def __init__(self, connection, cursor, name=None):
+        self._connection = connection
+        self._cursor = cursor
+        self._name = name
+        self._statement = name
+        self._slow_entry = None  # slow-query log entry for the last statement, gets the row count
+
+    def _run(self, statement, operation, params, explain, method, *args, **kwargs):
+        connection = self._connection
+        connection.query_count += 1
+        self._statement = statement
+        self._slow_entry = None
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        except mysql.connector.Error:
+            metrics.DB_ERRORS.labels(connection.route, statement).inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.DB_QUERY_SECONDS.labels(connection.route, statement).observe(elapsed)
+            if elapsed >= config.SLOW_QUERY_THRESHOLD > 0 and connection.track_slow_queries:
+                self._slow_entry = slow_queries.record(
+                    connection.route, statement, operation, params, elapsed, explain=explain,
+                    pool=connection._pool,
+                )
+
+    def _rows(self, rows):
+        if self._statement is not None:
+            metrics.DB_ROWS.labels(self._connection.route, self._statement).inc(len(rows))
+        if self._slow_entry is not None:
+            self._slow_entry["rows"] = (self._slow_entry["rows"] or 0) + len(rows)
+        return rows
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        statement = self._name or metrics.statement_label(operation)
+        return self._run(statement, operation, params, True, self._cursor.execute, operation, params, *args, **kwargs)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        statement = self._name or metrics.statement_label(operation)
+        return self._run(statement, operation, None, False, self._cursor.executemany, operation, seq_params, *args, **kwargs)
+
+    def callproc(self, procname, args=(), *rest, **kwargs):
+        return self._run(f"CALL {procname}", f"CALL {procname}", args, False, self._cursor.callproc, procname, args, *rest, **kwargs)
+
+    def fetchall(self):
+        return self._rows(self._cursor.fetchall())
+
+    def fetchmany(self, *args, **kwargs):
+        return self._rows(self._cursor.fetchmany(*args, **kwargs))
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        self._rows([row] if row is not None else [])
+        return row
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class PooledConnection:
+    """A checked-out connection. close() hands it back to the pool instead of disconnecting."""
+
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+        self._cursors = []
+        self.query_count = 0
+        self.route = metrics.UNMATCHED_ROUTE  # set by get_db, used as the metrics label
+        self.track_slow_queries = True
+
+    def cursor(self, *args, **kwargs):
+        cursor = TrackedCursor(self, self._entry.connection.cursor(*args, **kwargs))
+        self._cursors.append(cursor)
+        return cursor
+
+    def prepared_cursor(self, name):
+        # Server-side prepared statement cursor, prepared once per physical connection
+        prepared = self._entry.prepared
+        if name not in prepared:
+            prepared[name] = self._entry.connection.cursor(prepared=True)
+        return TrackedCursor(self, prepared[name], name)
+
+    def close(self):
+        if self._entry is None:
+            return
+        for cursor in self._cursors:
+            try:
+                cursor.close()
+            except mysql.connector.Error:
+                pass
+        self._cursors = []
+        entry, self._entry = self._entry, None
+        self._pool._release(entry)
+
+    def discard(self):
+        """Close the physical connection instead of returning it to the pool.
+
+        For a connection abandoned mid-result (e.g. an unbuffered cursor whose
+        reader went away): shutdown() drops the socket without reading the
+        rest of the result, which rollback() or close() would do first, and
+        the server aborts the query once it can no longer send rows.
+        """
+        if self._entry is None:
+            return
+        self._cursors = []
+        entry, self._entry = self._entry, None
+        self._pool._forget(entry)
+
+    def __getattr__(self, name):
+        entry = self.__dict__.get("_entry")
+        if entry is None:
+            raise mysql.connector.InterfaceError("Connection has been returned to the pool")
+        return getattr(entry.connection, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """Bounded pool of mysql.connector connections.
+
+    Keeps up to `size` idle connections and opens up to `max_overflow` extra ones
+    under load (closed again when returned). Connections idle longer than `recycle`
+    seconds are reopened, and with `pre_ping` every checkout is validated first.
+    """
+
+    def __init__(self, db_config, size, max_overflow, timeout, recycle, pre_ping, name="primary"):
+        self.name = name
+        self.db_config = db_config
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self._idle = deque()
+        self._open = 0
+        self._checked_out = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "connections_created": 0,
+            "connections_recycled": 0,
+            "failed_pings": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def _new_entry(self):
+        entry = _PoolEntry(mysql.connector.connect(**self.db_config))
+        with self._cond:
+            self._stats["connections_created"] += 1
+        return entry
+
+    def _discard(self, entry):
+        try:
+            entry.connection.close()
+        except mysql.connector.Error:
+            pass
+
+    def _validate(self, entry):
+        now = time.monotonic()
+        if self.recycle and now - entry.last_used > self.recycle:
+            self._discard(entry)
+            with self._cond:
+                self._stats["connections_recycled"] += 1
+            return self._new_entry()
+        if self.pre_ping:
+            try:
+                entry.connection.ping(reconnect=False)
+            except mysql.connector.Error:
+                self._discard(entry)
+                with self._cond:
+                    self._stats["failed_pings"] += 1
+                return self._new_entry()
+        return entry
+
+    def connect(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        entry = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeoutError(f"Connection pool '{self.name}' is closed")
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._open < self.size + self.max_overflow:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeoutError(
+                        f"Timed out after {self.timeout}s waiting for a connection from pool '{self.name}'"
+                    )
+                self._cond.wait(remaining)
+            self._checked_out += 1
+
+        try:
+            entry = self._validate(entry) if entry is not None else self._new_entry()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._checked_out -= 1
+                self._cond.notify()
+            raise
+
+        waited = time.monotonic() - started
+        metrics.DB_POOL_WAIT_SECONDS.labels(self.name).observe(waited)
+        with self._cond:
+            self._stats["checkouts"] += 1
+            self._stats["wait_seconds_total"] += waited
+            self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], waited)
+        return PooledConnection(self, entry)
+
+    def _release(self, entry):
+        healthy = True
+        try:
+            # Never hand out a connection with a half-finished transaction
+            if entry.connection.in_transaction:
+                entry.connection.rollback()
+        except mysql.connector.Error:
+            healthy = False
+
+        with self._cond:
+            self._checked_out -= 1
+            keep = healthy and not self._closed and len(self._idle) < self.size
+            if keep:
+                entry.last_used = time.monotonic()
+                self._idle.append(entry)
+            else:
+                self._open -= 1
+            self._cond.notify()
+        if not keep:
+            self._discard(entry)
+
+    def _forget(self, entry):
+        try:
+            entry.connection.shutdown()
+        except Exception:
+            pass
+        with self._cond:
+            self._checked_out -= 1
+            self._open -= 1
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            self._discard(entry)
+
+    def status(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "pool": self.name,
+                "size": self.size,
+                "max_overflow": self.max_overflow,
+                "open": self._open,
+                "idle": len(self._idle),
+                "checked_out": self._checked_out,
+            })
+        checkouts = stats["checkouts"]
+        stats["wait_seconds_avg"] = stats["wait_seconds_total"] / checkouts if checkouts else 0.0
+        return stats
+
+
+class ReplicaSet:
+    """Read replicas behind their own pools.
+
+    Replication lag is sampled at most every `check_interval` seconds per replica;
+    a replica that is too far behind, not replicating or unreachable is skipped.
+    """
+
+    def __init__(self, pools, max_lag, check_interval, check_lag=True):
+        self.pools = pools
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.check_lag = check_lag
+        self._lag = {pool.name: (None, 0.0) for pool in pools}  # name -> (lag seconds, checked at)
+        self._lock = threading.Lock()
+        self._next = itertools.count()
+
+    def _measure_lag(self, pool):
+        try:
+            connection = pool.connect()
+        except (PoolTimeoutError, mysql.connector.Error):
+            return None
+        try:
+            cursor = connection.cursor(dictionary=True)
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except mysql.connector.Error:
+                # MariaDB and MySQL < 8.0.22
+                cursor.execute("SHOW SLAVE STATUS")
+            rows = cursor.fetchall()
+        except mysql.connector.Error:
+            return None
+        finally:
+            connection.close()
+        lags = [row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master")) for row in rows]
+        if not lags or any(lag is None for lag in lags):
+            return None
+        return max(lags)
+
+    def lag(self, pool):
+        if not self.check_lag:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            lag, checked_at = self._lag[pool.name]
+            stale = now - checked_at >= self.check_interval
+            if stale:
+                # Claim the refresh; concurrent callers keep using the previous value
+                self._lag[pool.name] = (lag, now)
+        if stale:
+            lag = self._measure_lag(pool)
+            with self._lock:
+                self._lag[pool.name] = (lag, time.monotonic())
+        return lag
+
+    def pick(self):
+        start = next(self._next)
+        for offset in range(len(self.pools)):
+            pool = self.pools[(start + offset) % len(self.pools)]
+            lag = self.lag(pool)
+            if lag is not None and lag <= self.max_lag:
+                return pool
+        return None
+
+    def close(self):
+        for pool in self.pools:
+            pool.close()
 
-def get_connection():
+    def status(self):
+        result = []
+        for pool in self.pools:
+            stats = pool.status()
+            with self._lock:
+                stats["replication_lag_seconds"] = self._lag[pool.name][0]
+            result.append(stats)
+        return result
+
+
+_pool = None
+_aux_pool = None
+_reconcile_pool = None
+_replicas = None
+_pool_lock = threading.Lock()
+
+# Cookie holding the time of the client's last write, for read-your-writes routing
+LAST_WRITE_COOKIE = "db_last_write"
+
+
+def _db_config(host=None, port=None):
+    return {
+        "host": host or config.DB_HOST,
+        "port": port or config.DB_PORT,
+        "user": config.DB_USER,
+        "password": config.DB_PASSWORD,
+        "database": config.DB_NAME,
+    }
+
+
+def _replica_pool(address):
+    host, _, port = address.partition(":")
+    return ConnectionPool(
+        _db_config(host, int(port) if port else None),
+        size=config.DB_REPLICA_POOL_SIZE,
+        max_overflow=config.DB_POOL_MAX_OVERFLOW,
+        timeout=config.DB_POOL_TIMEOUT,
+        recycle=config.DB_POOL_RECYCLE,
+        pre_ping=config.DB_POOL_PRE_PING,
+        name=f"replica-{address}",
+    )
+
+
+def init_pool():
+    global _pool, _aux_pool, _reconcile_pool, _replicas
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                _db_config(),
+                size=config.DB_POOL_SIZE,
+                max_overflow=config.DB_POOL_MAX_OVERFLOW,
+                timeout=config.DB_POOL_TIMEOUT,
+                recycle=config.DB_POOL_RECYCLE,
+                pre_ping=config.DB_POOL_PRE_PING,
+            )
+            _aux_pool = ConnectionPool(
+                _db_config(),
+                size=config.DB_AUX_POOL_SIZE,
+                max_overflow=0,
+                timeout=config.DB_POOL_TIMEOUT,
+                recycle=config.DB_POOL_RECYCLE,
+                pre_ping=config.DB_POOL_PRE_PING,
+                name="aux",
+            )
+            _reconcile_pool = ConnectionPool(
+                _db_config(),
+                size=config.RECONCILE_WORKERS,
+                max_overflow=0,
+                timeout=config.DB_POOL_TIMEOUT,
+                recycle=config.DB_POOL_RECYCLE,
+                pre_ping=config.DB_POOL_PRE_PING,
+                name="reconcile",
+            )
+            if config.DB_REPLICAS:
+                _replicas = ReplicaSet(
+                    [_replica_pool(address) for address in config.DB_REPLICAS],
+                    max_lag=config.DB_REPLICA_MAX_LAG,
+                    check_interval=config.DB_REPLICA_LAG_CHECK_INTERVAL,
+                    check_lag=config.DB_REPLICA_LAG_CHECK,
+                )
+    return _pool
+
+
+def close_pool():
+    global _pool, _aux_pool, _reconcile_pool, _replicas
+    with _pool_lock:
+        pool, _pool = _pool, None
+        aux_pool, _aux_pool = _aux_pool, None
+        reconcile_pool, _reconcile_pool = _reconcile_pool, None
+        replicas, _replicas = _replicas, None
+    if pool is not None:
+        pool.close()
+    if aux_pool is not None:
+        aux_pool.close()
+    if reconcile_pool is not None:
+        reconcile_pool.close()
+    if replicas is not None:
+        replicas.close()
+
+
+def get_pool():
+    return _pool if _pool is not None else init_pool()
+
+
+def replicas_enabled():
+    return bool(config.DB_REPLICAS)
+
+
+def pool_status():
+    get_pool()
+    return {
+        "primary": _pool.status(),
+        "aux": _aux_pool.status(),
+        "reconcile": _reconcile_pool.status(),
+        "replicas": _replicas.status() if _replicas is not None else [],
+    }
+
+
+def _checkout(pool):
     try:
-        conn = mysql.connector.connect(
-            host="localhost",
-            user="root",
-            password="",
-            database="inventory_management_system",
-              # Use dictionary cursor for named access to columns
-        )
-        return conn
+        return pool.connect()
+    except PoolTimeoutError as err:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"Database busy: {err}")
     except mysql.connector.Error as err:
-        raise HTTPException(status_code=500, detail=f"Database connection error: {err}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Database connection error: {err}")
+
+
+def get_connection(read_only=False):
+    pool = get_pool()
+    if read_only and _replicas is not None:
+        replica = _replicas.pick()
+        if replica is not None:
+            try:
+                return replica.connect()
+            except (PoolTimeoutError, mysql.connector.Error):
+                pass  # fall back to the primary
+    return _checkout(pool)
+
+
+def get_aux_connection():
+    """A primary connection from the small aux pool, for work done while already holding one.
+
+    Checking a second connection out of the main pool while holding one can
+    deadlock: once every slot is held by a request waiting for its second,
+    they all wait out the pool timeout. Aux connections must be held briefly
+    and never while waiting for another connection.
+    """
+    get_pool()
+    return _checkout(_aux_pool)
+
+
+def get_reconcile_connection():
+    """A primary connection from the reconciliation pool (RECONCILE_WORKERS connections).
+
+    Reconciliation chunks hold their connection for the whole chunk; taking
+    them from here keeps jobs from draining the pool live requests use.
+    """
+    get_pool()
+    return _reconcile_pool.connect()
+
+
+_insert_ids_checked = False
+
+
+def check_insert_ids(connection):
+    """Raise AutoIncrementError unless a multi-row INSERT gets ids lastrowid, lastrowid + 1, ...
+
+    Bulk movement inserts number their rows from lastrowid, which holds for
+    "simple inserts" with innodb_autoinc_lock_mode 0 or 1 and an
+    auto_increment_increment of 1. Mode 2 (interleaved) lets concurrent
+    inserts take ids in between. Checked once per process.
+    """
+    global _insert_ids_checked
+    if _insert_ids_checked:
+        return
+    cursor = connection.cursor()
+    cursor.execute("SELECT @@innodb_autoinc_lock_mode, @@auto_increment_increment")
+    lock_mode, increment = cursor.fetchone()
+    if int(lock_mode) == 2 or int(increment) != 1:
+        raise AutoIncrementError(
+            f"Multi-row INSERTs need consecutive auto-increment ids: set innodb_autoinc_lock_mode "
+            f"to 1 (is {lock_mode}) and auto_increment_increment to 1 (is {increment})"
+        )
+    _insert_ids_checked = True
+
+
+def check_insert_ids_on_startup():
+    """check_insert_ids() at startup, so a misconfigured server stops the app before any write.
+
+    An unreachable database only logs a warning; the check then runs on first use.
+    """
+    try:
+        connection = get_pool().connect()
+    except (PoolTimeoutError, mysql.connector.Error) as err:
+        logger.warning("Skipped auto-increment check, database unavailable: %s", err)
+        return
+    try:
+        connection.route = "startup"
+        check_insert_ids(connection)
+    finally:
+        connection.close()
+
+
+def last_write_at(request):
+    """When this client last wrote, from the read-after-write cookie (a time.time() value), or None."""
+    last_write = request.cookies.get(LAST_WRITE_COOKIE)
+    if last_write:
+        try:
+            return float(last_write)
+        except ValueError:
+            pass
+    return None
+
+
+def wrote_recently(request):
+    """Whether this client wrote within DB_READ_AFTER_WRITE_WINDOW (the read-after-write cookie)."""
+    last_write = last_write_at(request)
+    return last_write is not None and time.time() - last_write < config.DB_READ_AFTER_WRITE_WINDOW
+
+
+def _is_read_only(request):
+    # GETs may go to a replica unless this client wrote within the lag window
+    return request.method in ("GET", "HEAD") and not wrote_recently(request)
+
+
+@contextmanager
+def lock_wait_timeout(connection, seconds):
+    """Run the block with the session's lock_wait_timeout set to `seconds`.
+
+    The previous value is restored afterwards: session variables survive the
+    connection going back to the pool, and request handlers must not inherit
+    the short timeout meant for DDL.
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT @@SESSION.lock_wait_timeout")
+    previous = cursor.fetchone()[0]
+    cursor.execute("SET SESSION lock_wait_timeout = %s", (seconds,))
+    try:
+        yield
+    finally:
+        cursor.execute("SET SESSION lock_wait_timeout = %s", (previous,))
+
+
+def open_request_connection(request: Request):
+    """A connection routed like get_db's, but owned by the caller.
+
+    For work that outlives the handler, such as a streaming response body;
+    the caller must close() it.
+    """
+    connection = get_connection(read_only=_is_read_only(request))
+    connection.route = metrics.route_label(request)
+    return connection
+
+
+def get_db(request: Request):
+    """Request-scoped connection dependency.
+
+    Yields one pooled connection per request; every Depends(get_db) in the same
+    request (including nested helper dependencies) shares it and its transaction.
+    Handlers commit their writes themselves, before returning: the code after
+    `yield` runs once the response has been sent, too late for a failed commit
+    to change it. Anything left uncommitted is rolled back when the connection
+    goes back to the pool. Read-only (GET) requests are served from a replica
+    when one is configured and caught up.
+    """
+    connection = open_request_connection(request)
+    request.state.db_connection = connection
+    try:
+        yield connection
+    finally:
+        connection.close()
@@ -0,0 +1,98 @@
+import threading
+import time
+
+from app import config
+from app.database import get_aux_connection
+
+
+class DimensionCache:
+    """id -> display name for a small master table, loaded lazily.
+
+    Misses are fetched with one IN query per call. Entries expire after
+    DIMENSION_CACHE_TTL seconds so other workers' updates show up eventually;
+    updates in this process call invalidate() and show up immediately.
+    """
+
+    def __init__(self, table, key, column):
+        self.table = table
+        self.key = key
+        self.column = column
+        self._names = {}  # id -> (name, loaded_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, ids, connection=None):
+        """Names for `ids`; unknown ids are left out. Without a connection one is borrowed for the misses."""
+        now = time.monotonic()
+        found = {}
+        missing = []
+        with self._lock:
+            for id_ in ids:
+                entry = self._names.get(id_)
+                if entry is not None and now - entry[1] < config.DIMENSION_CACHE_TTL:
+                    found[id_] = entry[0]
+                else:
+                    missing.append(id_)
+            self.hits += len(found)
+            self.misses += len(missing)
+        if missing:
+            loaded = self._load(missing, connection)
+            with self._lock:
+                for id_, name in loaded.items():
+                    self._names[id_] = (name, now)
+            found.update(loaded)
+        return found
+
+    def _load(self, ids, connection):
+        owned = connection is None
+        if owned:
+            connection = get_aux_connection()
+        try:
+            cursor = connection.cursor()
+            placeholders = ", ".join(["%s"] * len(ids))
+            cursor.execute(
+                f"SELECT {self.key}, {self.column} FROM {self.table} WHERE {self.key} IN ({placeholders})",
+                tuple(ids),
+            )
+            return dict(cursor.fetchall())
+        finally:
+            if owned:
+                connection.close()
+
+    def invalidate(self, id_=None):
+        with self._lock:
+            if id_ is None:
+                self._names.clear()
+            else:
+                self._names.pop(id_, None)
+
+    def status(self):
+        with self._lock:
+            return {"table": self.table, "entries": len(self._names), "hits": self.hits, "misses": self.misses}
+
+
+item_names = DimensionCache("items", "item_id", "item_name")
+branch_names = DimensionCache("branches", "branch_id", "branch_name")
+user_names = DimensionCache("users", "user_id", "full_name")
+
+# Columns enrich_movements() adds, in the order the old joined select returned them
+MOVEMENT_NAME_COLUMNS = ("item_name", "branch_name", "created_by_name")
+
+
+def enrich_movements(rows, connection=None):
+    """Fill item_name, branch_name and created_by_name on stock_movements rows in place."""
+    if not rows:
+        return rows
+    items = item_names.get_many({row["item_id"] for row in rows}, connection)
+    branches = branch_names.get_many({row["branch_id"] for row in rows}, connection)
+    users = user_names.get_many({row["created_by"] for row in rows}, connection)
+    for row in rows:
+        row["item_name"] = items.get(row["item_id"])
+        row["branch_name"] = branches.get(row["branch_id"])
+        row["created_by_name"] = users.get(row["created_by"])
+    return rows
+
+
+def dimension_status():
+    return [item_names.status(), branch_names.status(), user_names.status()]
@@ -0,0 +1,103 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+
+import mysql.connector
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from app import config
+from app.database import open_request_connection
+
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+_MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+}
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8", "replace")
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _csv_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return "" if value is None else value
+
+
+def _chunks(connection, cursor, fmt, enrich, extra_columns):
+    finished = False
+    try:
+        columns = tuple(cursor.column_names) + tuple(extra_columns)
+        if fmt == ExportFormat.CSV:
+            buffer = io.StringIO()
+            csv.writer(buffer).writerow(columns)
+            yield buffer.getvalue()
+        while True:
+            batch = cursor.fetchmany(config.EXPORT_BATCH_SIZE)
+            if not batch:
+                break
+            rows = [dict(zip(cursor.column_names, row)) for row in batch]
+            if enrich is not None:
+                enrich(rows)
+            if fmt == ExportFormat.CSV:
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows([_csv_value(row.get(column)) for column in columns] for row in rows)
+                yield buffer.getvalue()
+            else:
+                yield "".join(json.dumps(row, default=_json_default) + "\n" for row in rows)
+        finished = True
+    finally:
+        if finished:
+            try:
+                cursor.close()
+            except mysql.connector.Error:
+                pass
+            connection.close()
+        else:
+            # The client went away (or a fetch failed) with rows still unread. Handing the
+            # connection back would make its rollback read the rest of the result set,
+            # so drop it instead.
+            connection.discard()
+
+
+def stream_rows(request: Request, query, params, fmt: ExportFormat, filename, enrich=None, extra_columns=()):
+    """Stream a query's rows as NDJSON or CSV, one chunk per EXPORT_BATCH_SIZE rows.
+
+    `enrich`, if given, is called with each batch as a list of dicts and may add
+    the `extra_columns` to them. It must not use the streaming connection, which
+    is busy with the unread result set.
+
+    The query runs here, so connection and SQL errors still become normal error
+    responses; only the row fetching happens while the body is streamed. The
+    connection is owned by the stream (not get_db), since the body is produced
+    after the handler has returned.
+    """
+    connection = open_request_connection(request)
+    try:
+        # Unbuffered: rows are read off the socket batch by batch, never all held in memory
+        cursor = connection.cursor(buffered=False)
+        cursor.execute(query, tuple(params))
+    except BaseException:
+        connection.close()
+        raise
+    return StreamingResponse(
+        _chunks(connection, cursor, fmt, enrich, extra_columns),
+        media_type=_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt.value}"'},
+    )
@@ -0,0 +1,162 @@
+"""Stock ledger balances with checkpoints.
+
+The balance of an (item, branch) pair is the signed sum of its stock_movements.
+stock_balance_checkpoints (migrations/0004) records that sum up to a movement
+id, so reconciliation only replays the movements after the latest checkpoint
+instead of the pair's whole history.
+
+Movements newer than CHECKPOINT_SETTLE_SECONDS are never checkpointed, giving
+transactions still in flight time to commit before the high-watermark passes
+their ids. The same window is the slack on the created_at bound used to find
+the movements after a checkpoint, so replays stay index range scans.
+
+    python -m app.ledger checkpoint [branch_id]
+"""
+import logging
+import sys
+import threading
+
+import mysql.connector
+
+from app import config
+from app.database import PoolTimeoutError, close_pool, get_pool
+from app.queries import MOVEMENT_MIN_DATE
+
+logger = logging.getLogger(__name__)
+
+# Signed effect of a movement on its pair's balance
+SIGNED_QUANTITY = """CASE
+                WHEN sm.movement_type IN ('IN', 'TRANSFER_IN') THEN sm.quantity
+                WHEN sm.movement_type IN ('OUT', 'TRANSFER_OUT') THEN -sm.quantity
+                WHEN sm.movement_type = 'ADJUSTMENT' THEN sm.quantity
+                ELSE 0
+            END"""
+
+# Join condition for the latest checkpoint `cp` of the pair in `inv` (inventory)
+LATEST_CHECKPOINT = """cp.item_id = inv.item_id AND cp.branch_id = inv.branch_id
+        AND cp.last_movement_id = (
+            SELECT MAX(c2.last_movement_id) FROM stock_balance_checkpoints c2
+            WHERE c2.item_id = inv.item_id AND c2.branch_id = inv.branch_id
+        )"""
+
+# Movements `sm` of the pair in `inv` after checkpoint `cp` (all of them without one).
+# Parameters: CHECKPOINT_SETTLE_SECONDS, MOVEMENT_MIN_DATE
+AFTER_CHECKPOINT = """sm.item_id = inv.item_id AND sm.branch_id = inv.branch_id
+            AND sm.movement_id > COALESCE(cp.last_movement_id, 0)
+            AND sm.created_at >= COALESCE(cp.last_movement_at - INTERVAL %s SECOND, %s)"""
+
+_CREATE_CHECKPOINTS = f"""
+    INSERT INTO stock_balance_checkpoints (item_id, branch_id, last_movement_id, last_movement_at, balance)
+    SELECT inv.item_id, inv.branch_id, MAX(sm.movement_id), MAX(sm.created_at),
+           COALESCE(cp.balance, 0) + SUM({SIGNED_QUANTITY})
+    FROM inventory inv
+    LEFT JOIN stock_balance_checkpoints cp ON {LATEST_CHECKPOINT}
+    JOIN stock_movements sm ON {AFTER_CHECKPOINT}
+        AND sm.created_at < NOW() - INTERVAL %s SECOND
+    WHERE inv.branch_id = %s AND (%s IS NULL OR inv.item_id = %s)
+    GROUP BY inv.item_id, inv.branch_id, cp.balance
+"""
+
+_RECONCILE = f"""
+    UPDATE inventory inv
+    LEFT JOIN stock_balance_checkpoints cp ON {LATEST_CHECKPOINT}
+    SET inv.current_stock = COALESCE(cp.balance, 0) + (
+        SELECT COALESCE(SUM({SIGNED_QUANTITY}), 0)
+        FROM stock_movements sm
+        WHERE {AFTER_CHECKPOINT}
+    )
+    WHERE inv.item_id = %s AND inv.branch_id = %s
+"""
+
+_worker = None
+_stop = threading.Event()
+
+
+def after_checkpoint_params():
+    # Parameters of AFTER_CHECKPOINT
+    return (config.CHECKPOINT_SETTLE_SECONDS, MOVEMENT_MIN_DATE)
+
+
+def create_checkpoints(connection, branch_id=None, item_id=None):
+    """Checkpoint every pair with settled movements since its last checkpoint.
+
+    Runs one committed READ COMMITTED transaction per branch, so the
+    INSERT ... SELECT doesn't hold locks on stock_movements across the whole
+    table. Returns the number of checkpoints written.
+    """
+    cursor = connection.cursor()
+    if branch_id is None:
+        cursor.execute("SELECT branch_id FROM branches ORDER BY branch_id")
+        branch_ids = [row[0] for row in cursor.fetchall()]
+    else:
+        branch_ids = [branch_id]
+    if connection.in_transaction:
+        connection.commit()  # start_transaction() refuses to nest
+    written = 0
+    for current in branch_ids:
+        connection.start_transaction(isolation_level="READ COMMITTED")
+        cursor.execute(_CREATE_CHECKPOINTS, (
+            *after_checkpoint_params(), config.CHECKPOINT_SETTLE_SECONDS,
+            current, item_id, item_id,
+        ))
+        written += cursor.rowcount
+        connection.commit()
+    return written
+
+
+def reconcile(connection, item_id, branch_id):
+    """Reset a pair's current_stock to its ledger balance; returns rows updated. Doesn't commit."""
+    cursor = connection.cursor()
+    cursor.execute(_RECONCILE, (*after_checkpoint_params(), item_id, branch_id))
+    return cursor.rowcount
+
+
+def run_checkpoints():
+    """One create_checkpoints() pass on its own connection; logs instead of raising."""
+    try:
+        connection = get_pool().connect()
+    except (PoolTimeoutError, mysql.connector.Error) as err:
+        logger.warning("Skipped balance checkpoints, database unavailable: %s", err)
+        return None
+    try:
+        connection.route = "balance-checkpoints"
+        written = create_checkpoints(connection)
+        logger.info("Wrote %d balance checkpoints", written)
+        return written
+    except mysql.connector.Error as err:
+        logger.warning("Balance checkpoints failed: %s", err)
+    finally:
+        connection.close()
+    return None
+
+
+def start_checkpoints():
+    """Write checkpoints every CHECKPOINT_INTERVAL seconds (0 disables)."""
+    global _worker
+    if config.CHECKPOINT_INTERVAL <= 0 or (_worker is not None and _worker.is_alive()):
+        return
+    _stop.clear()
+    _worker = threading.Thread(target=_checkpoint_loop, name="balance-checkpoints", daemon=True)
+    _worker.start()
+
+
+def _checkpoint_loop():
+    while not _stop.wait(config.CHECKPOINT_INTERVAL):
+        run_checkpoints()
+
+
+def stop_checkpoints():
+    _stop.set()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 2 or sys.argv[1] != "checkpoint":
+        sys.exit("usage: python -m app.ledger checkpoint [branch_id]")
+    connection = get_pool().connect()
+    try:
+        branch = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        print(f"Wrote {create_checkpoints(connection, branch)} balance checkpoints")
+    finally:
+        connection.close()
+        close_pool()
@@ -1,4 +1,15 @@
-from fastapi import FastAPI
+import time
+from contextlib import asynccontextmanager
+from anyio import to_thread
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from mysql.connector import Error
+from app import config, ledger, metrics, migrations, partitions, snapshots, stock_matrix
+from app.retry import RETRYABLE_ERRNOS
+from app.stock import InsufficientStockError
+from app.database import init_pool, close_pool, check_insert_ids_on_startup, replicas_enabled, pool_status, LAST_WRITE_COOKIE
+from app.admission import admit_db, admit_report, admission_status
+from app.auth.auth import verify_token
 # from app.routers import airlines,aircraft_types,countries,cities,airports,routes,flights,flight_schedules,flight_prices,users,passenger_profiles,bookings,booking_items,payment_transactions,user_searches,reviews,promotions,user_sessions
 from app.routers import roles
 from app.routers import branches
@@ -17,26 +28,134 @@ from app.routers import utility_query
 from app.routers import stock_discrepancy
 from app.routers import batch_operation
 from app.routers import additionals_reporting
+from app.routers import monitoring
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the connection pool on startup and drain it on shutdown
+    init_pool()
+    if config.MIGRATIONS_CHECK_ON_STARTUP:
+        migrations.check_on_startup()
+    check_insert_ids_on_startup()
+    partitions.start_maintenance()
+    ledger.start_checkpoints()
+    snapshots.start_snapshots()
+    stock_matrix.start()
+    # Route handlers are plain `def` functions, so FastAPI runs them in this
+    # thread pool instead of on the event loop; size it to the DB pool.
+    to_thread.current_default_thread_limiter().total_tokens = config.DB_EXECUTOR_THREADS
+    yield
+    partitions.stop_maintenance()
+    ledger.stop_checkpoints()
+    snapshots.stop_snapshots()
+    stock_matrix.stop()
+    close_pool()
+
 app = FastAPI(
     title="Nrtc API",
     description="API NRTC",
-    version="v0"
+    version="v0",
+    lifespan=lifespan
 )
+
+
+# Database errors from any handler surface as a 500 (connection is rolled back by get_db);
+# lock contention that outlasted app/retry.py is a 503 the client may retry
+@app.exception_handler(Error)
+async def database_error_handler(request: Request, exc: Error):
+    if exc.errno in RETRYABLE_ERRNOS:
+        return JSONResponse(status_code=503, content={"detail": f"Database busy: {exc}"}, headers={"Retry-After": "1"})
+    return JSONResponse(status_code=500, content={"detail": f"Database error: {exc}"})
+
+
+# A stock movement would go below zero; nothing of the document was written
+@app.exception_handler(InsufficientStockError)
+async def insufficient_stock_handler(request: Request, exc: InsufficientStockError):
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
+
+
+# Report how many SQL statements the request ran
+@app.middleware("http")
+async def query_count_header(request: Request, call_next):
+    response = await call_next(request)
+    connection = getattr(request.state, "db_connection", None)
+    if connection is not None:
+        response.headers["X-DB-Query-Count"] = str(connection.query_count)
+    return response
+
+
+def _read_after_write_window():
+    # How long a write has to be remembered: until replicas catch up, and until
+    # the stock matrix has refreshed past it (it is never served staler than that)
+    windows = []
+    if replicas_enabled():
+        windows.append(config.DB_READ_AFTER_WRITE_WINDOW)
+    if config.STOCK_MATRIX_ENABLED:
+        windows.append(config.STOCK_MATRIX_MAX_STALENESS)
+    return max(windows, default=0)
+
+
+# After a successful write, keep this client's reads off replicas and the stock
+# matrix until they have caught up with it
+@app.middleware("http")
+async def read_after_write_cookie(request: Request, call_next):
+    response = await call_next(request)
+    window = _read_after_write_window()
+    if window > 0 and request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        response.set_cookie(
+            LAST_WRITE_COOKIE,
+            str(time.time()),
+            max_age=int(window) + 1,
+            httponly=True,
+        )
+    return response
+
+
+# Per-route latency, status and response size for Prometheus (outermost, so it times everything above)
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status_code = 500  # unless a response comes back
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        size = response.headers.get("content-length")
+        if size is not None:
+            metrics.HTTP_RESPONSE_BYTES.labels(request.method, metrics.route_label(request)).observe(int(size))
+        return response
+    finally:
+        route = metrics.route_label(request)
+        metrics.HTTP_REQUEST_SECONDS.labels(request.method, route).observe(time.perf_counter() - started)
+        metrics.HTTP_REQUESTS.labels(request.method, route, str(status_code)).inc()
+
+
+metrics.register_status_collector(pool_status, admission_status)
+
+
+# Prometheus scrape endpoint; pool and admission gauges are read at scrape time
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(verify_token)])
+async def get_metrics():
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
 # app.include_router(airlines.router)
-app.include_router(roles.router)
-app.include_router(branches.router)
-app.include_router(categories.router)
-app.include_router(users.router)
-app.include_router(item.router)
-app.include_router(inventory.router)
-app.include_router(stock_movement.router)
-app.include_router(transfer_requests.router)
-app.include_router(dispatch_slip.router)
-app.include_router(receiving_slips.router)
-app.include_router(reports.router)
-app.include_router(dashboard_activity.router)
-app.include_router(filter_query.router)
-app.include_router(utility_query.router)
-app.include_router(stock_discrepancy.router)
-app.include_router(batch_operation.router)
-app.include_router(additionals_reporting.router)
\ No newline at end of file
+# Every DB-backed router goes through admission control; report routers have their own lower limit
+app.include_router(roles.router, dependencies=[Depends(admit_db)])
+app.include_router(branches.router, dependencies=[Depends(admit_db)])
+app.include_router(categories.router, dependencies=[Depends(admit_db)])
+app.include_router(users.router, dependencies=[Depends(admit_db)])
+app.include_router(item.router, dependencies=[Depends(admit_db)])
+app.include_router(inventory.router, dependencies=[Depends(admit_db)])
+app.include_router(stock_movement.router, dependencies=[Depends(admit_db)])
+app.include_router(transfer_requests.router, dependencies=[Depends(admit_db)])
+app.include_router(dispatch_slip.router, dependencies=[Depends(admit_db)])
+app.include_router(receiving_slips.router, dependencies=[Depends(admit_db)])
+app.include_router(reports.router, dependencies=[Depends(admit_report)])
+app.include_router(dashboard_activity.router, dependencies=[Depends(admit_report)])
+app.include_router(filter_query.router, dependencies=[Depends(admit_db)])
+app.include_router(utility_query.router, dependencies=[Depends(admit_db)])
+app.include_router(stock_discrepancy.router, dependencies=[Depends(admit_db)])
+app.include_router(batch_operation.router, dependencies=[Depends(admit_db)])
+app.include_router(additionals_reporting.router, dependencies=[Depends(admit_report)])
+app.include_router(monitoring.router)
\ No newline at end of file
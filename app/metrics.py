@@ -0,0 +1,133 @@
+import re
+from functools import lru_cache
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Label used for requests that did not match any route, so stray paths can't blow up cardinality
+UNMATCHED_ROUTE = "unmatched"
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route and status code",
+    ["method", "route", "status"],
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+HTTP_RESPONSE_BYTES = Histogram(
+    "http_response_size_bytes", "Serialized response body size by route",
+    ["method", "route"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216),
+)
+
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "SQL statement latency by route and statement",
+    ["route", "statement"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+DB_ROWS = Counter(
+    "db_rows_returned_total", "Rows fetched by route and statement",
+    ["route", "statement"],
+)
+DB_ERRORS = Counter(
+    "db_query_errors_total", "SQL statements that raised, by route and statement",
+    ["route", "statement"],
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a pooled connection",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+DB_RETRIES = Counter(
+    "db_transaction_retries_total", "Units of work re-run after a deadlock or lock wait timeout",
+    ["route", "errno"],
+)
+DB_RETRIES_EXHAUSTED = Counter(
+    "db_transaction_retries_exhausted_total", "Units of work that still failed after DB_RETRY_ATTEMPTS retries",
+    ["route"],
+)
+IDEMPOTENT_REPLAYS = Counter(
+    "idempotent_replays_total", "Requests answered from a stored Idempotency-Key response",
+    ["route"],
+)
+STOCK_RESERVATIONS = Counter(
+    "stock_reservations_total", "Reserve and release calls by outcome",
+    ["operation", "outcome"],
+)
+STOCK_RESERVATION_UNITS = Counter(
+    "stock_reservation_units_total", "Units reserved or released",
+    ["operation"],
+)
+STOCK_RESERVATION_LOCK_SECONDS = Histogram(
+    "stock_reservation_lock_seconds", "Time a reserve/release spent locking its inventory rows",
+    ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 50),
+)
+
+_VERB = re.compile(r"^\s*(\w+)")
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE)\s+`?(\w+)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def statement_label(operation):
+    """Low-cardinality label for ad-hoc SQL: the verb and the first table it touches."""
+    if isinstance(operation, (bytes, bytearray)):
+        operation = operation.decode("utf-8", "replace")
+    verb = _VERB.match(operation)
+    table = _TABLE.search(operation)
+    label = verb.group(1).upper() if verb else "UNKNOWN"
+    if table:
+        label += " " + table.group(1).lower()
+    return label
+
+
+class _StatusCollector:
+    """Exports the pool and admission snapshots as gauges at scrape time."""
+
+    def __init__(self, pool_status, admission_status):
+        self._pool_status = pool_status
+        self._admission_status = admission_status
+
+    def collect(self):
+        connections = GaugeMetricFamily("db_pool_connections", "Pooled connections by state", labels=["pool", "state"])
+        timeouts = CounterMetricFamily("db_pool_timeouts", "Checkouts that timed out waiting for a connection", labels=["pool"])
+        status = self._pool_status()
+        for pool in [status["primary"], status["aux"], status["reconcile"]] + status["replicas"]:
+            for state in ("open", "idle", "checked_out"):
+                connections.add_metric([pool["pool"], state], pool[state])
+            timeouts.add_metric([pool["pool"]], pool["timeouts"])
+        yield connections
+        yield timeouts
+
+        in_flight = GaugeMetricFamily("admission_in_flight", "Requests holding an admission slot", labels=["gate"])
+        queued = GaugeMetricFamily("admission_queue_depth", "Requests waiting for an admission slot", labels=["gate"])
+        rejected = CounterMetricFamily("admission_rejected", "Requests shed with a 503", labels=["gate"])
+        for gate in self._admission_status():
+            in_flight.add_metric([gate["gate"]], gate["in_flight"])
+            queued.add_metric([gate["gate"]], gate["queue_depth"])
+            rejected.add_metric([gate["gate"]], gate["rejected"])
+        yield in_flight
+        yield queued
+        yield rejected
+
+
+_status_collector = None
+
+
+def register_status_collector(pool_status, admission_status):
+    global _status_collector
+    if _status_collector is None:
+        _status_collector = _StatusCollector(pool_status, admission_status)
+        REGISTRY.register(_status_collector)
+
+
+def route_label(request):
+    route = request.scope.get("route")
+    return getattr(route, "path", UNMATCHED_ROUTE)
+
+
+def render():
+    return generate_latest(), CONTENT_TYPE_LATEST
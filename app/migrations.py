@@ -0,0 +1,219 @@
+"""Versioned schema migrations.
+
+Each file in migrations/ (NNNN_description.sql) is applied once, in order, and
+recorded in schema_migrations. DDL is written to run online (ALGORITHM=INPLACE,
+LOCK=NONE), and lock_wait_timeout is kept short so a migration waiting on a
+metadata lock gives up instead of stalling live traffic behind it. A
+migration that can't run online starts with an `-- offline` line; it is only
+applied from the command line, never by MIGRATIONS_AUTO_APPLY at startup.
+
+    python -m app.migrations status
+    python -m app.migrations apply
+"""
+import hashlib
+import logging
+import re
+import sys
+from pathlib import Path
+
+import mysql.connector
+
+from app import config
+from app.database import PoolTimeoutError, close_pool, get_pool, lock_wait_timeout
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(config.MIGRATIONS_DIR)
+
+# Errors that mean a statement already took effect (re-running a partly applied migration)
+_ALREADY_APPLIED = {
+    1050,  # ER_TABLE_EXISTS_ERROR
+    1060,  # ER_DUP_FIELDNAME
+    1061,  # ER_DUP_KEYNAME
+    1091,  # ER_CANT_DROP_FIELD_OR_KEY
+}
+
+_ALTER_TABLE = re.compile(r"ALTER\s+TABLE\s+`?(\w+)`?", re.IGNORECASE)
+_ADD_INDEX = re.compile(r"ADD\s+(?:UNIQUE\s+)?(?:INDEX|KEY)\s+`?(\w+)`?", re.IGNORECASE)
+_DROP_INDEX = re.compile(r"DROP\s+(?:INDEX|KEY)\s+`?(\w+)`?", re.IGNORECASE)
+_OFFLINE = re.compile(r"^--\s*offline\s*$", re.MULTILINE)
+
+
+class MigrationError(Exception):
+    pass
+
+
+def _files():
+    return sorted(MIGRATIONS_DIR.glob("[0-9]*.sql"))
+
+
+def _checksum(path):
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def _offline(path):
+    return bool(_OFFLINE.search(path.read_text()))
+
+
+def _statements(sql):
+    # One statement per `;` at end of line; `--` comment lines are dropped
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    return [statement.strip() for statement in re.split(r";\s*$", "\n".join(lines), flags=re.MULTILINE) if statement.strip()]
+
+
+def _ensure_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR(255) NOT NULL PRIMARY KEY,
+            checksum CHAR(64) NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _applied(cursor):
+    cursor.execute("SELECT version, checksum FROM schema_migrations")
+    return {version: checksum for version, checksum in cursor.fetchall()}
+
+
+def _table_exists(cursor):
+    cursor.execute(
+        "SELECT 1 FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'schema_migrations'",
+        (config.DB_NAME,),
+    )
+    return cursor.fetchone() is not None
+
+
+def expected_indexes():
+    """{table: {index, ...}} that the migrations leave in place."""
+    indexes = {}
+    for path in _files():
+        for statement in _statements(path.read_text()):
+            table = _ALTER_TABLE.search(statement)
+            if not table:
+                continue
+            names = indexes.setdefault(table.group(1), set())
+            names.update(_ADD_INDEX.findall(statement))
+            names.difference_update(_DROP_INDEX.findall(statement))
+    return indexes
+
+
+def status(connection):
+    """Applied/pending state of every migration file; reads only, so it can run on a replica.
+
+    Before the first apply() there is no schema_migrations table and
+    everything is pending.
+    """
+    cursor = connection.cursor()
+    applied = _applied(cursor) if _table_exists(cursor) else {}
+    result = []
+    for path in _files():
+        result.append({
+            "version": path.stem,
+            "applied": path.stem in applied,
+            "modified_since_applied": path.stem in applied and applied[path.stem] != _checksum(path),
+            "offline": _offline(path),
+        })
+    return result
+
+
+def apply(connection, offline=True):
+    """Apply every pending migration in order; returns the versions applied.
+
+    With offline=False it stops before the first pending offline migration,
+    since the ones after it may depend on it.
+    """
+    cursor = connection.cursor()
+    _ensure_table(cursor)
+    applied = _applied(cursor)
+    done = []
+    with lock_wait_timeout(connection, config.MIGRATION_LOCK_WAIT_TIMEOUT):
+        for path in _files():
+            if path.stem in applied:
+                continue
+            if not offline and _offline(path):
+                logger.warning(
+                    "Migration %s must run in a maintenance window; apply it with `python -m app.migrations apply`",
+                    path.stem,
+                )
+                break
+            for statement in _statements(path.read_text()):
+                try:
+                    cursor.execute(statement)
+                except mysql.connector.Error as err:
+                    if err.errno in _ALREADY_APPLIED:
+                        logger.info("Migration %s: skipping, already in place: %s", path.stem, err.msg)
+                        continue
+                    raise MigrationError(f"Migration {path.stem} failed: {err}") from err
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, checksum) VALUES (%s, %s)",
+                (path.stem, _checksum(path)),
+            )
+            connection.commit()
+            logger.info("Applied migration %s", path.stem)
+            done.append(path.stem)
+    return done
+
+
+def missing_indexes(connection):
+    """Indexes the migrations declare that the live schema doesn't have, as ["table.index", ...]."""
+    expected = expected_indexes()
+    if not expected:
+        return []
+    cursor = connection.cursor()
+    cursor.execute(
+        "SELECT DISTINCT TABLE_NAME, INDEX_NAME FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = %s",
+        (config.DB_NAME,),
+    )
+    present = {(table, index) for table, index in cursor.fetchall()}
+    return sorted(
+        f"{table}.{index}"
+        for table, indexes in expected.items()
+        for index in indexes
+        if (table, index) not in present
+    )
+
+
+def check_on_startup():
+    """Apply pending migrations if configured to, then warn (or fail) on missing indexes.
+
+    An unreachable database only logs a warning unless MIGRATIONS_REQUIRE_INDEXES
+    is set; the pool connects lazily and the app can start before MySQL does.
+    """
+    try:
+        connection = get_pool().connect()
+    except (PoolTimeoutError, mysql.connector.Error) as err:
+        if config.MIGRATIONS_REQUIRE_INDEXES:
+            raise
+        logger.warning("Skipped schema index check, database unavailable: %s", err)
+        return None
+    try:
+        if config.MIGRATIONS_AUTO_APPLY:
+            apply(connection, offline=False)
+        missing = missing_indexes(connection)
+    finally:
+        connection.close()
+    if missing:
+        message = f"Missing indexes, run `python -m app.migrations apply`: {', '.join(missing)}"
+        if config.MIGRATIONS_REQUIRE_INDEXES:
+            raise MigrationError(message)
+        logger.warning(message)
+    return missing
+
+
+if __name__ == "__main__":
+    import json
+
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    connection = get_pool().connect()
+    try:
+        if command == "apply":
+            print(json.dumps({"applied": apply(connection), "missing_indexes": missing_indexes(connection)}, indent=2))
+        elif command == "status":
+            print(json.dumps({"migrations": status(connection), "missing_indexes": missing_indexes(connection)}, indent=2))
+        else:
+            sys.exit("usage: python -m app.migrations [status|apply]")
+    finally:
+        connection.close()
+        close_pool()
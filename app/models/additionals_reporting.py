@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import Optional, List
 from datetime import date, datetime
 from enum import Enum
@@ -12,6 +12,47 @@ class BranchItemPair(BaseModel):
     branch_id: int = Field(..., gt=0)
     item_id: int = Field(..., gt=0)
 
+class BalanceCheckpointScope(BaseModel):
+    branch_id: Optional[int] = Field(None, gt=0, description="Only this branch (default: all)")
+    item_id: Optional[int] = Field(None, gt=0, description="Only this item (default: all)")
+
+class BalanceCheckpointResult(BaseModel):
+    checkpoints_written: int
+
+class ReconciliationScope(BaseModel):
+    branch_id: Optional[int] = Field(None, gt=0, description="Only this branch")
+    category_id: Optional[int] = Field(None, gt=0, description="Only items in this category")
+    dry_run: bool = Field(True, description="Report differences without changing inventory")
+    updated_by: Optional[int] = Field(None, gt=0, description="User recorded on corrected rows; required unless dry_run")
+
+    @model_validator(mode='after')
+    def require_user_for_writes(self):
+        if not self.dry_run and self.updated_by is None:
+            raise ValueError("updated_by is required unless dry_run is set")
+        return self
+
+class ReconciliationDiff(BaseModel):
+    item_id: int
+    branch_id: int
+    current_stock: int
+    ledger_stock: int
+    difference: int
+
+class ReconciliationJob(BaseModel):
+    job_id: str
+    status: str
+    branch_id: Optional[int] = None
+    category_id: Optional[int] = None
+    dry_run: bool
+    started_at: float
+    finished_at: Optional[float] = None
+    rows_total: int
+    rows_checked: int
+    chunks_total: int
+    chunks_done: int
+    diff: List[ReconciliationDiff]
+    error: Optional[str] = None
+
 # Reporting Models
 class MonthlyStockMovement(BaseModel):
     year: int
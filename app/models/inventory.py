@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, Literal
+from pydantic import BaseModel, Field
+from typing import List, Optional, Literal
 from datetime import datetime
 from enum import Enum
 
@@ -30,13 +30,20 @@ class BranchStockResponse(BaseModel):
     current_stock: int
     reserved_stock: int
     available_stock: int
-    minimum_stock_level: int
+    minimum_stock_level: Optional[int] = None
     stock_status: StockStatus
     last_updated: Optional[datetime] = None  # Made this field optional
 
     class Config:
         from_attributes = True
 
+class BranchStockAsOf(BaseModel):
+    item_id: int
+    item_name: str
+    item_code: str
+    category_name: str
+    stock: int
+
 class ItemStockResponse(BaseModel):
     item_name: str
     item_code: str
@@ -63,7 +70,7 @@ class LowStockItem(BaseModel):
 class OutOfStockItem(BaseModel):
     item_name: str
     item_code: str
-    minimum_stock_level: int
+    minimum_stock_level: Optional[int] = None
 
 class StockAdjustment(BaseModel):
     item_id: int
@@ -78,4 +85,17 @@ class StockAdjustment(BaseModel):
 class StockReservation(BaseModel):
     item_id: int
     branch_id: int
-    quantity: int
\ No newline at end of file
+    quantity: int = Field(..., gt=0)
+
+class StockReservationBatch(BaseModel):
+    lines: List[StockReservation] = Field(..., min_length=1, max_length=500)
+
+class ReservationLevel(BaseModel):
+    item_id: int
+    branch_id: int
+    reserved_stock: int
+    available_stock: int
+
+class ReservationResponse(BaseModel):
+    message: str
+    levels: List[ReservationLevel]
\ No newline at end of file
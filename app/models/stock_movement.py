@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, Literal
+from pydantic import BaseModel, Field, field_validator
+from typing import Any, Dict, List, Optional, Literal, Union
 from datetime import datetime
 from enum import Enum
 
@@ -16,7 +16,7 @@ class ReferenceType(str, Enum):
     TRANSFER = "TRANSFER"
     ADJUSTMENT = "ADJUSTMENT"
     INITIAL = "INITIAL"
-    # Add empty string as a special case if needed
+    # Only for reading: stock_movements.reference_type can't store it, so creates reject it
     EMPTY = ""
 
 class StockMovementBase(BaseModel):
@@ -32,7 +32,30 @@ class StockMovementBase(BaseModel):
     created_by: int
 
 class StockMovementCreate(StockMovementBase):
-    pass
+    @field_validator('reference_type')
+    @classmethod
+    def reference_type_required(cls, value):
+        if value == ReferenceType.EMPTY:
+            raise ValueError("required")
+        return value
+
+class StockMovementBulkCreate(BaseModel):
+    # Rows are validated one by one against StockMovementCreate so a bad row is
+    # reported in the results instead of rejecting the whole batch; the Dict
+    # arm lets invalid rows through to that check, and the model arm documents
+    # the row shape in the OpenAPI schema
+    movements: List[Union[StockMovementCreate, Dict[str, Any]]] = Field(..., min_length=1, description="StockMovementCreate objects")
+    all_or_nothing: bool = Field(False, description="Insert nothing if any row is invalid")
+
+class StockMovementBulkRow(BaseModel):
+    index: int
+    movement_id: Optional[int] = None
+    error: Optional[str] = None
+
+class StockMovementBulkResponse(BaseModel):
+    inserted: int
+    failed: int
+    results: List[StockMovementBulkRow]
 
 class StockMovementResponse(StockMovementBase):
     movement_id: int
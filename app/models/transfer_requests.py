@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 from enum import Enum
@@ -31,6 +31,20 @@ class TransferRequestItem(BaseModel):
     requested_quantity: int
     notes: Optional[str] = None
 
+class TransferRequestBulkEntry(TransferRequestCreate):
+    items: List[TransferRequestItem] = Field(..., min_length=1)
+
+class TransferRequestBulkCreate(BaseModel):
+    transfers: List[TransferRequestBulkEntry] = Field(..., min_length=1)
+
+class CreatedTransferRequest(BaseModel):
+    transfer_id: int
+    transfer_number: str
+
+class TransferRequestBulkResponse(BaseModel):
+    created: int
+    transfers: List[CreatedTransferRequest]
+
 class TransferRequestUpdate(BaseModel):
     status: Optional[TransferStatus] = None
     rejection_reason: Optional[str] = None
@@ -1,5 +1,5 @@
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import date, datetime
 from typing import Optional
@@ -18,4 +18,24 @@ class SystemStatisticsResponse(BaseModel):
     total_users: int
     total_items: int
     pending_transfers: int
-    total_stock_units: int
\ No newline at end of file
+    total_stock_units: int
+
+class AvailabilityCheckLine(BaseModel):
+    item_id: int = Field(..., gt=0, description="ID of the item to check")
+    branch_id: int = Field(..., gt=0, description="ID of the branch to check")
+    required_quantity: int = Field(..., gt=0, description="Quantity needed for transfer")
+
+class BatchAvailabilityRequest(BaseModel):
+    lines: List[AvailabilityCheckLine] = Field(..., min_length=1, max_length=500)
+
+class AvailabilityCheckResult(BaseModel):
+    item_id: int
+    branch_id: int
+    required_quantity: int
+    item_name: str
+    item_code: str
+    available_stock: int
+    availability_status: str
+    alternate_branch_id: Optional[int] = None
+    alternate_branch_name: Optional[str] = None
+    alternate_available_stock: Optional[int] = None
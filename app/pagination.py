@@ -0,0 +1,56 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from fastapi import HTTPException, Response, status
+
+from app.dimensions import enrich_movements
+from app.queries import run_query
+
+# Response header carrying the opaque token for the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(created_at, movement_id):
+    payload = json.dumps([created_at.isoformat(), movement_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Return (created_at, movement_id) from a next-page token, or raise 400."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        created_at, movement_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(movement_id)
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid pagination cursor")
+
+
+def cursor_params(token):
+    # Parameters for queries.MOVEMENT_AFTER
+    created_at, movement_id = decode_cursor(token)
+    return created_at, created_at, movement_id
+
+
+def page(rows, limit, response: Response):
+    """Trim a limit+1 fetch to `limit` rows and set the next-page header if there are more."""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last["created_at"], last["movement_id"])
+    return rows
+
+
+def movement_page(connection, name, params, limit, cursor, response: Response, first_page_params=()):
+    """Run a paginated movement listing from the query registry.
+
+    `name` is used for the first page and `name + ".after"` once a cursor is given.
+    One extra row is fetched to tell whether another page exists. Rows come
+    back with item, branch and user names filled in.
+    """
+    if cursor:
+        rows = run_query(connection, name + ".after", (*params, *cursor_params(cursor), limit + 1))
+    else:
+        rows = run_query(connection, name, (*params, limit + 1, *first_page_params))
+    return enrich_movements(page(rows, limit, response), connection)
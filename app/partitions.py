@@ -0,0 +1,219 @@
+"""Monthly partitions of stock_movements (see migrations/0003).
+
+Partition pYYYYMM holds that month's movements; p_history holds everything
+before the first monthly partition and p_future (MAXVALUE) is kept empty by
+splitting it into the next PARTITION_MONTHS_AHEAD months before any row can
+land there, so the split never has to move data.
+
+Old months are archived with EXCHANGE PARTITION, which swaps the partition's
+tablespace with an empty table instead of deleting rows one by one.
+
+    python -m app.partitions status
+    python -m app.partitions ensure
+    python -m app.partitions archive p202401
+"""
+import logging
+import re
+import sys
+import threading
+from datetime import date
+
+import mysql.connector
+
+from app import config
+from app.database import PoolTimeoutError, close_pool, get_pool, lock_wait_timeout
+
+logger = logging.getLogger(__name__)
+
+TABLE = "stock_movements"
+HISTORY = "p_history"
+FUTURE = "p_future"
+
+_MONTHLY = re.compile(r"^p(\d{4})(\d{2})$")
+
+# Named lock held for a maintenance pass, so only one worker splits p_future at a time
+_LOCK_NAME = "partition_maintenance"
+
+_worker = None
+_stop = threading.Event()
+
+
+class PartitionError(Exception):
+    pass
+
+
+def _month_start(value, offset=0):
+    month = value.year * 12 + value.month - 1 + offset
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def _name(month):
+    return f"p{month.year:04d}{month.month:02d}"
+
+
+def partitions(connection):
+    """[{"name", "month", "rows", "ends"}] in order; empty if the table isn't partitioned.
+
+    "ends" is the partition's exclusive upper bound as a date, None for MAXVALUE.
+    """
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT PARTITION_NAME, TABLE_ROWS,
+               IF(PARTITION_DESCRIPTION = 'MAXVALUE', NULL, DATE(FROM_UNIXTIME(PARTITION_DESCRIPTION)))
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """, (config.DB_NAME, TABLE))
+    result = []
+    for name, rows, ends in cursor.fetchall():
+        match = _MONTHLY.match(name)
+        result.append({
+            "name": name,
+            "month": f"{match.group(1)}-{match.group(2)}" if match else None,
+            "rows": rows,  # InnoDB estimate
+            "ends": ends,
+        })
+    return result
+
+
+def ensure_future(connection, months_ahead=None):
+    """Split p_future so monthly partitions exist through `months_ahead` months from now.
+
+    Returns the partitions created. The table has to be partitioned already.
+    """
+    if months_ahead is None:
+        months_ahead = config.PARTITION_MONTHS_AHEAD
+    existing = partitions(connection)
+    names = [partition["name"] for partition in existing]
+    if not names:
+        raise PartitionError(f"{TABLE} is not partitioned; apply migration 0003 first")
+    if FUTURE not in names:
+        raise PartitionError(f"{TABLE} has no {FUTURE} partition to split")
+
+    # New months start where the last bounded partition (p_history or a pYYYYMM) ends
+    bounded = [partition["ends"] for partition in existing if partition["ends"]]
+    if not bounded:
+        raise PartitionError(f"{TABLE} has no bounded partition before {FUTURE}")
+    first = _month_start(bounded[-1]) if bounded[-1].day == 1 else _month_start(bounded[-1], 1)
+    last = _month_start(date.today(), months_ahead)
+
+    created = []
+    month = first
+    while month <= last:
+        created.append((_name(month), _month_start(month, 1)))
+        month = _month_start(month, 1)
+    if not created:
+        return []
+
+    definitions = ",\n".join(
+        f"PARTITION `{name}` VALUES LESS THAN (UNIX_TIMESTAMP('{end.isoformat()} 00:00:00'))"
+        for name, end in created
+    )
+    cursor = connection.cursor()
+    # Partition DDL takes a metadata lock; give up rather than queue live traffic behind it
+    with lock_wait_timeout(connection, config.MIGRATION_LOCK_WAIT_TIMEOUT):
+        cursor.execute(
+            f"ALTER TABLE `{TABLE}` REORGANIZE PARTITION `{FUTURE}` INTO (\n{definitions},\n"
+            f"PARTITION `{FUTURE}` VALUES LESS THAN MAXVALUE)"
+        )
+    logger.info("Created %s partitions: %s", TABLE, ", ".join(name for name, _ in created))
+    return [name for name, _ in created]
+
+
+def archive(connection, name):
+    """Move a past month's partition into its own table, stock_movements_<name>.
+
+    EXCHANGE PARTITION swaps tablespaces, so this costs the same for ten rows
+    or ten million. The emptied partition is then dropped. The current month,
+    future months and p_future can't be archived.
+    """
+    match = _MONTHLY.match(name)
+    if name != HISTORY and not match:
+        raise PartitionError(f"Not an archivable partition: {name}")
+    if match and date(int(match.group(1)), int(match.group(2)), 1) >= _month_start(date.today()):
+        raise PartitionError(f"Partition {name} is not in the past")
+    if name not in [partition["name"] for partition in partitions(connection)]:
+        raise PartitionError(f"No partition {name} on {TABLE}")
+
+    archive_table = f"{TABLE}_{name}"
+    cursor = connection.cursor()
+    with lock_wait_timeout(connection, config.MIGRATION_LOCK_WAIT_TIMEOUT):
+        cursor.execute(f"CREATE TABLE `{archive_table}` LIKE `{TABLE}`")
+        cursor.execute(f"ALTER TABLE `{archive_table}` REMOVE PARTITIONING")
+        cursor.execute(f"ALTER TABLE `{TABLE}` EXCHANGE PARTITION `{name}` WITH TABLE `{archive_table}`")
+        cursor.execute(f"ALTER TABLE `{TABLE}` DROP PARTITION `{name}`")
+    logger.info("Archived %s partition %s into %s", TABLE, name, archive_table)
+    return archive_table
+
+
+def run_maintenance():
+    """One ensure_future() pass on its own connection; logs instead of raising.
+
+    Every worker runs this loop; the pass is skipped while another one holds
+    the named lock.
+    """
+    try:
+        connection = get_pool().connect()
+    except (PoolTimeoutError, mysql.connector.Error) as err:
+        logger.warning("Skipped partition maintenance, database unavailable: %s", err)
+        return None
+    try:
+        connection.route = "partition-maintenance"
+        cursor = connection.cursor()
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (_LOCK_NAME,))
+        if cursor.fetchone()[0] != 1:
+            return None  # another worker is on it
+        try:
+            return ensure_future(connection)
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (_LOCK_NAME,))
+            cursor.fetchall()
+    except PartitionError as err:
+        logger.info("Skipped partition maintenance: %s", err)
+    except mysql.connector.Error as err:
+        logger.warning("Partition maintenance failed: %s", err)
+    finally:
+        connection.close()
+    return None
+
+
+def start_maintenance():
+    """Run maintenance now and then every PARTITION_MAINTENANCE_INTERVAL seconds (0 disables)."""
+    global _worker
+    if config.PARTITION_MAINTENANCE_INTERVAL <= 0 or (_worker is not None and _worker.is_alive()):
+        return
+    _stop.clear()
+    _worker = threading.Thread(target=_maintenance_loop, name="partition-maintenance", daemon=True)
+    _worker.start()
+
+
+def _maintenance_loop():
+    run_maintenance()
+    while not _stop.wait(config.PARTITION_MAINTENANCE_INTERVAL):
+        run_maintenance()
+
+
+def stop_maintenance():
+    _stop.set()
+
+
+if __name__ == "__main__":
+    import json
+
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    connection = get_pool().connect()
+    try:
+        if command == "status":
+            print(json.dumps(partitions(connection), indent=2, default=str))
+        elif command == "ensure":
+            print(json.dumps({"created": ensure_future(connection)}, indent=2))
+        elif command == "archive" and len(sys.argv) == 3:
+            print(json.dumps({"archived_to": archive(connection, sys.argv[2])}, indent=2))
+        else:
+            sys.exit("usage: python -m app.partitions [status|ensure|archive <partition>]")
+    except PartitionError as err:
+        sys.exit(str(err))
+    finally:
+        connection.close()
+        close_pool()
@@ -0,0 +1,420 @@
+import threading
+import time
+from datetime import datetime
+
+# Shared select list for stock movement reads. Item, branch and user names are
+# not joined in; callers add them with dimensions.enrich_movements().
+MOVEMENT_SELECT = """
+    SELECT sm.*
+    FROM stock_movements sm
+"""
+
+# Movement listings are keyset-paginated on (created_at, movement_id), newest first
+MOVEMENT_ORDER = """
+    ORDER BY sm.created_at DESC, sm.movement_id DESC
+    LIMIT %s
+"""
+MOVEMENT_AFTER = "sm.created_at <= %s AND (sm.created_at < %s OR sm.movement_id < %s)"
+
+
+def _movement_pages(where, offset=False):
+    # First page (optionally with a legacy OFFSET), and the page after a cursor
+    first_order = MOVEMENT_ORDER.replace("LIMIT %s", "LIMIT %s OFFSET %s") if offset else MOVEMENT_ORDER
+    return (
+        MOVEMENT_SELECT + f"    WHERE {where}" + first_order,
+        MOVEMENT_SELECT + f"    WHERE {where}\n      AND {MOVEMENT_AFTER}" + MOVEMENT_ORDER,
+    )
+
+
+# Shared select list for stock discrepancy reads
+DISCREPANCY_SELECT = """
+    SELECT
+        sd.*,
+        i.item_name, i.item_code,
+        b.branch_name,
+        u.full_name as reported_by_name,
+        COALESCE(sd.discrepancy_type, 'OTHER') as discrepancy_type
+    FROM stock_discrepancies sd
+    JOIN items i ON sd.item_id = i.item_id
+    JOIN branches b ON sd.branch_id = b.branch_id
+    JOIN users u ON sd.reported_by = u.user_id
+"""
+
+
+# Named queries. Each one is prepared once per pooled connection and then
+# executed over the binary protocol; timings are recorded under its name.
+QUERIES = {
+    # Stock movements
+    "stock_movement.by_id": MOVEMENT_SELECT + """
+    WHERE sm.movement_id = %s
+""",
+
+    # Filters
+    "filters.transfer_requests": """
+    SELECT tr.transfer_id, tr.transfer_number, tr.status, tr.priority,
+           fb.branch_name as from_branch, tb.branch_name as to_branch,
+           u.full_name as requested_by, tr.request_date
+    FROM transfer_requests tr
+    JOIN branches fb ON tr.from_branch_id = fb.branch_id
+    JOIN branches tb ON tr.to_branch_id = tb.branch_id
+    JOIN users u ON tr.requested_by = u.user_id
+    WHERE (%s IS NULL OR tr.status = %s)
+      AND (%s IS NULL OR tr.from_branch_id = %s)
+      AND (%s IS NULL OR tr.to_branch_id = %s)
+      AND (%s IS NULL OR tr.priority = %s)
+      AND (%s IS NULL OR tr.request_date >= %s)
+      AND (%s IS NULL OR tr.request_date <= %s)
+    ORDER BY tr.request_date DESC
+    LIMIT %s OFFSET %s
+""",
+
+    # Document details
+    "transfer_requests.by_id": """
+    SELECT tr.*, fb.branch_name as from_branch_name,
+           tb.branch_name as to_branch_name,
+           u1.full_name as requested_by_name,
+           u2.full_name as approved_by_name
+    FROM transfer_requests tr
+    JOIN branches fb ON tr.from_branch_id = fb.branch_id
+    JOIN branches tb ON tr.to_branch_id = tb.branch_id
+    JOIN users u1 ON tr.requested_by = u1.user_id
+    LEFT JOIN users u2 ON tr.approved_by = u2.user_id
+    WHERE tr.transfer_id = %s
+""",
+    "dispatch_slip.by_id": """
+    SELECT ds.*, tr.transfer_number,
+           fb.branch_name as from_branch, tb.branch_name as to_branch,
+           u.full_name as dispatched_by_name
+    FROM dispatch_slips ds
+    JOIN transfer_requests tr ON ds.transfer_id = tr.transfer_id
+    JOIN branches fb ON tr.from_branch_id = fb.branch_id
+    JOIN branches tb ON tr.to_branch_id = tb.branch_id
+    JOIN users u ON ds.dispatched_by = u.user_id
+    WHERE ds.dispatch_id = %s
+""",
+    "receiving_slips.by_id": """
+    SELECT rs.*, tr.transfer_number, ds.dispatch_number,
+           fb.branch_name as from_branch, tb.branch_name as to_branch,
+           u.full_name as received_by_name
+    FROM receiving_slips rs
+    JOIN transfer_requests tr ON rs.transfer_id = tr.transfer_id
+    JOIN dispatch_slips ds ON rs.dispatch_id = ds.dispatch_id
+    JOIN branches fb ON tr.from_branch_id = fb.branch_id
+    JOIN branches tb ON tr.to_branch_id = tb.branch_id
+    JOIN users u ON rs.received_by = u.user_id
+    WHERE rs.receiving_id = %s
+""",
+
+    # Document listings and lines
+    "transfer_requests.list": """
+    SELECT tr.transfer_id, tr.transfer_number,
+           fb.branch_name as from_branch, tb.branch_name as to_branch,
+           u.full_name as requested_by, tr.status, tr.priority,
+           tr.request_date, tr.approval_date,
+           COUNT(tri.request_item_id) as total_items
+    FROM transfer_requests tr
+    JOIN branches fb ON tr.from_branch_id = fb.branch_id
+    JOIN branches tb ON tr.to_branch_id = tb.branch_id
+    JOIN users u ON tr.requested_by = u.user_id
+    LEFT JOIN transfer_request_items tri ON tr.transfer_id = tri.transfer_id
+    GROUP BY tr.transfer_id
+    ORDER BY tr.request_date DESC
+    LIMIT %s OFFSET %s
+""",
+    "transfer_requests.pending": """
+    SELECT tr.transfer_id, tr.transfer_number,
+           fb.branch_name as from_branch,
+           tb.branch_name as to_branch,
+           u.full_name as requested_by,
+           tr.status, tr.priority, tr.request_date, tr.notes,
+           COUNT(tri.request_item_id) as total_items
+    FROM transfer_requests tr
+    JOIN branches fb ON tr.from_branch_id = fb.branch_id
+    JOIN branches tb ON tr.to_branch_id = tb.branch_id
+    JOIN users u ON tr.requested_by = u.user_id
+    LEFT JOIN transfer_request_items tri ON tr.transfer_id = tri.transfer_id
+    WHERE tr.from_branch_id = %s AND tr.status = 'PENDING'
+    GROUP BY tr.transfer_id
+    ORDER BY
+        CASE tr.priority
+            WHEN 'URGENT' THEN 1
+            WHEN 'HIGH' THEN 2
+            WHEN 'MEDIUM' THEN 3
+            WHEN 'LOW' THEN 4
+        END,
+        tr.request_date
+""",
+    "transfer_requests.items": """
+    SELECT tri.*, i.item_name, i.item_code, i.unit_of_measure,
+           COALESCE(inv.available_stock, 0) as available_stock
+    FROM transfer_request_items tri
+    JOIN items i ON tri.item_id = i.item_id
+    LEFT JOIN inventory inv ON i.item_id = inv.item_id
+        AND inv.branch_id = (SELECT from_branch_id FROM transfer_requests WHERE transfer_id = %s)
+    WHERE tri.transfer_id = %s
+""",
+    "dispatch_slip.list": """
+    SELECT ds.*, tr.transfer_number, tb.branch_name as to_branch,
+           u.full_name as dispatched_by_name
+    FROM dispatch_slips ds
+    JOIN transfer_requests tr ON ds.transfer_id = tr.transfer_id
+    JOIN branches tb ON tr.to_branch_id = tb.branch_id
+    JOIN users u ON ds.dispatched_by = u.user_id
+    ORDER BY ds.dispatch_date DESC
+""",
+    "dispatch_slip.items": """
+    SELECT tri.item_id, i.item_name, i.item_code,
+           tri.dispatched_quantity, i.unit_of_measure
+    FROM transfer_request_items tri
+    JOIN items i ON tri.item_id = i.item_id
+    JOIN dispatch_slips ds ON tri.transfer_id = ds.transfer_id
+    WHERE ds.dispatch_id = %s
+""",
+    "receiving_slips.list": """
+    SELECT rs.*, tr.transfer_number, fb.branch_name as from_branch,
+           u.full_name as received_by_name
+    FROM receiving_slips rs
+    JOIN transfer_requests tr ON rs.transfer_id = tr.transfer_id
+    JOIN branches fb ON tr.from_branch_id = fb.branch_id
+    JOIN users u ON rs.received_by = u.user_id
+    ORDER BY rs.receiving_date DESC
+""",
+    "receiving_slips.items": """
+    SELECT rsi.*, i.item_name, i.item_code, i.unit_of_measure
+    FROM receiving_slip_items rsi
+    JOIN items i ON rsi.item_id = i.item_id
+    WHERE rsi.receiving_id = %s
+""",
+    "stock_discrepancy.list": DISCREPANCY_SELECT + """
+    ORDER BY sd.reported_date DESC
+""",
+    "stock_discrepancy.pending": DISCREPANCY_SELECT + """
+    WHERE sd.status = 'REPORTED'
+    ORDER BY ABS(sd.difference) DESC
+""",
+
+    # Inventory (MySQL fallbacks of the stock matrix, and direct lookups)
+    "inventory.branch_stock": """
+    SELECT i.item_id, i.item_name, i.item_code, c.category_name,
+           COALESCE(inv.current_stock, 0) as current_stock,
+           COALESCE(inv.reserved_stock, 0) as reserved_stock,
+           COALESCE(inv.available_stock, 0) as available_stock,
+           i.minimum_stock_level,
+           CASE
+               WHEN COALESCE(inv.available_stock, 0) = 0 THEN 'OUT_OF_STOCK'
+               WHEN COALESCE(inv.available_stock, 0) <= i.minimum_stock_level THEN 'LOW_STOCK'
+               ELSE 'NORMAL'
+           END as stock_status,
+           inv.last_updated
+    FROM items i
+    JOIN categories c ON i.category_id = c.category_id
+    LEFT JOIN inventory inv ON i.item_id = inv.item_id AND inv.branch_id = %s
+    WHERE i.is_active = TRUE
+    ORDER BY i.item_name
+""",
+    "inventory.item_stock": """
+    SELECT i.item_name, i.item_code, b.branch_name,
+           COALESCE(inv.current_stock, 0) as current_stock,
+           COALESCE(inv.reserved_stock, 0) as reserved_stock,
+           COALESCE(inv.available_stock, 0) as available_stock
+    FROM items i
+    CROSS JOIN branches b
+    LEFT JOIN inventory inv ON i.item_id = inv.item_id AND b.branch_id = inv.branch_id
+    WHERE i.item_id = %s AND b.branch_id = %s
+""",
+    "inventory.item_across_branches": """
+    SELECT i.item_name, i.item_code, b.branch_name, b.branch_code,
+           COALESCE(inv.current_stock, 0) as current_stock,
+           COALESCE(inv.available_stock, 0) as available_stock
+    FROM items i
+    CROSS JOIN branches b
+    LEFT JOIN inventory inv ON i.item_id = inv.item_id AND b.branch_id = inv.branch_id
+    WHERE i.item_id = %s AND b.is_active = TRUE
+    ORDER BY b.branch_name
+""",
+    "inventory.low_stock": """
+    SELECT i.item_name, i.item_code, inv.available_stock, i.minimum_stock_level,
+           (i.minimum_stock_level - inv.available_stock) as shortage
+    FROM inventory inv
+    JOIN items i ON inv.item_id = i.item_id
+    WHERE inv.branch_id = %s
+      AND inv.available_stock <= i.minimum_stock_level
+      AND i.is_active = TRUE
+    ORDER BY shortage DESC
+""",
+    "inventory.out_of_stock": """
+    SELECT i.item_name, i.item_code, i.minimum_stock_level
+    FROM items i
+    LEFT JOIN inventory inv ON i.item_id = inv.item_id AND inv.branch_id = %s
+    WHERE (inv.available_stock IS NULL OR inv.available_stock = 0)
+      AND i.is_active = TRUE
+    ORDER BY i.item_name
+""",
+    "stock_discrepancy.by_id": DISCREPANCY_SELECT + """
+    WHERE sd.discrepancy_id = %s
+""",
+
+    # Master data
+    "item.by_id": """
+    SELECT i.*, c.category_name
+    FROM items i
+    JOIN categories c ON i.category_id = c.category_id
+    WHERE i.item_id = %s
+""",
+    "item.list": """
+    SELECT i.item_id, i.item_name, i.item_code, i.category_id, c.category_name,
+           i.description, i.unit_of_measure, i.minimum_stock_level,
+           i.maximum_stock_level, i.unit_price, i.is_active,
+           i.created_at, i.updated_at
+    FROM items i
+    JOIN categories c ON i.category_id = c.category_id
+    ORDER BY i.item_name
+""",
+    "item.active": """
+    SELECT i.item_id, i.item_name, i.item_code, c.category_name
+    FROM items i
+    JOIN categories c ON i.category_id = c.category_id
+    WHERE i.is_active = TRUE
+    ORDER BY i.item_name
+""",
+    "item.search": """
+    SELECT i.item_id, i.item_name, i.item_code, c.category_name
+    FROM items i
+    JOIN categories c ON i.category_id = c.category_id
+    WHERE i.is_active = TRUE
+      AND (i.item_name LIKE CONCAT('%', %s, '%')
+           OR i.item_code LIKE CONCAT('%', %s, '%'))
+    ORDER BY i.item_name
+""",
+    "item.by_category": """
+    SELECT item_id, item_name, item_code, unit_of_measure
+    FROM items
+    WHERE category_id = %s AND is_active = TRUE
+    ORDER BY item_name
+""",
+    "users.by_id": """
+    SELECT u.*, b.branch_name, r.role_name
+    FROM users u
+    JOIN branches b ON u.branch_id = b.branch_id
+    JOIN roles r ON u.role_id = r.role_id
+    WHERE u.user_id = %s
+""",
+    "users.login": """
+    SELECT u.user_id, u.username, u.email, u.full_name, u.phone,
+           u.branch_id, b.branch_name, b.branch_code, u.role_id, r.role_name,
+           u.is_active, u.last_login
+    FROM users u
+    JOIN branches b ON u.branch_id = b.branch_id
+    JOIN roles r ON u.role_id = r.role_id
+    WHERE u.username = %s AND u.password_hash = %s AND u.is_active = TRUE
+""",
+    "users.list": """
+    SELECT u.user_id, u.username, u.email, u.full_name, u.phone,
+           b.branch_name, r.role_name, u.is_active, u.created_at
+    FROM users u
+    JOIN branches b ON u.branch_id = b.branch_id
+    JOIN roles r ON u.role_id = r.role_id
+    ORDER BY u.full_name
+""",
+    "users.by_branch": """
+    SELECT u.user_id, u.username, u.full_name, r.role_name, u.is_active
+    FROM users u
+    JOIN roles r ON u.role_id = r.role_id
+    WHERE u.branch_id = %s
+    ORDER BY r.role_name, u.full_name
+""",
+    "users.permissions": """
+    SELECT r.role_name, r.role_description
+    FROM users u
+    JOIN roles r ON u.role_id = r.role_id
+    WHERE u.user_id = %s
+""",
+    "branches.active": """
+    SELECT * FROM branches
+    WHERE is_active = TRUE
+    ORDER BY branch_name
+""",
+    "branches.by_id": "SELECT * FROM branches WHERE branch_id = %s",
+    "branches.dropdown": """
+    SELECT branch_id, branch_name, branch_code
+    FROM branches
+    WHERE is_active = TRUE AND branch_id != %s
+    ORDER BY branch_name
+""",
+    "categories.list": "SELECT * FROM categories ORDER BY category_name",
+    "categories.by_id": "SELECT * FROM categories WHERE category_id = %s",
+    "roles.list": "SELECT * FROM roles",
+    "roles.by_id": "SELECT * FROM roles WHERE role_id = %s",
+}
+
+# Paginated movement listings register "<name>" and "<name>.after"
+for _name, _where in {
+    "stock_movement.by_item": "sm.item_id = %s",
+    "stock_movement.by_branch": "sm.branch_id = %s",
+    "stock_movement.by_date_range": "sm.created_at BETWEEN %s AND %s",
+    "stock_movement.by_type": "sm.movement_type = %s",
+}.items():
+    QUERIES[_name], QUERIES[_name + ".after"] = _movement_pages(_where)
+
+# Optional filters of /filters/stock-movements (each value passed twice), shared with its export.
+# The date bounds are always bound (MOVEMENT_MIN_DATE / MOVEMENT_MAX_DATE when not
+# given) so the range stays sargable and prunes stock_movements partitions.
+FILTER_MOVEMENTS_WHERE = """(%s IS NULL OR sm.item_id = %s)
+      AND (%s IS NULL OR sm.branch_id = %s)
+      AND (%s IS NULL OR sm.movement_type = %s)
+      AND sm.created_at >= %s
+      AND sm.created_at <= %s"""
+# Inside the TIMESTAMP range in any session time zone
+MOVEMENT_MIN_DATE = datetime(1970, 1, 2)
+MOVEMENT_MAX_DATE = datetime(2038, 1, 18)
+
+QUERIES["filters.stock_movements"], QUERIES["filters.stock_movements.after"] = _movement_pages(
+    FILTER_MOVEMENTS_WHERE, offset=True,
+)
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _record(name, elapsed, rows):
+    with _stats_lock:
+        stats = _stats.setdefault(name, {"calls": 0, "rows": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+        stats["calls"] += 1
+        stats["rows"] += rows
+        stats["total_seconds"] += elapsed
+        stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+
+
+def run_query(connection, name, params=()):
+    """Execute a registered query as a server-side prepared statement and return rows as dicts."""
+    sql = QUERIES[name]
+    cursor = connection.prepared_cursor(name)
+    started = time.perf_counter()
+    cursor.execute(sql, tuple(params))
+    rows = cursor.fetchall()
+    columns = cursor.column_names
+    _record(name, time.perf_counter() - started, len(rows))
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def run_query_one(connection, name, params=()):
+    rows = run_query(connection, name, params)
+    return rows[0] if rows else None
+
+
+def existing_ids(cursor, table, column, ids):
+    """The subset of `ids` present in table.column, with one IN query; `cursor` is a dictionary cursor."""
+    if not ids:
+        return set()
+    placeholders = ", ".join(["%s"] * len(ids))
+    cursor.execute(f"SELECT {column} FROM {table} WHERE {column} IN ({placeholders})", tuple(ids))
+    return {row[column] for row in cursor.fetchall()}
+
+
+def query_stats():
+    # Heaviest statements first
+    with _stats_lock:
+        result = [dict(stats, query=name) for name, stats in _stats.items()]
+    for stats in result:
+        stats["avg_seconds"] = stats["total_seconds"] / stats["calls"]
+    return sorted(result, key=lambda stats: stats["total_seconds"], reverse=True)
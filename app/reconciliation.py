@@ -0,0 +1,185 @@
+"""Background inventory reconciliation over a branch, a category or everything.
+
+The inventory rows in scope are split into chunks of RECONCILE_CHUNK_SIZE and
+reconciled by RECONCILE_WORKERS threads shared by all jobs, each on a
+connection from the reconciliation pool, so jobs never hold connections from
+the pool that serves requests; a second job's chunks queue behind the first's.
+A chunk is one grouped aggregation: latest balance checkpoint plus the signed
+sum of later movements, for every row in the chunk (see app/ledger.py), and
+is re-run by app/retry.py if it deadlocks.
+
+Outside dry-run mode a chunk locks its inventory rows first (SELECT ... FOR
+UPDATE), so a stock write can't land between computing the ledger balance and
+correcting current_stock; then only rows that differ are updated.
+
+Jobs live in memory on the worker that started them; the last
+RECONCILE_JOBS_KEPT are kept for status polling.
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+from app import config, retry
+from app.database import get_reconcile_connection
+from app.ledger import AFTER_CHECKPOINT, LATEST_CHECKPOINT, SIGNED_QUANTITY, after_checkpoint_params
+
+logger = logging.getLogger(__name__)
+
+_LEDGER_STOCK = f"""
+    SELECT inv.inventory_id, inv.item_id, inv.branch_id, inv.current_stock,
+           COALESCE(cp.balance, 0) + COALESCE(SUM({SIGNED_QUANTITY}), 0) AS ledger_stock
+    FROM inventory inv
+    LEFT JOIN stock_balance_checkpoints cp ON {LATEST_CHECKPOINT}
+    LEFT JOIN stock_movements sm ON {AFTER_CHECKPOINT}
+    WHERE inv.inventory_id IN ({{ids}})
+    GROUP BY inv.inventory_id, inv.item_id, inv.branch_id, inv.current_stock, cp.balance
+"""
+
+_jobs = OrderedDict()
+_lock = threading.Lock()
+_executor = None  # created on first use; one thread per reconciliation pool connection
+
+
+def _placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+
+def _scope_ids(connection, branch_id, category_id):
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT inv.inventory_id
+        FROM inventory inv
+        JOIN items i ON inv.item_id = i.item_id
+        WHERE (%s IS NULL OR inv.branch_id = %s)
+          AND (%s IS NULL OR i.category_id = %s)
+        ORDER BY inv.inventory_id
+    """, (branch_id, branch_id, category_id, category_id))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _reconcile_chunk(ids, dry_run, updated_by):
+    """Reconcile one chunk of inventory ids; returns the rows whose stock differs."""
+    connection = get_reconcile_connection()
+    try:
+        connection.route = "reconciliation"
+        cursor = connection.cursor(dictionary=True)
+        connection.start_transaction(isolation_level="READ COMMITTED")
+        if not dry_run:
+            cursor.execute(
+                f"SELECT inventory_id FROM inventory WHERE inventory_id IN ({_placeholders(ids)}) FOR UPDATE",
+                tuple(ids),
+            )
+            cursor.fetchall()
+        cursor.execute(_LEDGER_STOCK.format(ids=_placeholders(ids)), (*after_checkpoint_params(), *ids))
+        diff = [
+            {
+                "item_id": row["item_id"],
+                "branch_id": row["branch_id"],
+                "current_stock": row["current_stock"],
+                "ledger_stock": int(row["ledger_stock"]),
+                "difference": int(row["ledger_stock"]) - row["current_stock"],
+                "inventory_id": row["inventory_id"],
+            }
+            for row in cursor.fetchall()
+            if row["current_stock"] != row["ledger_stock"]
+        ]
+        if diff and not dry_run:
+            cases = " ".join(["WHEN %s THEN %s"] * len(diff))
+            params = [value for row in diff for value in (row["inventory_id"], row["ledger_stock"])]
+            changed = [row["inventory_id"] for row in diff]
+            cursor.execute(
+                f"""UPDATE inventory
+                SET current_stock = CASE inventory_id {cases} END, updated_by = %s
+                WHERE inventory_id IN ({_placeholders(changed)})""",
+                (*params, updated_by, *changed),
+            )
+        connection.commit()
+        for row in diff:
+            del row["inventory_id"]
+        return diff
+    finally:
+        connection.close()
+
+
+def _chunk_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=config.RECONCILE_WORKERS, thread_name_prefix="reconcile")
+        return _executor
+
+
+def _run(job, chunks):
+    executor = _chunk_executor()
+    futures = {
+        executor.submit(
+            retry.run, partial(_reconcile_chunk, chunk, job["dry_run"], job["updated_by"]), route="reconciliation"
+        ): chunk
+        for chunk in chunks
+    }
+    try:
+        for future in as_completed(futures):
+            diff = future.result()
+            with _lock:
+                job["chunks_done"] += 1
+                job["rows_checked"] += len(futures[future])
+                job["diff"].extend(diff)
+        status = "completed"
+    except Exception as err:
+        for future in futures:
+            future.cancel()  # don't run this job's queued chunks
+        logger.exception("Reconciliation job %s failed", job["job_id"])
+        with _lock:
+            job["error"] = str(err)
+        status = "failed"
+    with _lock:
+        job["status"] = status
+        job["finished_at"] = time.time()
+
+
+def start(connection, branch_id=None, category_id=None, dry_run=True, updated_by=None):
+    """Queue a reconciliation job and return its initial status.
+
+    The scope is resolved on the caller's connection; chunks then run in the
+    background on reconciliation pool connections. Jobs that write need the
+    user to record as updated_by.
+    """
+    if not dry_run and updated_by is None:
+        raise ValueError("updated_by is required unless dry_run is set")
+    ids = _scope_ids(connection, branch_id, category_id)
+    chunks = [ids[start:start + config.RECONCILE_CHUNK_SIZE] for start in range(0, len(ids), config.RECONCILE_CHUNK_SIZE)]
+    job = {
+        "job_id": uuid.uuid4().hex,
+        "status": "running",
+        "branch_id": branch_id,
+        "category_id": category_id,
+        "dry_run": dry_run,
+        "updated_by": updated_by,
+        "started_at": time.time(),
+        "finished_at": None,
+        "rows_total": len(ids),
+        "rows_checked": 0,
+        "chunks_total": len(chunks),
+        "chunks_done": 0,
+        "diff": [],
+        "error": None,
+    }
+    with _lock:
+        _jobs[job["job_id"]] = job
+        while len(_jobs) > config.RECONCILE_JOBS_KEPT:
+            _jobs.popitem(last=False)
+    threading.Thread(target=_run, args=(job, chunks), name=f"reconcile-{job['job_id'][:8]}", daemon=True).start()
+    return get(job["job_id"])
+
+
+def get(job_id):
+    """Snapshot of a job, or None if unknown (or evicted)."""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        return dict(job, diff=list(job["diff"]))
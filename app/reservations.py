@@ -0,0 +1,180 @@
+"""Stock reservations that never reserve more than is available.
+
+A single line is one conditional UPDATE:
+
+    reserved_stock = reserved_stock + q WHERE current_stock - reserved_stock >= q
+
+so the check and the write happen under the same row lock, and the lock is
+held only by that statement. A batch (several lines, e.g. a dispatch) locks
+all of its inventory rows with one SELECT ... FOR UPDATE in (item_id,
+branch_id) order, the same order stock.apply_lines() uses, checks every line
+and writes them with one UPDATE. Either way a short line raises
+stock.InsufficientStockError and the caller's rollback undoes the rest.
+Nothing is committed here.
+
+Calls, units and the time spent taking the row locks are exported to
+Prometheus. Per (item, branch) lock time is kept in memory so status() can
+name the most contended rows.
+"""
+import threading
+import time
+from collections import Counter
+
+from app import metrics
+from app.stock import InsufficientStockError
+
+# Pairs tracked in memory for status(); the least contended are dropped beyond this
+_TRACKED_PAIRS = 5000
+
+_lock_seconds = Counter()  # (item_id, branch_id) -> seconds spent locking its row
+_calls = Counter()  # (item_id, branch_id) -> reservation/release calls that touched it
+_stats_lock = threading.Lock()
+
+
+def _placeholders(pairs):
+    return ", ".join(["(%s, %s)"] * len(pairs))
+
+
+def _merge(lines):
+    # Several lines for the same pair act as one
+    quantities = Counter()
+    for item_id, branch_id, quantity in lines:
+        quantities[(item_id, branch_id)] += quantity
+    return dict(sorted(quantities.items()))
+
+
+def _record(operation, pairs, seconds, outcome, units):
+    metrics.STOCK_RESERVATIONS.labels(operation, outcome).inc()
+    metrics.STOCK_RESERVATION_LOCK_SECONDS.labels(operation).observe(seconds)
+    if outcome == "ok":
+        metrics.STOCK_RESERVATION_UNITS.labels(operation).inc(units)
+    with _stats_lock:
+        for pair in pairs:
+            _lock_seconds[pair] += seconds
+            _calls[pair] += 1
+        if len(_lock_seconds) > _TRACKED_PAIRS:
+            for pair, _ in _lock_seconds.most_common()[_TRACKED_PAIRS // 2:]:
+                del _lock_seconds[pair]
+                del _calls[pair]
+
+
+def _locked_levels(connection, pairs):
+    cursor = connection.cursor()
+    cursor.execute(
+        f"""SELECT item_id, branch_id, current_stock, reserved_stock FROM inventory
+        WHERE (item_id, branch_id) IN ({_placeholders(pairs)})
+        ORDER BY item_id, branch_id
+        FOR UPDATE""",
+        tuple(value for pair in pairs for value in pair),
+    )
+    return {(item_id, branch_id): (current, reserved) for item_id, branch_id, current, reserved in cursor.fetchall()}
+
+
+def _write_reserved(connection, reserved):
+    cursor = connection.cursor()
+    pairs = sorted(reserved)
+    cursor.execute(
+        f"""UPDATE inventory
+        SET reserved_stock = CASE {" ".join(["WHEN item_id = %s AND branch_id = %s THEN %s"] * len(pairs))} END
+        WHERE (item_id, branch_id) IN ({_placeholders(pairs)})""",
+        (
+            *(value for pair in pairs for value in (*pair, reserved[pair])),
+            *(value for pair in pairs for value in pair),
+        ),
+    )
+
+
+def _result(pair, current, reserved):
+    return {
+        "item_id": pair[0],
+        "branch_id": pair[1],
+        "reserved_stock": reserved,
+        "available_stock": current - reserved,
+    }
+
+
+def _reserve_one(connection, pair, quantity):
+    cursor = connection.cursor()
+    started = time.perf_counter()
+    cursor.execute(
+        """UPDATE inventory
+        SET reserved_stock = reserved_stock + %s
+        WHERE item_id = %s AND branch_id = %s AND current_stock - reserved_stock >= %s""",
+        (quantity, *pair, quantity),
+    )
+    seconds = time.perf_counter() - started
+    reserved = cursor.rowcount == 1
+    cursor.execute(
+        "SELECT current_stock, reserved_stock FROM inventory WHERE item_id = %s AND branch_id = %s",
+        pair,
+    )
+    current, reserved_stock = cursor.fetchone() or (0, 0)
+    _record("reserve", [pair], seconds, "ok" if reserved else "insufficient", quantity)
+    if not reserved:
+        raise InsufficientStockError([(*pair, current - reserved_stock, quantity)])
+    return [_result(pair, current, reserved_stock)]
+
+
+def reserve(connection, lines):
+    """Reserve (item_id, branch_id, quantity) lines if all are available; doesn't commit.
+
+    Returns the new reserved/available stock of each pair, or raises
+    InsufficientStockError naming every short line (nothing is reserved).
+    """
+    wanted = _merge(lines)
+    if not wanted:
+        return []
+    if len(wanted) == 1:
+        return _reserve_one(connection, *next(iter(wanted.items())))
+
+    started = time.perf_counter()
+    levels = _locked_levels(connection, list(wanted))
+    seconds = time.perf_counter() - started
+    shortages = []
+    for pair, quantity in wanted.items():
+        current, reserved = levels.get(pair, (0, 0))
+        if current - reserved < quantity:
+            shortages.append((*pair, current - reserved, quantity))
+    _record("reserve", list(wanted), seconds, "insufficient" if shortages else "ok", sum(wanted.values()))
+    if shortages:
+        raise InsufficientStockError(shortages)
+
+    reserved = {pair: levels[pair][1] + quantity for pair, quantity in wanted.items()}
+    _write_reserved(connection, reserved)
+    return [_result(pair, levels[pair][0], reserved[pair]) for pair in wanted]
+
+
+def release(connection, lines):
+    """Release (item_id, branch_id, quantity) lines, never below zero; doesn't commit.
+
+    Pairs without an inventory row are skipped. Returns the new
+    reserved/available stock of each pair released.
+    """
+    wanted = _merge(lines)
+    if not wanted:
+        return []
+    started = time.perf_counter()
+    levels = _locked_levels(connection, list(wanted))
+    _record("release", list(wanted), time.perf_counter() - started, "ok", sum(wanted.values()))
+    reserved = {
+        pair: max(0, levels[pair][1] - quantity)
+        for pair, quantity in wanted.items()
+        if pair in levels
+    }
+    if reserved:
+        _write_reserved(connection, reserved)
+    return [_result(pair, levels[pair][0], reserved[pair]) for pair in reserved]
+
+
+def status(limit=20):
+    """The `limit` (item, branch) rows that reservations spent the most time locking."""
+    with _stats_lock:
+        return [
+            {
+                "item_id": item_id,
+                "branch_id": branch_id,
+                "calls": _calls[(item_id, branch_id)],
+                "lock_seconds": round(seconds, 6),
+            }
+            for (item_id, branch_id), seconds in _lock_seconds.most_common(limit)
+        ]
@@ -0,0 +1,199 @@
+"""Deadlock retry and Idempotency-Key replay for the stock-writing handlers.
+
+Concurrent dispatches, receipts and adjustments of overlapping items can
+still deadlock (InnoDB errno 1213, which rolls the transaction back) or time
+out waiting for a row lock (1205, which only fails the statement). run()
+rolls back and re-runs the whole unit of work after a short randomized
+exponential backoff, so a burst of contention costs latency instead of a 500.
+
+@retry_transaction applies run() to a route handler, and honours an
+Idempotency-Key request header: the key is claimed in idempotency_keys
+(migrations/0007) before the handler runs and the response stored once it
+has committed, so a client retrying a request whose response it never got
+receives the stored response (Idempotent-Replayed: true) instead of moving
+stock twice.
+"""
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import random
+import time
+
+import mysql.connector
+from fastapi import HTTPException, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+
+from app import config, metrics
+from app.database import get_aux_connection
+
+logger = logging.getLogger(__name__)
+
+# ER_LOCK_DEADLOCK, ER_LOCK_WAIT_TIMEOUT
+RETRYABLE_ERRNOS = (1213, 1205)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+# Share of key claims that also purge expired keys
+_PURGE_SAMPLE = 0.01
+
+
+def backoff(attempt):
+    """Seconds to sleep before retry number `attempt` (0-based): full jitter."""
+    return random.uniform(0, min(config.DB_RETRY_MAX_DELAY, config.DB_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def run(work, connection=None, route="background"):
+    """work(), re-run after a deadlock or lock wait timeout.
+
+    `connection`, if given, is the one work() writes on; it is rolled back
+    before each retry. Work that opens and closes its own connection needs
+    nothing.
+    """
+    attempt = 0
+    while True:
+        try:
+            return work()
+        except mysql.connector.Error as err:
+            if err.errno not in RETRYABLE_ERRNOS:
+                raise
+            if attempt >= config.DB_RETRY_ATTEMPTS:
+                metrics.DB_RETRIES_EXHAUSTED.labels(route).inc()
+                raise
+            if connection is not None:
+                connection.rollback()
+            metrics.DB_RETRIES.labels(route, str(err.errno)).inc()
+            delay = backoff(attempt)
+            logger.info("Retrying %s after errno %s (attempt %d, %.3fs)", route, err.errno, attempt + 1, delay)
+            time.sleep(delay)
+            attempt += 1
+
+
+def _request_hash(route, kwargs):
+    params = {
+        name: value for name, value in kwargs.items()
+        if name not in ("connection", "request", "response")
+    }
+    body = json.dumps([route, jsonable_encoder(params)], sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _claim(route, key, request_hash):
+    """Claim a key; returns None once claimed, else the (request_hash, response_body) it holds."""
+    connection = get_aux_connection()
+    try:
+        connection.route = route
+        cursor = connection.cursor()
+        if random.random() < _PURGE_SAMPLE:
+            cursor.execute(
+                "DELETE FROM idempotency_keys WHERE created_at < NOW() - INTERVAL %s SECOND LIMIT 1000",
+                (config.IDEMPOTENCY_KEY_TTL,),
+            )
+        # An expired key may be reused
+        cursor.execute(
+            """DELETE FROM idempotency_keys
+            WHERE route = %s AND idempotency_key = %s AND created_at < NOW() - INTERVAL %s SECOND""",
+            (route, key, config.IDEMPOTENCY_KEY_TTL),
+        )
+        cursor.execute(
+            "INSERT IGNORE INTO idempotency_keys (route, idempotency_key, request_hash) VALUES (%s, %s, %s)",
+            (route, key, request_hash),
+        )
+        claimed = cursor.rowcount == 1
+        existing = None
+        if not claimed:
+            cursor.execute(
+                "SELECT request_hash, response_body FROM idempotency_keys WHERE route = %s AND idempotency_key = %s",
+                (route, key),
+            )
+            existing = cursor.fetchone()
+        connection.commit()
+        return existing
+    finally:
+        connection.close()
+
+
+def _finish(route, key, response_body):
+    # Store the response, or (None) give the key up so the request can be sent again
+    connection = get_aux_connection()
+    try:
+        connection.route = route
+        cursor = connection.cursor()
+        if response_body is None:
+            cursor.execute(
+                "DELETE FROM idempotency_keys WHERE route = %s AND idempotency_key = %s AND response_body IS NULL",
+                (route, key),
+            )
+        else:
+            cursor.execute(
+                "UPDATE idempotency_keys SET response_body = %s WHERE route = %s AND idempotency_key = %s",
+                (response_body, route, key),
+            )
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def _idempotent(route, key, request_hash, work, response):
+    existing = _claim(route, key, request_hash)
+    if existing is not None:
+        stored_hash, body = existing
+        if stored_hash != request_hash:
+            raise HTTPException(
+                status_code=422,
+                detail=f"{IDEMPOTENCY_HEADER} was already used for a different request",
+            )
+        if body is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"A request with this {IDEMPOTENCY_HEADER} is still in progress",
+            )
+        metrics.IDEMPOTENT_REPLAYS.labels(route).inc()
+        response.headers[REPLAYED_HEADER] = "true"
+        return json.loads(body)
+    try:
+        result = work()
+    except BaseException:
+        try:
+            _finish(route, key, None)
+        except Exception as err:
+            logger.warning("Could not release %s %r: %s", IDEMPOTENCY_HEADER, key, err)
+        raise
+    try:
+        _finish(route, key, json.dumps(jsonable_encoder(result)))
+    except Exception as err:
+        # The work has committed; a retry with this key now gets a 409 until it expires
+        logger.warning("Could not store the response for %s %r: %s", IDEMPOTENCY_HEADER, key, err)
+    return result
+
+
+def retry_transaction(handler):
+    """Route handler decorator: run() around the handler plus Idempotency-Key replay.
+
+    The handler's own `connection` (from get_db) is rolled back before each
+    retry. FastAPI sees the handler's parameters, plus `request` and
+    `response` if it doesn't take them already.
+    """
+    signature = inspect.signature(handler)
+    added = [name for name in ("request", "response") if name not in signature.parameters]
+
+    @functools.wraps(handler)
+    def wrapper(**kwargs):
+        request, response = kwargs["request"], kwargs["response"]
+        for name in added:
+            del kwargs[name]
+        route = metrics.route_label(request)
+        work = functools.partial(run, functools.partial(handler, **kwargs), kwargs.get("connection"), route)
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return work()
+        return _idempotent(route, key, _request_hash(route, kwargs), work, response)
+
+    annotations = {"request": Request, "response": Response}
+    wrapper.__signature__ = signature.replace(parameters=[
+        *signature.parameters.values(),
+        *(inspect.Parameter(name, inspect.Parameter.KEYWORD_ONLY, annotation=annotations[name]) for name in added),
+    ])
+    return wrapper
@@ -1,6 +1,8 @@
 from fastapi import APIRouter, HTTPException, status, Depends, Header
 from typing import Optional
-from app.database import get_connection
+from app.database import get_db
+from app.queries import run_query, run_query_one
+from app import stock_matrix
 from app.models.categories import CategorySummary,CategoryResponse,CategoryInDB,CategoryUpdate,CategoryCreate
 from datetime import datetime
 from typing import List
@@ -13,129 +15,71 @@ router = APIRouter(prefix="/categories", tags=["categories"], dependencies=[Depe
 
 # 1. Get all categories
 @router.get("/", response_model=List[CategoryResponse])
-async def get_all_categories():
-    connection = get_connection()
-    cursor = connection.cursor(dictionary=True)
-    
-    try:
-        cursor.execute("SELECT * FROM categories ORDER BY category_name")
-        categories = cursor.fetchall()
-        return categories
-    except Error as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
-        )
-    finally:
-        cursor.close()
-        connection.close()
+def get_all_categories(connection=Depends(get_db)):
+    categories = run_query(connection, "categories.list")
+    return categories
 
 # 2. Create category
 @router.post("/", response_model=CategoryResponse, status_code=status.HTTP_201_CREATED)
-async def create_category(category: CategoryCreate):
-    connection = get_connection()
+def create_category(category: CategoryCreate, connection=Depends(get_db)):
     cursor = connection.cursor(dictionary=True)
     
-    try:
-        cursor.execute(
-            "INSERT INTO categories (category_name, category_code, description) VALUES (%s, %s, %s)",
-            (category.category_name, category.category_code, category.description)
-        )
-        connection.commit()
-        
-        category_id = cursor.lastrowid
-        cursor.execute("SELECT * FROM categories WHERE category_id = %s", (category_id,))
-        new_category = cursor.fetchone()
-        
-        return new_category
-    except Error as e:
-        connection.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
-        )
-    finally:
-        cursor.close()
-        connection.close()
+    cursor.execute(
+        "INSERT INTO categories (category_name, category_code, description) VALUES (%s, %s, %s)",
+        (category.category_name, category.category_code, category.description)
+    )
+    connection.commit()
+    stock_matrix.request_reload()
+    
+    category_id = cursor.lastrowid
+    new_category = run_query_one(connection, "categories.by_id", (category_id,))
+    
+    return new_category
 
 # 3. Update category
 @router.put("/{category_id}", response_model=CategoryResponse)
-async def update_category(category_id: int, category: CategoryUpdate):
-    connection = get_connection()
+def update_category(category_id: int, category: CategoryUpdate, connection=Depends(get_db)):
     cursor = connection.cursor(dictionary=True)
     
-    try:
-        cursor.execute(
-            "UPDATE categories SET category_name = %s, description = %s WHERE category_id = %s",
-            (category.category_name, category.description, category_id)
-        )
-        connection.commit()
-        
-        cursor.execute("SELECT * FROM categories WHERE category_id = %s", (category_id,))
-        updated_category = cursor.fetchone()
-        
-        if not updated_category:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Category not found"
-            )
-            
-        return updated_category
-    except Error as e:
-        connection.rollback()
+    cursor.execute(
+        "UPDATE categories SET category_name = %s, description = %s WHERE category_id = %s",
+        (category.category_name, category.description, category_id)
+    )
+    connection.commit()
+    stock_matrix.request_reload()
+    
+    updated_category = run_query_one(connection, "categories.by_id", (category_id,))
+    
+    if not updated_category:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Category not found"
         )
-    finally:
-        cursor.close()
-        connection.close()
+        
+    return updated_category
 
 
 # Get category by ID
 @router.get("/{category_id}", response_model=CategoryResponse)
-async def get_category_by_id(category_id: int):
-    connection = get_connection()
-    cursor = connection.cursor(dictionary=True)
+def get_category_by_id(category_id: int, connection=Depends(get_db)):
+    category = run_query_one(connection, "categories.by_id", (category_id,))
     
-    try:
-        cursor.execute("SELECT * FROM categories WHERE category_id = %s", (category_id,))
-        category = cursor.fetchone()
-        
-        if not category:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Category not found"
-            )
-            
-        return category
-    except Error as e:
+    if not category:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Category not found"
         )
-    finally:
-        cursor.close()
-        connection.close()
+        
+    return category
 
 
 # Delete category
 @router.delete("/{category_id}", status_code=status.HTTP_200_OK)
-async def delete_category(category_id: int):
-    connection = get_connection()
+def delete_category(category_id: int, connection=Depends(get_db)):
     cursor = connection.cursor()
     
-    try:
-        cursor.execute("DELETE FROM categories WHERE category_id = %s", (category_id,))
-        connection.commit()
-        
-        return {"message": "Category deleted successfully"}
-    except Error as e:
-        connection.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
-        )
-    finally:
-        cursor.close()
-        connection.close()
\ No newline at end of file
+    cursor.execute("DELETE FROM categories WHERE category_id = %s", (category_id,))
+    connection.commit()
+    stock_matrix.request_reload()
+    
+    return {"message": "Category deleted successfully"}
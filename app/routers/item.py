@@ -1,6 +1,9 @@
 from fastapi import APIRouter, HTTPException, status, Depends, Header
 from typing import Optional
-from app.database import get_connection
+from app.database import get_db
+from app.queries import run_query, run_query_one
+from app.dimensions import item_names
+from app import stock_matrix
 from app.models.item import ItemCategoryResponse,ItemDetailResponse, ItemSummary,ItemResponse,ItemUpdate,ItemCreate
 from datetime import datetime
 from typing import List
@@ -13,230 +16,93 @@ router = APIRouter(prefix="/item", tags=["item"], dependencies=[Depends(verify_t
 
 # Get all items with category info
 @router.get("/", response_model=List[ItemResponse])
-async def get_all_items():
-    connection = get_connection()
-    cursor = connection.cursor(dictionary=True)
-    
-    try:
-        cursor.execute("""
-            SELECT i.item_id, i.item_name, i.item_code, i.category_id, c.category_name, 
-                   i.description, i.unit_of_measure, i.minimum_stock_level,
-                   i.maximum_stock_level, i.unit_price, i.is_active,
-                   i.created_at, i.updated_at
-            FROM items i
-            JOIN categories c ON i.category_id = c.category_id
-            ORDER BY i.item_name
-        """)
-        return cursor.fetchall()
-    except Error as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
-        )
-    finally:
-        cursor.close()
-        connection.close()
+def get_all_items(connection=Depends(get_db)):
+    return run_query(connection, "item.list")
 
 # Get active items only
 @router.get("/active", response_model=List[ItemSummary])
-async def get_active_items():
-    connection = get_connection()
-    cursor = connection.cursor(dictionary=True)
-    
-    try:
-        cursor.execute("""
-            SELECT i.item_id, i.item_name, i.item_code, c.category_name
-            FROM items i
-            JOIN categories c ON i.category_id = c.category_id
-            WHERE i.is_active = TRUE
-            ORDER BY i.item_name
-        """)
-        return cursor.fetchall()
-    except Error as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
-        )
-    finally:
-        cursor.close()
-        connection.close()
+def get_active_items(connection=Depends(get_db)):
+    return run_query(connection, "item.active")
 
 # Get item by ID
 @router.get("/{item_id}", response_model=ItemDetailResponse)
-async def get_item(item_id: int):
-    connection = get_connection()
-    cursor = connection.cursor(dictionary=True)
-    
-    try:
-        cursor.execute("""
-            SELECT i.*, c.category_name
-            FROM items i
-            JOIN categories c ON i.category_id = c.category_id
-            WHERE i.item_id = %s
-        """, (item_id,))
-        item = cursor.fetchone()
-        if not item:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Item not found"
-            )
-        return item
-    except Error as e:
+def get_item(item_id: int, connection=Depends(get_db)):
+    item = run_query_one(connection, "item.by_id", (item_id,))
+    if not item:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Item not found"
         )
-    finally:
-        cursor.close()
-        connection.close()
+    return item
 
 # Search items
 @router.get("/search/{query}", response_model=List[ItemSummary])
-async def search_items(query: str):
-    connection = get_connection()
-    cursor = connection.cursor(dictionary=True)
-    
-    try:
-        cursor.execute("""
-            SELECT i.item_id, i.item_name, i.item_code, c.category_name
-            FROM items i
-            JOIN categories c ON i.category_id = c.category_id
-            WHERE i.is_active = TRUE 
-              AND (i.item_name LIKE CONCAT('%', %s, '%') 
-                   OR i.item_code LIKE CONCAT('%', %s, '%'))
-            ORDER BY i.item_name
-        """, (query, query))
-        return cursor.fetchall()
-    except Error as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
-        )
-    finally:
-        cursor.close()
-        connection.close()
+def search_items(query: str, connection=Depends(get_db)):
+    return run_query(connection, "item.search", (query, query))
 
 # Create new item
 @router.post("/", response_model=ItemDetailResponse, status_code=status.HTTP_201_CREATED)
-async def create_item(item: ItemCreate):
-    connection = get_connection()
+def create_item(item: ItemCreate, connection=Depends(get_db)):
     cursor = connection.cursor(dictionary=True)
     
-    try:
-        cursor.execute("""
-            INSERT INTO items 
-            (item_name, item_code, category_id, description, 
-             unit_of_measure, minimum_stock_level, maximum_stock_level, unit_price)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            item.item_name, item.item_code, item.category_id, item.description,
-            item.unit_of_measure, item.minimum_stock_level, 
-            item.maximum_stock_level, item.unit_price
-        ))
-        connection.commit()
-        
-        item_id = cursor.lastrowid
-        cursor.execute("""
-            SELECT i.*, c.category_name
-            FROM items i
-            JOIN categories c ON i.category_id = c.category_id
-            WHERE i.item_id = %s
-        """, (item_id,))
-        new_item = cursor.fetchone()
-        
-        return new_item
-    except Error as e:
-        connection.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
-        )
-    finally:
-        cursor.close()
-        connection.close()
+    cursor.execute("""
+        INSERT INTO items 
+        (item_name, item_code, category_id, description, 
+         unit_of_measure, minimum_stock_level, maximum_stock_level, unit_price)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """, (
+        item.item_name, item.item_code, item.category_id, item.description,
+        item.unit_of_measure, item.minimum_stock_level, 
+        item.maximum_stock_level, item.unit_price
+    ))
+    connection.commit()
+    stock_matrix.request_reload()
+    
+    item_id = cursor.lastrowid
+    new_item = run_query_one(connection, "item.by_id", (item_id,))
+    
+    return new_item
 
 # Update item
 @router.put("/{item_id}", response_model=ItemDetailResponse)
-async def update_item(item_id: int, item: ItemUpdate):
-    connection = get_connection()
+def update_item(item_id: int, item: ItemUpdate, connection=Depends(get_db)):
     cursor = connection.cursor(dictionary=True)
     
-    try:
-        cursor.execute("""
-            UPDATE items 
-            SET item_name = %s, item_code = %s, category_id = %s, description = %s,
-                unit_of_measure = %s, minimum_stock_level = %s, 
-                maximum_stock_level = %s, unit_price = %s
-            WHERE item_id = %s
-        """, (
-            item.item_name, item.item_code, item.category_id, item.description,
-            item.unit_of_measure, item.minimum_stock_level,
-            item.maximum_stock_level, item.unit_price, item_id
-        ))
-        connection.commit()
-        
-        cursor.execute("""
-            SELECT i.*, c.category_name
-            FROM items i
-            JOIN categories c ON i.category_id = c.category_id
-            WHERE i.item_id = %s
-        """, (item_id,))
-        updated_item = cursor.fetchone()
-        
-        return updated_item
-    except Error as e:
-        connection.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
-        )
-    finally:
-        cursor.close()
-        connection.close()
+    cursor.execute("""
+        UPDATE items 
+        SET item_name = %s, item_code = %s, category_id = %s, description = %s,
+            unit_of_measure = %s, minimum_stock_level = %s, 
+            maximum_stock_level = %s, unit_price = %s
+        WHERE item_id = %s
+    """, (
+        item.item_name, item.item_code, item.category_id, item.description,
+        item.unit_of_measure, item.minimum_stock_level,
+        item.maximum_stock_level, item.unit_price, item_id
+    ))
+    connection.commit()
+    item_names.invalidate(item_id)
+    stock_matrix.request_reload()
+    
+    updated_item = run_query_one(connection, "item.by_id", (item_id,))
+    
+    return updated_item
 
 # Deactivate item
 @router.delete("/{item_id}", status_code=status.HTTP_200_OK)
-async def deactivate_item(item_id: int):
-    connection = get_connection()
+def deactivate_item(item_id: int, connection=Depends(get_db)):
     cursor = connection.cursor()
     
-    try:
-        cursor.execute("""
-            UPDATE items 
-            SET is_active = FALSE 
-            WHERE item_id = %s
-        """, (item_id,))
-        connection.commit()
-        return {"message": "Item deactivated successfully"}
-    except Error as e:
-        connection.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
-        )
-    finally:
-        cursor.close()
-        connection.close()
+    cursor.execute("""
+        UPDATE items 
+        SET is_active = FALSE 
+        WHERE item_id = %s
+    """, (item_id,))
+    connection.commit()
+    item_names.invalidate(item_id)
+    stock_matrix.request_reload()
+    return {"message": "Item deactivated successfully"}
 
 # Get items by category
 @router.get("/category/{category_id}", response_model=List[ItemCategoryResponse])
-async def get_items_by_category(category_id: int):
-    connection = get_connection()
-    cursor = connection.cursor(dictionary=True)
-    
-    try:
-        cursor.execute("""
-            SELECT item_id, item_name, item_code, unit_of_measure
-            FROM items 
-            WHERE category_id = %s AND is_active = TRUE
-            ORDER BY item_name
-        """, (category_id,))
-        return cursor.fetchall()
-    except Error as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
-        )
-    finally:
-        cursor.close()
-        connection.close()
\ No newline at end of file
+def get_items_by_category(category_id: int, connection=Depends(get_db)):
+    return run_query(connection, "item.by_category", (category_id,))
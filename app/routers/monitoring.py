@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Depends, Query
+from app.database import get_db, pool_status
+from app.admission import admission_status
+from app.queries import query_stats
+from app.dimensions import dimension_status
+from app import migrations, partitions, reservations, slow_queries
+from app.auth.auth import verify_token
+router = APIRouter(prefix="/monitoring", tags=["monitoring"], dependencies=[Depends(verify_token)],  # Applies to all endpoints
+    responses={401: {"description": "Unauthorized"}})
+
+# Connection pool checkout counts and wait times
+@router.get("/pool")
+async def get_pool_status():
+    return pool_status()
+
+# Admission control in-flight counts, queue depth and rejections
+@router.get("/admission")
+async def get_admission_status():
+    return admission_status()
+
+# Named query call counts and timings, slowest total first
+@router.get("/queries")
+async def get_query_stats():
+    return query_stats()
+
+# Item/branch/user name cache sizes and hit counts
+@router.get("/dimensions")
+async def get_dimension_status():
+    return dimension_status()
+
+# Inventory rows reservations spent the most time locking (hot items)
+@router.get("/reservations")
+async def get_reservation_contention(limit: int = Query(20, ge=1, le=200)):
+    return reservations.status(limit)
+
+# Slowest captured statements (one per distinct SQL) with their EXPLAIN plans
+@router.get("/slow-queries")
+async def get_slow_queries(limit: int = Query(20, ge=1, le=200)):
+    return slow_queries.worst(limit)
+
+# Empty the slow-query buffer, e.g. after adding an index
+@router.delete("/slow-queries", status_code=204)
+async def clear_slow_queries():
+    slow_queries.clear()
+
+# Applied/pending schema migrations and any declared index missing from the live schema
+@router.get("/schema")
+def get_schema_status(connection=Depends(get_db)):
+    return {
+        "migrations": migrations.status(connection),
+        "missing_indexes": migrations.missing_indexes(connection),
+    }
+
+
+# stock_movements partitions with estimated row counts
+@router.get("/partitions")
+def get_partitions(connection=Depends(get_db)):
+    return partitions.partitions(connection)
\ No newline at end of file
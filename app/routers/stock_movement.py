@@ -1,7 +1,14 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Header
+from fastapi import APIRouter, HTTPException, status, Depends, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from typing import Optional
-from app.database import get_connection
-from app.models.stock_movement import MovementFilter,StockMovementResponse,StockMovementCreate,ReferenceType,MovementType
+from app.database import check_insert_ids, get_db
+from app.queries import MOVEMENT_SELECT, MOVEMENT_AFTER, MOVEMENT_ORDER, existing_ids, run_query_one
+from app.pagination import cursor_params, movement_page, page
+from app.export import ExportFormat, stream_rows
+from app.dimensions import MOVEMENT_NAME_COLUMNS, enrich_movements
+from app import config
+from app.models.stock_movement import MovementFilter,StockMovementResponse,StockMovementCreate,StockMovementBulkCreate,StockMovementBulkResponse,ReferenceType,MovementType
+from pydantic import ValidationError
 from datetime import datetime
 from typing import List
 from passlib.context import CryptContext
@@ -14,247 +21,250 @@ router = APIRouter(prefix="/stock_movement", tags=["stock_movement"], dependenci
 
  # Create new stock movement
 @router.post("/", response_model=StockMovementResponse, status_code=status.HTTP_201_CREATED)
-async def create_stock_movement(movement: StockMovementCreate):
-    connection = get_connection()
+def create_stock_movement(movement: StockMovementCreate, connection=Depends(get_db)):
     cursor = connection.cursor(dictionary=True)
     
-    try:
-        cursor.execute("""
-            INSERT INTO stock_movements 
-            (item_id, branch_id, movement_type, quantity, previous_stock, 
-             new_stock, reference_type, reference_id, notes, created_by)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            movement.item_id, movement.branch_id, movement.movement_type.value,
-            movement.quantity, movement.previous_stock, movement.new_stock,
-            movement.reference_type.value, movement.reference_id,
-            movement.notes, movement.created_by
-        ))
-        connection.commit()
-        
-        movement_id = cursor.lastrowid
-        cursor.execute("""
-            SELECT sm.*, i.item_name, b.branch_name, u.full_name as created_by_name
-            FROM stock_movements sm
-            JOIN items i ON sm.item_id = i.item_id
-            JOIN branches b ON sm.branch_id = b.branch_id
-            JOIN users u ON sm.created_by = u.user_id
-            WHERE sm.movement_id = %s
-        """, (movement_id,))
-        new_movement = cursor.fetchone()
-        
-        return new_movement
-    except Error as e:
-        connection.rollback()
+    # stock_movements is partitioned, so there are no foreign keys to reject bad references
+    for table, column, value, label in (
+        ("items", "item_id", movement.item_id, "Item"),
+        ("branches", "branch_id", movement.branch_id, "Branch"),
+        ("users", "user_id", movement.created_by, "User"),
+    ):
+        if not existing_ids(cursor, table, column, {value}):
+            raise HTTPException(status_code=422, detail=f"{label} {value} not found")
+    
+    cursor.execute("""
+        INSERT INTO stock_movements 
+        (item_id, branch_id, movement_type, quantity, previous_stock, 
+         new_stock, reference_type, reference_id, notes, created_by)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, (
+        movement.item_id, movement.branch_id, movement.movement_type.value,
+        movement.quantity, movement.previous_stock, movement.new_stock,
+        movement.reference_type.value, movement.reference_id,
+        movement.notes, movement.created_by
+    ))
+    connection.commit()
+    
+    movement_id = cursor.lastrowid
+    new_movement = run_query_one(connection, "stock_movement.by_id", (movement_id,))
+    enrich_movements([new_movement], connection)
+    
+    return new_movement
+
+_MOVEMENT_COLUMNS = """
+    INSERT INTO stock_movements
+    (item_id, branch_id, movement_type, quantity, previous_stock,
+     new_stock, reference_type, reference_id, notes, created_by)
+    VALUES """
+_MOVEMENT_ROW = "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
+
+
+def _validation_message(err):
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in err.errors()
+    )
+
+
+# Create many stock movements in one transaction
+@router.post("/bulk", response_model=StockMovementBulkResponse, status_code=status.HTTP_201_CREATED)
+def create_stock_movements_bulk(batch: StockMovementBulkCreate, response: Response, connection=Depends(get_db)):
+    if len(batch.movements) > config.BULK_MOVEMENT_MAX_ROWS:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {config.BULK_MOVEMENT_MAX_ROWS} movements per request"
         )
-    finally:
-        cursor.close()
-        connection.close()
-
-# Get stock movement by ID
-@router.get("/{movement_id}", response_model=StockMovementResponse)
-async def get_stock_movement(movement_id: int):
-    connection = get_connection()
     cursor = connection.cursor(dictionary=True)
     
-    try:
-        cursor.execute("""
-            SELECT sm.*, i.item_name, b.branch_name, u.full_name as created_by_name
-            FROM stock_movements sm
-            JOIN items i ON sm.item_id = i.item_id
-            JOIN branches b ON sm.branch_id = b.branch_id
-            JOIN users u ON sm.created_by = u.user_id
-            WHERE sm.movement_id = %s
-        """, (movement_id,))
-        movement = cursor.fetchone()
-        
-        if not movement:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Stock movement not found"
-            )
-            
-        return movement
-    except Error as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
-        )
-    finally:
-        cursor.close()
-        connection.close()
+    # Validate every row first
+    results = [{"index": index, "movement_id": None, "error": None} for index in range(len(batch.movements))]
+    movements = {}
+    for index, raw in enumerate(batch.movements):
+        try:
+            movement = StockMovementCreate.model_validate(raw)
+        except ValidationError as err:
+            results[index]["error"] = _validation_message(err)
+            continue
+        movements[index] = movement
+    
+    # One IN query per referenced table (stock_movements has no foreign keys to catch them)
+    items = existing_ids(cursor, "items", "item_id", {m.item_id for m in movements.values()})
+    branches = existing_ids(cursor, "branches", "branch_id", {m.branch_id for m in movements.values()})
+    users = existing_ids(cursor, "users", "user_id", {m.created_by for m in movements.values()})
+    for index, movement in list(movements.items()):
+        if movement.item_id not in items:
+            results[index]["error"] = f"Item {movement.item_id} not found"
+        elif movement.branch_id not in branches:
+            results[index]["error"] = f"Branch {movement.branch_id} not found"
+        elif movement.created_by not in users:
+            results[index]["error"] = f"User {movement.created_by} not found"
+        else:
+            continue
+        del movements[index]
+    
+    failed = len(results) - len(movements)
+    if failed and (batch.all_or_nothing or not movements):
+        response.status_code = 422
+        return {"inserted": 0, "failed": failed, "results": results}
+    
+    # Multi-row INSERTs in chunks. A multi-row INSERT ... VALUES is a "simple insert",
+    # so InnoDB hands it consecutive auto-increment ids starting at lastrowid
+    # (check_insert_ids refuses servers where it wouldn't).
+    check_insert_ids(connection)
+    pending = list(movements.items())
+    for start in range(0, len(pending), config.BULK_MOVEMENT_CHUNK_SIZE):
+        chunk = pending[start:start + config.BULK_MOVEMENT_CHUNK_SIZE]
+        params = []
+        for _, movement in chunk:
+            params.extend((
+                movement.item_id, movement.branch_id, movement.movement_type.value,
+                movement.quantity, movement.previous_stock, movement.new_stock,
+                movement.reference_type.value, movement.reference_id,
+                movement.notes, movement.created_by
+            ))
+        cursor.execute(_MOVEMENT_COLUMNS + ", ".join([_MOVEMENT_ROW] * len(chunk)), tuple(params))
+        first_id = cursor.lastrowid
+        for offset, (index, _) in enumerate(chunk):
+            results[index]["movement_id"] = first_id + offset
+    connection.commit()
+    
+    return {"inserted": len(movements), "failed": failed, "results": results}
+
+# Every listing below is keyset-paginated: pass the X-Next-Cursor response
+# header back as `cursor` to get the next page
+PageSize = Query(config.MOVEMENT_PAGE_SIZE, ge=1, le=config.MOVEMENT_PAGE_SIZE_MAX)
+
+def _movement_filters(item_id, branch_id, movement_type, reference_type, start_date, end_date):
+    query = " WHERE 1=1"
+    params = []
+    
+    if item_id:
+        query += " AND sm.item_id = %s"
+        params.append(item_id)
+    if branch_id:
+        query += " AND sm.branch_id = %s"
+        params.append(branch_id)
+    if movement_type:
+        query += " AND sm.movement_type = %s"
+        params.append(movement_type.value)
+    if reference_type:
+        query += " AND sm.reference_type = %s"
+        params.append(reference_type.value)
+    if start_date:
+        query += " AND sm.created_at >= %s"
+        params.append(start_date)
+    if end_date:
+        query += " AND sm.created_at <= %s"
+        params.append(end_date)
+    return query, params
 
 # Get filtered stock movements
 @router.get("/", response_model=List[StockMovementResponse])
-async def get_stock_movements(
+def get_stock_movements(
+    response: Response,
     item_id: Optional[int] = None,
     branch_id: Optional[int] = None,
     movement_type: Optional[MovementType] = None,
     reference_type: Optional[ReferenceType] = None,
     start_date: Optional[datetime] = None,
-    end_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None,
+    limit: int = PageSize,
+    cursor: Optional[str] = None,
+    connection=Depends(get_db)
 ):
-    connection = get_connection()
-    cursor = connection.cursor(dictionary=True)
+    db_cursor = connection.cursor(dictionary=True)
     
-    try:
-        query = """
-            SELECT sm.*, i.item_name, b.branch_name, u.full_name as created_by_name
-            FROM stock_movements sm
-            JOIN items i ON sm.item_id = i.item_id
-            JOIN branches b ON sm.branch_id = b.branch_id
-            JOIN users u ON sm.created_by = u.user_id
-            WHERE 1=1
-        """
-        params = []
+    where, params = _movement_filters(item_id, branch_id, movement_type, reference_type, start_date, end_date)
+    query = MOVEMENT_SELECT + where
+    if cursor:
+        query += " AND " + MOVEMENT_AFTER
+        params.extend(cursor_params(cursor))
         
-        if item_id:
-            query += " AND sm.item_id = %s"
-            params.append(item_id)
-        if branch_id:
-            query += " AND sm.branch_id = %s"
-            params.append(branch_id)
-        if movement_type:
-            query += " AND sm.movement_type = %s"
-            params.append(movement_type.value)
-        if reference_type:
-            query += " AND sm.reference_type = %s"
-            params.append(reference_type.value)
-        if start_date:
-            query += " AND sm.created_at >= %s"
-            params.append(start_date)
-        if end_date:
-            query += " AND sm.created_at <= %s"
-            params.append(end_date)
-            
-        query += " ORDER BY sm.created_at DESC"
-        
-        cursor.execute(query, tuple(params))
-        return cursor.fetchall()
-    except Error as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
-        )
-    finally:
-        cursor.close()
-        connection.close()
-
-# Get stock movements for an item
-@router.get("/item/{item_id}", response_model=List[StockMovementResponse])
-async def get_item_movements(item_id: int):
-    connection = get_connection()
-    cursor = connection.cursor(dictionary=True)
+    query += MOVEMENT_ORDER
+    params.append(limit + 1)
     
-    try:
-        cursor.execute("""
-            SELECT sm.*, i.item_name, b.branch_name, u.full_name as created_by_name
-            FROM stock_movements sm
-            JOIN items i ON sm.item_id = i.item_id
-            JOIN branches b ON sm.branch_id = b.branch_id
-            JOIN users u ON sm.created_by = u.user_id
-            WHERE sm.item_id = %s
-            ORDER BY sm.created_at DESC
-        """, (item_id,))
-        return cursor.fetchall()
-    except Error as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
-        )
-    finally:
-        cursor.close()
-        connection.close()
+    db_cursor.execute(query, tuple(params))
+    return enrich_movements(page(db_cursor.fetchall(), limit, response), connection)
 
-# Get stock movements for a branch
-@router.get("/branch/{branch_id}", response_model=List[StockMovementResponse])
-async def get_branch_movements(branch_id: int):
-    connection = get_connection()
-    cursor = connection.cursor(dictionary=True)
-    
-    try:
-        cursor.execute("""
-            SELECT sm.*, i.item_name, b.branch_name, u.full_name as created_by_name
-            FROM stock_movements sm
-            JOIN items i ON sm.item_id = i.item_id
-            JOIN branches b ON sm.branch_id = b.branch_id
-            JOIN users u ON sm.created_by = u.user_id
-            WHERE sm.branch_id = %s
-            ORDER BY sm.created_at DESC
-        """, (branch_id,))
-        
-        # Clean the data before returning
-        movements = []
-        for row in cursor.fetchall():
-            # Handle empty reference_type
-            if row['reference_type'] == '':
-                row['reference_type'] = None
-            movements.append(row)
-            
-        return movements
-    except Error as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
-        )
-    finally:
-        cursor.close()
-        connection.close()
+# Stream the full filtered history as NDJSON or CSV (no pagination, flat memory)
+@router.get("/export", response_class=StreamingResponse)
+def export_stock_movements(
+    request: Request,
+    fmt: ExportFormat = Query(ExportFormat.NDJSON, alias="format"),
+    item_id: Optional[int] = None,
+    branch_id: Optional[int] = None,
+    movement_type: Optional[MovementType] = None,
+    reference_type: Optional[ReferenceType] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+):
+    where, params = _movement_filters(item_id, branch_id, movement_type, reference_type, start_date, end_date)
+    query = MOVEMENT_SELECT + where + " ORDER BY sm.created_at DESC, sm.movement_id DESC"
+    return stream_rows(request, query, params, fmt, "stock_movements", enrich_movements, MOVEMENT_NAME_COLUMNS)
 
 # Get stock movements by date range
 @router.get("/date-range", response_model=List[StockMovementResponse])
-async def get_stock_movements_by_date_range(
+def get_stock_movements_by_date_range(
+    response: Response,
     start_date: datetime,
-    end_date: datetime
+    end_date: datetime,
+    limit: int = PageSize,
+    cursor: Optional[str] = None,
+    connection=Depends(get_db)
 ):
-    connection = get_connection()
-    cursor = connection.cursor(dictionary=True)
+    return movement_page(connection, "stock_movement.by_date_range", (start_date, end_date), limit, cursor, response)
+
+# Get stock movement by ID
+@router.get("/{movement_id}", response_model=StockMovementResponse)
+def get_stock_movement(movement_id: int, connection=Depends(get_db)):
+    movement = run_query_one(connection, "stock_movement.by_id", (movement_id,))
     
-    try:
-        cursor.execute("""
-            SELECT sm.*, i.item_name, b.branch_name, u.full_name as created_by_name
-            FROM stock_movements sm
-            JOIN items i ON sm.item_id = i.item_id
-            JOIN branches b ON sm.branch_id = b.branch_id
-            JOIN users u ON sm.created_by = u.user_id
-            WHERE sm.created_at BETWEEN %s AND %s
-            ORDER BY sm.created_at DESC
-        """, (start_date, end_date))
-        return cursor.fetchall()
-    except Error as e:
+    if not movement:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Stock movement not found"
         )
-    finally:
-        cursor.close()
-        connection.close()
+    enrich_movements([movement], connection)
+        
+    return movement
+
+# Get stock movements for an item
+@router.get("/item/{item_id}", response_model=List[StockMovementResponse])
+def get_item_movements(
+    item_id: int,
+    response: Response,
+    limit: int = PageSize,
+    cursor: Optional[str] = None,
+    connection=Depends(get_db)
+):
+    return movement_page(connection, "stock_movement.by_item", (item_id,), limit, cursor, response)
+
+# Get stock movements for a branch
+@router.get("/branch/{branch_id}", response_model=List[StockMovementResponse])
+def get_branch_movements(
+    branch_id: int,
+    response: Response,
+    limit: int = PageSize,
+    cursor: Optional[str] = None,
+    connection=Depends(get_db)
+):
+    # Clean the data before returning
+    movements = []
+    for row in movement_page(connection, "stock_movement.by_branch", (branch_id,), limit, cursor, response):
+        # Handle empty reference_type
+        if row['reference_type'] == '':
+            row['reference_type'] = None
+        movements.append(row)
+        
+    return movements
 
 # Get stock movements by type
 @router.get("/type/{movement_type}", response_model=List[StockMovementResponse])
-async def get_stock_movements_by_type(movement_type: MovementType):
-    connection = get_connection()
-    cursor = connection.cursor(dictionary=True)
-    
-    try:
-        cursor.execute("""
-            SELECT sm.*, i.item_name, b.branch_name, u.full_name as created_by_name
-            FROM stock_movements sm
-            JOIN items i ON sm.item_id = i.item_id
-            JOIN branches b ON sm.branch_id = b.branch_id
-            JOIN users u ON sm.created_by = u.user_id
-            WHERE sm.movement_type = %s
-            ORDER BY sm.created_at DESC
-        """, (movement_type.value,))
-        return cursor.fetchall()
-    except Error as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
-        )
-    finally:
-        cursor.close()
-        connection.close()
\ No newline at end of file
+def get_stock_movements_by_type(
+    movement_type: MovementType,
+    response: Response,
+    limit: int = PageSize,
+    cursor: Optional[str] = None,
+    connection=Depends(get_db)
+):
+    return movement_page(connection, "stock_movement.by_type", (movement_type.value,), limit, cursor, response)
@@ -1,7 +1,10 @@
 from fastapi import APIRouter, HTTPException, status, Depends, Header
 from typing import Optional
-from app.database import get_connection
-from app.models.transfer_requests import TransferRequestSummary,TransferRequestItemResponse,TransferRequestResponse,TransferRequestUpdate,TransferRequestItem,TransferRequestCreate,TransferPriority,TransferStatus
+from app.database import get_db
+from app import config, sequences
+from app.retry import retry_transaction
+from app.queries import existing_ids, run_query, run_query_one
+from app.models.transfer_requests import TransferRequestBulkCreate,TransferRequestBulkResponse,TransferRequestSummary,TransferRequestItemResponse,TransferRequestResponse,TransferRequestUpdate,TransferRequestItem,TransferRequestCreate,TransferPriority,TransferStatus
 from datetime import datetime
 from typing import List
 from passlib.context import CryptContext
@@ -14,344 +17,226 @@ router = APIRouter(prefix="/transfer_requests", tags=["transfer_rquests"], depen
 
 # Create transfer request
 @router.post("/", response_model=TransferRequestResponse, status_code=status.HTTP_201_CREATED)
-async def create_transfer_request(
+def create_transfer_request(
     request: TransferRequestCreate,
-    items: List[TransferRequestItem]
+    items: List[TransferRequestItem],
+    connection=Depends(get_db)
 ):
-    connection = get_connection()
     cursor = connection.cursor(dictionary=True)
     
-    try:
-        # Create transfer request header
+    # Create transfer request header
+    cursor.execute("""
+        INSERT INTO transfer_requests 
+        (transfer_number, from_branch_id, to_branch_id, 
+         requested_by, priority, notes)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, (
+        sequences.next_number(sequences.TRANSFER),
+        request.from_branch_id, request.to_branch_id,
+        request.requested_by, request.priority.value, request.notes
+    ))
+    transfer_id = cursor.lastrowid
+    
+    # Add transfer request items
+    for item in items:
+        cursor.execute("""
+            INSERT INTO transfer_request_items 
+            (transfer_id, item_id, requested_quantity, notes)
+            VALUES (%s, %s, %s, %s)
+        """, (transfer_id, item.item_id, item.requested_quantity, item.notes))
+    
+    connection.commit()
+    
+    # Get the created transfer request with details
+    transfer_request = run_query_one(connection, "transfer_requests.by_id", (transfer_id,))
+    
+    return transfer_request
+
+# Create many transfer requests in one transaction
+@router.post("/bulk", response_model=TransferRequestBulkResponse, status_code=status.HTTP_201_CREATED)
+@retry_transaction
+def create_transfer_requests_bulk(batch: TransferRequestBulkCreate, connection=Depends(get_db)):
+    transfers = batch.transfers
+    if len(transfers) > config.BULK_TRANSFER_MAX_REQUESTS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {config.BULK_TRANSFER_MAX_REQUESTS} transfer requests per request"
+        )
+    cursor = connection.cursor(dictionary=True)
+    
+    # One IN query per referenced table, so a bad id is a 422 rather than a foreign key error
+    problems = []
+    for table, column, ids in (
+        ("branches", "branch_id", {t.from_branch_id for t in transfers} | {t.to_branch_id for t in transfers}),
+        ("users", "user_id", {t.requested_by for t in transfers}),
+        ("items", "item_id", {item.item_id for t in transfers for item in t.items}),
+    ):
+        missing = sorted(ids - existing_ids(cursor, table, column, ids))
+        if missing:
+            problems.append(f"{table} not found: {', '.join(map(str, missing))}")
+    if problems:
+        raise HTTPException(status_code=422, detail="; ".join(problems))
+    
+    numbers = sequences.next_numbers(sequences.TRANSFER, len(transfers))
+    
+    # Multi-row INSERTs in chunks. The new ids are read back by transfer_number (unique)
+    # rather than assumed consecutive from lastrowid, which interleaved auto-increment
+    # (innodb_autoinc_lock_mode=2) or auto_increment_increment > 1 would break.
+    ids_by_number = {}
+    for start in range(0, len(transfers), config.BULK_TRANSFER_CHUNK_SIZE):
+        chunk = transfers[start:start + config.BULK_TRANSFER_CHUNK_SIZE]
+        chunk_numbers = numbers[start:start + len(chunk)]
+        params = []
+        for number, transfer in zip(chunk_numbers, chunk):
+            params.extend((
+                number, transfer.from_branch_id, transfer.to_branch_id,
+                transfer.requested_by, transfer.priority.value, transfer.notes
+            ))
         cursor.execute("""
             INSERT INTO transfer_requests 
             (transfer_number, from_branch_id, to_branch_id, 
              requested_by, priority, notes)
-            VALUES (generate_transfer_number(), %s, %s, %s, %s, %s)
-        """, (
-            request.from_branch_id, request.to_branch_id,
-            request.requested_by, request.priority.value, request.notes
-        ))
-        transfer_id = cursor.lastrowid
-        
-        # Add transfer request items
-        for item in items:
-            cursor.execute("""
-                INSERT INTO transfer_request_items 
-                (transfer_id, item_id, requested_quantity, notes)
-                VALUES (%s, %s, %s, %s)
-            """, (transfer_id, item.item_id, item.requested_quantity, item.notes))
-        
-        connection.commit()
-        
-        # Get the created transfer request with details
-        cursor.execute("""
-            SELECT tr.*, fb.branch_name as from_branch_name, 
-                   tb.branch_name as to_branch_name,
-                   u.full_name as requested_by_name
-            FROM transfer_requests tr
-            JOIN branches fb ON tr.from_branch_id = fb.branch_id
-            JOIN branches tb ON tr.to_branch_id = tb.branch_id
-            JOIN users u ON tr.requested_by = u.user_id
-            WHERE tr.transfer_id = %s
-        """, (transfer_id,))
-        transfer_request = cursor.fetchone()
-        
-        return transfer_request
-    except Error as e:
-        connection.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
+            VALUES """ + ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(chunk)), tuple(params))
+        cursor.execute(
+            "SELECT transfer_id, transfer_number FROM transfer_requests WHERE transfer_number IN ("
+            + ", ".join(["%s"] * len(chunk)) + ")",
+            tuple(chunk_numbers),
         )
-    finally:
-        cursor.close()
-        connection.close()
+        ids_by_number.update((row["transfer_number"], row["transfer_id"]) for row in cursor.fetchall())
+    transfer_ids = [ids_by_number[number] for number in numbers]
+    
+    lines = [
+        (transfer_id, item.item_id, item.requested_quantity, item.notes)
+        for transfer_id, transfer in zip(transfer_ids, transfers)
+        for item in transfer.items
+    ]
+    for start in range(0, len(lines), config.BULK_TRANSFER_CHUNK_SIZE):
+        chunk = lines[start:start + config.BULK_TRANSFER_CHUNK_SIZE]
+        cursor.execute("""
+            INSERT INTO transfer_request_items 
+            (transfer_id, item_id, requested_quantity, notes)
+            VALUES """ + ", ".join(["(%s, %s, %s, %s)"] * len(chunk)), tuple(value for line in chunk for value in line))
+    
+    connection.commit()
+    
+    return {
+        "created": len(transfer_ids),
+        "transfers": [
+            {"transfer_id": transfer_id, "transfer_number": number}
+            for transfer_id, number in zip(transfer_ids, numbers)
+        ],
+    }
 
 # Get all transfer requests
 @router.get("/", response_model=List[TransferRequestSummary])
-async def get_all_transfer_requests(limit: int = 10, offset: int = 0):
-    connection = get_connection()
-    cursor = connection.cursor(dictionary=True)
-    
-    try:
-        cursor.execute("""
-            SELECT tr.transfer_id, tr.transfer_number, 
-                   fb.branch_name as from_branch, tb.branch_name as to_branch,
-                   u.full_name as requested_by, tr.status, tr.priority,
-                   tr.request_date, tr.approval_date,
-                   COUNT(tri.request_item_id) as total_items
-            FROM transfer_requests tr
-            JOIN branches fb ON tr.from_branch_id = fb.branch_id
-            JOIN branches tb ON tr.to_branch_id = tb.branch_id
-            JOIN users u ON tr.requested_by = u.user_id
-            LEFT JOIN transfer_request_items tri ON tr.transfer_id = tri.transfer_id
-            GROUP BY tr.transfer_id
-            ORDER BY tr.request_date DESC
-            LIMIT %s OFFSET %s
-        """, (limit, offset))
-        return cursor.fetchall()
-    except Error as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
-        )
-    finally:
-        cursor.close()
-        connection.close()
+def get_all_transfer_requests(limit: int = 10, offset: int = 0, connection=Depends(get_db)):
+    return run_query(connection, "transfer_requests.list", (limit, offset))
 
 # Get pending transfer requests for approval
 @router.get("/pending/{branch_id}", response_model=List[TransferRequestSummary])
-async def get_pending_transfer_requests(branch_id: int):
-    connection = get_connection()
-    cursor = connection.cursor(dictionary=True)
-    
-    try:
-        cursor.execute("""
-    SELECT tr.transfer_id, tr.transfer_number, 
-           fb.branch_name as from_branch,
-           tb.branch_name as to_branch, 
-           u.full_name as requested_by,
-           tr.status, tr.priority, tr.request_date, tr.notes,
-           COUNT(tri.request_item_id) as total_items
-    FROM transfer_requests tr
-    JOIN branches fb ON tr.from_branch_id = fb.branch_id
-    JOIN branches tb ON tr.to_branch_id = tb.branch_id
-    JOIN users u ON tr.requested_by = u.user_id
-    LEFT JOIN transfer_request_items tri ON tr.transfer_id = tri.transfer_id
-    WHERE tr.from_branch_id = %s AND tr.status = 'PENDING'
-    GROUP BY tr.transfer_id
-    ORDER BY 
-        CASE tr.priority
-            WHEN 'URGENT' THEN 1
-            WHEN 'HIGH' THEN 2
-            WHEN 'MEDIUM' THEN 3
-            WHEN 'LOW' THEN 4
-        END,
-        tr.request_date
-""", (branch_id,))
-        return cursor.fetchall()
-    except Error as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
-        )
-    finally:
-        cursor.close()
-        connection.close()
+def get_pending_transfer_requests(branch_id: int, connection=Depends(get_db)):
+    return run_query(connection, "transfer_requests.pending", (branch_id,))
 
 # Get transfer request details
 @router.get("/{transfer_id}", response_model=TransferRequestResponse)
-async def get_transfer_request(transfer_id: int):
-    connection = get_connection()
-    cursor = connection.cursor(dictionary=True)
+def get_transfer_request(transfer_id: int, connection=Depends(get_db)):
+    transfer_request = run_query_one(connection, "transfer_requests.by_id", (transfer_id,))
     
-    try:
-        cursor.execute("""
-            SELECT tr.*, fb.branch_name as from_branch_name, 
-                   tb.branch_name as to_branch_name,
-                   u1.full_name as requested_by_name, 
-                   u2.full_name as approved_by_name
-            FROM transfer_requests tr
-            JOIN branches fb ON tr.from_branch_id = fb.branch_id
-            JOIN branches tb ON tr.to_branch_id = tb.branch_id
-            JOIN users u1 ON tr.requested_by = u1.user_id
-            LEFT JOIN users u2 ON tr.approved_by = u2.user_id
-            WHERE tr.transfer_id = %s
-        """, (transfer_id,))
-        transfer_request = cursor.fetchone()
-        
-        if not transfer_request:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Transfer request not found"
-            )
-            
-        return transfer_request
-    except Error as e:
+    if not transfer_request:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Transfer request not found"
         )
-    finally:
-        cursor.close()
-        connection.close()
+        
+    return transfer_request
 
 # Get transfer request items
 @router.get("/{transfer_id}/items", response_model=List[TransferRequestItemResponse])
-async def get_transfer_request_items(transfer_id: int):
-    connection = get_connection()
-    cursor = connection.cursor(dictionary=True)
-    
-    try:
-        cursor.execute("""
-            SELECT tri.*, i.item_name, i.item_code, i.unit_of_measure,
-                   COALESCE(inv.available_stock, 0) as available_stock
-            FROM transfer_request_items tri
-            JOIN items i ON tri.item_id = i.item_id
-            LEFT JOIN inventory inv ON i.item_id = inv.item_id 
-                AND inv.branch_id = (SELECT from_branch_id FROM transfer_requests WHERE transfer_id = %s)
-            WHERE tri.transfer_id = %s
-        """, (transfer_id, transfer_id))
-        return cursor.fetchall()
-    except Error as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
-        )
-    finally:
-        cursor.close()
-        connection.close()
+def get_transfer_request_items(transfer_id: int, connection=Depends(get_db)):
+    return run_query(connection, "transfer_requests.items", (transfer_id, transfer_id))
 
 # Approve transfer request
 @router.post("/{transfer_id}/approve", response_model=TransferRequestResponse)
-async def approve_transfer_request(
+def approve_transfer_request(
     transfer_id: int, 
     approved_by: int,
-    items: List[TransferRequestItem]  # List of approved quantities
+    items: List[TransferRequestItem],  # List of approved quantities
+    connection=Depends(get_db)
 ):
-    connection = get_connection()
     cursor = connection.cursor(dictionary=True)
     
-    try:
-        # Update transfer request status
-        cursor.execute("""
-            UPDATE transfer_requests 
-            SET status = 'APPROVED', approved_by = %s, approval_date = NOW()
-            WHERE transfer_id = %s AND status = 'PENDING'
-        """, (approved_by, transfer_id))
-        
-        if cursor.rowcount == 0:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Transfer request not found or not pending approval"
-            )
-        
-        # Update approved quantities for items
-        for item in items:
-            cursor.execute("""
-                UPDATE transfer_request_items 
-                SET approved_quantity = %s
-                WHERE transfer_id = %s AND item_id = %s
-            """, (item.requested_quantity, transfer_id, item.item_id))
-        
-        connection.commit()
-        
-        # Return updated transfer request
-        cursor.execute("""
-            SELECT tr.*, fb.branch_name as from_branch_name, 
-                   tb.branch_name as to_branch_name,
-                   u1.full_name as requested_by_name, 
-                   u2.full_name as approved_by_name
-            FROM transfer_requests tr
-            JOIN branches fb ON tr.from_branch_id = fb.branch_id
-            JOIN branches tb ON tr.to_branch_id = tb.branch_id
-            JOIN users u1 ON tr.requested_by = u1.user_id
-            LEFT JOIN users u2 ON tr.approved_by = u2.user_id
-            WHERE tr.transfer_id = %s
-        """, (transfer_id,))
-        return cursor.fetchone()
-    except Error as e:
-        connection.rollback()
+    # Update transfer request status
+    cursor.execute("""
+        UPDATE transfer_requests 
+        SET status = 'APPROVED', approved_by = %s, approval_date = NOW()
+        WHERE transfer_id = %s AND status = 'PENDING'
+    """, (approved_by, transfer_id))
+    
+    if cursor.rowcount == 0:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Transfer request not found or not pending approval"
         )
-    finally:
-        cursor.close()
-        connection.close()
+    
+    # Update approved quantities for items
+    for item in items:
+        cursor.execute("""
+            UPDATE transfer_request_items 
+            SET approved_quantity = %s
+            WHERE transfer_id = %s AND item_id = %s
+        """, (item.requested_quantity, transfer_id, item.item_id))
+    
+    connection.commit()
+    
+    # Return updated transfer request
+    return run_query_one(connection, "transfer_requests.by_id", (transfer_id,))
 
 # Reject transfer request
 @router.post("/{transfer_id}/reject", response_model=TransferRequestResponse)
-async def reject_transfer_request(
+def reject_transfer_request(
     transfer_id: int, 
     approved_by: int,
-    rejection_reason: str
+    rejection_reason: str,
+    connection=Depends(get_db)
 ):
-    connection = get_connection()
     cursor = connection.cursor(dictionary=True)
     
-    try:
-        cursor.execute("""
-            UPDATE transfer_requests 
-            SET status = 'REJECTED', approved_by = %s, 
-                approval_date = NOW(), rejection_reason = %s
-            WHERE transfer_id = %s AND status = 'PENDING'
-        """, (approved_by, rejection_reason, transfer_id))
-        
-        if cursor.rowcount == 0:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Transfer request not found or not pending approval"
-            )
-        
-        connection.commit()
-        
-        # Return updated transfer request
-        cursor.execute("""
-            SELECT tr.*, fb.branch_name as from_branch_name, 
-                   tb.branch_name as to_branch_name,
-                   u1.full_name as requested_by_name, 
-                   u2.full_name as approved_by_name
-            FROM transfer_requests tr
-            JOIN branches fb ON tr.from_branch_id = fb.branch_id
-            JOIN branches tb ON tr.to_branch_id = tb.branch_id
-            JOIN users u1 ON tr.requested_by = u1.user_id
-            LEFT JOIN users u2 ON tr.approved_by = u2.user_id
-            WHERE tr.transfer_id = %s
-        """, (transfer_id,))
-        return cursor.fetchone()
-    except Error as e:
-        connection.rollback()
+    cursor.execute("""
+        UPDATE transfer_requests 
+        SET status = 'REJECTED', approved_by = %s, 
+            approval_date = NOW(), rejection_reason = %s
+        WHERE transfer_id = %s AND status = 'PENDING'
+    """, (approved_by, rejection_reason, transfer_id))
+    
+    if cursor.rowcount == 0:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Transfer request not found or not pending approval"
         )
-    finally:
-        cursor.close()
-        connection.close()
+    
+    connection.commit()
+    
+    # Return updated transfer request
+    return run_query_one(connection, "transfer_requests.by_id", (transfer_id,))
 
 # Cancel transfer request
 @router.post("/{transfer_id}/cancel", response_model=TransferRequestResponse)
-async def cancel_transfer_request(transfer_id: int):
-    connection = get_connection()
+def cancel_transfer_request(transfer_id: int, connection=Depends(get_db)):
     cursor = connection.cursor(dictionary=True)
     
-    try:
-        cursor.execute("""
-            UPDATE transfer_requests 
-            SET status = 'CANCELLED'
-            WHERE transfer_id = %s AND status IN ('PENDING', 'APPROVED')
-        """, (transfer_id,))
-        
-        if cursor.rowcount == 0:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Transfer request not found or cannot be cancelled"
-            )
-        
-        connection.commit()
-        
-        # Return updated transfer request
-        cursor.execute("""
-            SELECT tr.*, fb.branch_name as from_branch_name, 
-                   tb.branch_name as to_branch_name,
-                   u1.full_name as requested_by_name, 
-                   u2.full_name as approved_by_name
-            FROM transfer_requests tr
-            JOIN branches fb ON tr.from_branch_id = fb.branch_id
-            JOIN branches tb ON tr.to_branch_id = tb.branch_id
-            JOIN users u1 ON tr.requested_by = u1.user_id
-            LEFT JOIN users u2 ON tr.approved_by = u2.user_id
-            WHERE tr.transfer_id = %s
-        """, (transfer_id,))
-        return cursor.fetchone()
-    except Error as e:
-        connection.rollback()
+    cursor.execute("""
+        UPDATE transfer_requests 
+        SET status = 'CANCELLED'
+        WHERE transfer_id = %s AND status IN ('PENDING', 'APPROVED')
+    """, (transfer_id,))
+    
+    if cursor.rowcount == 0:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Transfer request not found or cannot be cancelled"
         )
-    finally:
-        cursor.close()
-        connection.close()
\ No newline at end of file
+    
+    connection.commit()
+    
+    # Return updated transfer request
+    return run_query_one(connection, "transfer_requests.by_id", (transfer_id,))
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Header,Query
+from fastapi import APIRouter, HTTPException, status, Depends, Header,Query, Request, Response
 from typing import Optional
-from app.database import get_connection
-from app.models.utility_query import SystemStatisticsResponse,ItemAvailabilityResponse,NextTransferNumberResponse
+from app.database import get_db, open_request_connection
+from app import sequences, stock_matrix
+from app.models.utility_query import SystemStatisticsResponse,ItemAvailabilityResponse,NextTransferNumberResponse,BatchAvailabilityRequest,AvailabilityCheckResult
 from datetime import datetime,date
 from typing import List
 from passlib.context import CryptContext
@@ -13,136 +14,143 @@ router = APIRouter(prefix="/utility_query", tags=["utility_query"], dependencies
 
 # 1. Generate next transfer number
 @router.get("/next-transfer-number", response_model=NextTransferNumberResponse)
-async def get_next_transfer_number():
-    connection = get_connection()
-    cursor = connection.cursor(dictionary=True)
-    
-    try:
-        cursor.execute("SELECT generate_transfer_number() as next_transfer_number")
-        result = cursor.fetchone()
-        
-        if not result:
-            raise HTTPException(
-                status_code=404,
-                detail="Could not generate transfer number"
-            )
-            
-        return result
-        
-    except Error as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Database error: {e}"
-        )
-    finally:
-        cursor.close()
-        connection.close()
+def get_next_transfer_number(connection=Depends(get_db)):
+    # A preview: the number this worker hands out next, unless another request takes it first
+    return {"next_transfer_number": sequences.peek(sequences.TRANSFER, connection)}
 
 # 2. Check item availability before transfer
 @router.get("/check-item-availability", response_model=ItemAvailabilityResponse)
-async def check_item_availability(
+def check_item_availability(
+    request: Request,
+    response: Response,
     item_id: int = Query(..., description="ID of the item to check"),
     branch_id: int = Query(..., description="ID of the branch to check"),
-    required_quantity: int = Query(..., description="Quantity needed for transfer")
+    required_quantity: int = Query(..., description="Quantity needed for transfer"),
 ):
-    connection = get_connection()
-    cursor = connection.cursor(dictionary=True)
-    
-    try:
-        cursor.execute("""
-            SELECT i.item_name, i.item_code, inv.available_stock,
-                   CASE WHEN inv.available_stock >= %s THEN 'AVAILABLE' ELSE 'INSUFFICIENT' END as availability_status
-            FROM items i
-            LEFT JOIN inventory inv ON i.item_id = inv.item_id AND inv.branch_id = %s
-            WHERE i.item_id = %s
-        """, (required_quantity, branch_id, item_id))
-        
-        result = cursor.fetchone()
-        
-        if not result:
-            raise HTTPException(
-                status_code=404,
-                detail="Item not found in specified branch"
-            )
+    matrix = stock_matrix.serving(request, response)
+    if matrix is not None:
+        result = matrix.item_availability(item_id, branch_id, required_quantity)
+    else:
+        with open_request_connection(request) as connection:
+            cursor = connection.cursor(dictionary=True)
+            
+            cursor.execute("""
+                SELECT i.item_name, i.item_code, COALESCE(inv.available_stock, 0) as available_stock,
+                       CASE WHEN COALESCE(inv.available_stock, 0) >= %s THEN 'AVAILABLE' ELSE 'INSUFFICIENT' END as availability_status
+                FROM items i
+                LEFT JOIN inventory inv ON i.item_id = inv.item_id AND inv.branch_id = %s
+                WHERE i.item_id = %s
+            """, (required_quantity, branch_id, item_id))
             
-        return result
+            result = cursor.fetchone()
+    
+    if not result:
+        raise HTTPException(
+            status_code=404,
+            detail="Item not found in specified branch"
+        )
         
-    except Error as e:
+    return result
+
+# 2b. Check availability of many lines at once (e.g. a whole transfer request)
+@router.post("/check-item-availability/batch", response_model=List[AvailabilityCheckResult])
+def check_items_availability(body: BatchAvailabilityRequest, request: Request, response: Response):
+    lines = [(line.item_id, line.branch_id, line.required_quantity) for line in body.lines]
+    matrix = stock_matrix.serving(request, response)
+    if matrix is not None:
+        results = matrix.availability_batch(lines)
+    else:
+        with open_request_connection(request) as connection:
+            results = _availability_batch_sql(connection, lines)
+
+    missing = sorted({line[0] for line, result in zip(lines, results) if result is None})
+    if missing:
         raise HTTPException(
-            status_code=500,
-            detail=f"Database error: {e}"
+            status_code=404,
+            detail=f"Items not found: {', '.join(map(str, missing))}"
         )
-    finally:
-        cursor.close()
-        connection.close()
+    return results
+
+def _availability_batch_sql(connection, lines):
+    # One query for every branch's stock of the requested items; the best
+    # alternate is picked like StockMatrix.availability_batch()
+    item_ids = sorted({item_id for item_id, _, _ in lines})
+    cursor = connection.cursor()
+    cursor.execute(f"""
+        SELECT i.item_id, i.item_name, i.item_code, b.branch_id, b.branch_name, b.is_active,
+               COALESCE(inv.available_stock, 0)
+        FROM items i
+        LEFT JOIN inventory inv ON inv.item_id = i.item_id
+        LEFT JOIN branches b ON b.branch_id = inv.branch_id
+        WHERE i.item_id IN ({', '.join(['%s'] * len(item_ids))})
+        ORDER BY i.item_id, b.branch_id
+    """, tuple(item_ids))
+    items, stock = {}, {}
+    for item_id, item_name, item_code, branch_id, branch_name, is_active, available in cursor.fetchall():
+        items[item_id] = (item_name, item_code)
+        if branch_id is not None:
+            stock.setdefault(item_id, []).append((branch_id, branch_name, bool(is_active), available))
+
+    results = []
+    for item_id, branch_id, required_quantity in lines:
+        if item_id not in items:
+            results.append(None)
+            continue
+        branches = stock.get(item_id, [])
+        available = next((row[3] for row in branches if row[0] == branch_id), 0)
+        alternate = None
+        if available < required_quantity:
+            for row in branches:
+                if row[2] and row[0] != branch_id and row[3] >= required_quantity and (alternate is None or row[3] > alternate[2]):
+                    alternate = (row[0], row[1], row[3])
+        results.append(stock_matrix.availability_line(item_id, branch_id, required_quantity, *items[item_id], available, alternate))
+    return results
 
 # 3. Get system statistics
 @router.get("/system-statistics", response_model=SystemStatisticsResponse)
-async def get_system_statistics():
-    connection = get_connection()
+def get_system_statistics(connection=Depends(get_db)):
     cursor = connection.cursor(dictionary=True)
     
-    try:
-        cursor.execute("""
-            SELECT 
-                (SELECT COUNT(*) FROM branches WHERE is_active = TRUE) as total_branches,
-                (SELECT COUNT(*) FROM users WHERE is_active = TRUE) as total_users,
-                (SELECT COUNT(*) FROM items WHERE is_active = TRUE) as total_items,
-                (SELECT COUNT(*) FROM transfer_requests WHERE status = 'PENDING') as pending_transfers,
-                (SELECT SUM(current_stock) FROM inventory) as total_stock_units
-        """)
-        
-        result = cursor.fetchone()
-        
-        if not result:
-            raise HTTPException(
-                status_code=404,
-                detail="Could not retrieve system statistics"
-            )
-            
-        # Convert None values to 0 for statistics
-        for key in result:
-            if result[key] is None:
-                result[key] = 0
-                
-        return result
-        
-    except Error as e:
+    cursor.execute("""
+        SELECT 
+            (SELECT COUNT(*) FROM branches WHERE is_active = TRUE) as total_branches,
+            (SELECT COUNT(*) FROM users WHERE is_active = TRUE) as total_users,
+            (SELECT COUNT(*) FROM items WHERE is_active = TRUE) as total_items,
+            (SELECT COUNT(*) FROM transfer_requests WHERE status = 'PENDING') as pending_transfers,
+            (SELECT SUM(current_stock) FROM inventory) as total_stock_units
+    """)
+    
+    result = cursor.fetchone()
+    
+    if not result:
         raise HTTPException(
-            status_code=500,
-            detail=f"Database error: {e}"
+            status_code=404,
+            detail="Could not retrieve system statistics"
         )
-    finally:
-        cursor.close()
-        connection.close()
+        
+    # Convert None values to 0 for statistics
+    for key in result:
+        if result[key] is None:
+            result[key] = 0
+            
+    return result
 
 # 4. Database cleanup (Admin-only endpoint)
 @router.delete("/cleanup-system-logs")
-async def cleanup_system_logs(
-    older_than_days: int = Query(365, description="Delete logs older than this many days", ge=1)
+def cleanup_system_logs(
+    older_than_days: int = Query(365, description="Delete logs older than this many days", ge=1),
+    connection=Depends(get_db)
 ):
-    connection = get_connection()
     cursor = connection.cursor()
     
-    try:
-        cursor.execute("""
-            DELETE FROM system_logs 
-            WHERE created_at < DATE_SUB(NOW(), INTERVAL %s DAY)
-        """, (older_than_days,))
-        
-        connection.commit()
-        
-        return {
-            "message": f"Successfully cleaned up system logs older than {older_than_days} days",
-            "rows_affected": cursor.rowcount
-        }
-        
-    except Error as e:
-        connection.rollback()
-        raise HTTPException(
-            status_code=500,
-            detail=f"Database error during cleanup: {e}"
-        )
-    finally:
-        cursor.close()
-        connection.close()
\ No newline at end of file
+    cursor.execute("""
+        DELETE FROM system_logs 
+        WHERE created_at < DATE_SUB(NOW(), INTERVAL %s DAY)
+    """, (older_than_days,))
+    
+    connection.commit()
+    
+    return {
+        "message": f"Successfully cleaned up system logs older than {older_than_days} days",
+        "rows_affected": cursor.rowcount
+    }
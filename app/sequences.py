@@ -0,0 +1,124 @@
+"""Document numbers (TR-/DS-/RS-YYYYMMDD-NNNN) from per-day counters.
+
+generate_transfer_number() and the dispatch/receiving COUNT(*) numbering
+scanned the document tables for today's highest number, and two concurrent
+creates could compute the same one and collide on the unique key. Here each
+(prefix, day) has a row in document_sequences (migrations/0008). A worker
+takes DOCUMENT_NUMBER_BLOCK numbers at a time with one UPDATE ...
+LAST_INSERT_ID(next_value + n) on its own connection, committed at once so
+the row lock is never held by a document's transaction, and hands them out
+from memory.
+Blocks never overlap, so numbers are unique across workers; they are
+increasing per worker but may interleave between workers, and numbers left
+in a worker's block when it stops are skipped.
+
+The first block of a day seeds the counter from the highest number already
+issued that day, so numbers handed out before this allocator are not reused.
+"""
+import threading
+from datetime import datetime
+
+from app import config, retry
+from app.database import get_aux_connection
+
+TRANSFER = "TR"
+DISPATCH = "DS"
+RECEIVING = "RS"
+
+# Where each prefix's numbers are stored, for seeding a new day's counter
+_DOCUMENTS = {
+    TRANSFER: ("transfer_requests", "transfer_number"),
+    DISPATCH: ("dispatch_slips", "dispatch_number"),
+    RECEIVING: ("receiving_slips", "receiving_number"),
+}
+
+_blocks = {}  # prefix -> [day, next number, end of block (exclusive)]
+# One lock per prefix, held while a block is allocated, so TR, DS and RS never wait on each other
+_locks = {prefix: threading.Lock() for prefix in _DOCUMENTS}
+
+
+def _seed(cursor, prefix, day):
+    # First number of a day without a counter row: after the highest number already issued that day
+    table, column = _DOCUMENTS[prefix]
+    cursor.execute(
+        f"SELECT COALESCE(MAX(CAST(SUBSTRING({column}, -4) AS UNSIGNED)), 0) + 1 FROM {table} WHERE {column} LIKE %s",
+        (f"{prefix}-{day}-%",),
+    )
+    return cursor.fetchone()[0]
+
+
+def _allocate(prefix, day, size):
+    """First number of a fresh block of `size` numbers for prefix and day (YYYYMMDD)."""
+    connection = get_aux_connection()
+    try:
+        connection.route = "document-sequences"
+        cursor = connection.cursor()
+        seq_date = datetime.strptime(day, "%Y%m%d").date()
+        cursor.execute(
+            """UPDATE document_sequences SET next_value = LAST_INSERT_ID(next_value + %s)
+            WHERE prefix = %s AND seq_date = %s""",
+            (size, prefix, seq_date),
+        )
+        if cursor.rowcount == 0:
+            first = _seed(cursor, prefix, day)
+            cursor.execute(
+                """INSERT INTO document_sequences (prefix, seq_date, next_value)
+                VALUES (%s, %s, LAST_INSERT_ID(%s))
+                ON DUPLICATE KEY UPDATE next_value = LAST_INSERT_ID(next_value + %s)""",
+                (prefix, seq_date, first + size, size),
+            )
+        cursor.execute("SELECT LAST_INSERT_ID()")
+        end = cursor.fetchone()[0]
+        connection.commit()
+        return end - size
+    finally:
+        connection.close()
+
+
+def _block(prefix, day, wanted):
+    # This worker's block for prefix and day, with at least `wanted` numbers left; caller holds _locks[prefix]
+    block = _blocks.get(prefix)
+    if block is None or block[0] != day or block[2] - block[1] < wanted:
+        # Whatever is left of the old block is skipped
+        size = max(config.DOCUMENT_NUMBER_BLOCK, wanted)
+        first = retry.run(lambda: _allocate(prefix, day, size), route="document-sequences")
+        block = _blocks[prefix] = [day, first, first + size]
+    return block
+
+
+def _format(prefix, day, number):
+    return f"{prefix}-{day}-{str(number).zfill(4)}"
+
+
+def next_number(prefix):
+    """The next document number for prefix (TRANSFER, DISPATCH or RECEIVING), e.g. TR-20260101-0001."""
+    return next_numbers(prefix, 1)[0]
+
+
+def next_numbers(prefix, count):
+    """`count` consecutive document numbers for prefix, taken with at most one counter update."""
+    day = datetime.now().strftime("%Y%m%d")
+    with _locks[prefix]:
+        block = _block(prefix, day, count)
+        first = block[1]
+        block[1] += count
+    return [_format(prefix, day, number) for number in range(first, first + count)]
+
+
+def peek(prefix, connection):
+    """The number next_number(prefix) would return in this worker; reads only, never allocates.
+
+    With no numbers left in this worker's block, that is where the next
+    block would start, read from the counter row on `connection`.
+    """
+    day = datetime.now().strftime("%Y%m%d")
+    block = _blocks.get(prefix)
+    if block is not None and block[0] == day and block[1] < block[2]:
+        return _format(prefix, day, block[1])
+    cursor = connection.cursor()
+    cursor.execute(
+        "SELECT next_value FROM document_sequences WHERE prefix = %s AND seq_date = %s",
+        (prefix, datetime.strptime(day, "%Y%m%d").date()),
+    )
+    row = cursor.fetchone()
+    return _format(prefix, day, row[0] if row else _seed(cursor, prefix, day))
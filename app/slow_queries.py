@@ -0,0 +1,146 @@
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+
+import mysql.connector
+
+from app import config
+
+logger = logging.getLogger(__name__)
+
+# Only these can be EXPLAINed without running them
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH")
+
+_entries = deque(maxlen=config.SLOW_QUERY_BUFFER_SIZE)
+_lock = threading.Lock()
+_plans = OrderedDict()  # sql -> {"plan": [...], "pool": name, "explained_at": epoch seconds}, least recently used first
+_explain_queue = queue.Queue(maxsize=config.SLOW_QUERY_EXPLAIN_QUEUE_SIZE)
+_worker = None
+
+
+def _params_repr(params):
+    if not config.SLOW_QUERY_LOG_PARAMS:
+        return None
+    text = repr(params)
+    return text if len(text) <= 500 else text[:500] + "..."
+
+
+def record(route, statement, operation, params, duration, explain=True, pool=None):
+    """Store a statement that took at least SLOW_QUERY_THRESHOLD seconds.
+
+    Returns the entry so the caller can fill in `rows` as they are fetched.
+    The EXPLAIN runs later on a background thread, on its own connection from
+    `pool`, the pool the statement ran on (a replica's plan and statistics
+    can differ from the primary's).
+    """
+    if isinstance(operation, (bytes, bytearray)):
+        operation = operation.decode("utf-8", "replace")
+    entry = {
+        "recorded_at": time.time(),
+        "route": route,
+        "pool": pool.name if pool is not None else None,
+        "statement": statement,
+        "sql": " ".join(operation.split()),
+        "params": _params_repr(params),
+        "duration_seconds": round(duration, 6),
+        "rows": None,
+    }
+    with _lock:
+        _entries.append(entry)
+    logger.warning(
+        "Slow query %.3fs on %s [%s]: %s params=%s",
+        duration, route, statement, entry["sql"], entry["params"],
+    )
+    if explain and config.SLOW_QUERY_EXPLAIN and entry["sql"].split(" ", 1)[0].upper() in _EXPLAINABLE:
+        _schedule_explain(operation, params, pool)
+    return entry
+
+
+def _fresh_plan(sql):
+    # Caller holds _lock
+    plan = _plans.get(sql)
+    if plan is None:
+        return False
+    _plans.move_to_end(sql)
+    return time.time() - plan["explained_at"] < config.SLOW_QUERY_EXPLAIN_INTERVAL
+
+
+def _schedule_explain(operation, params, pool):
+    global _worker
+    sql = " ".join(operation.split())
+    with _lock:
+        if _fresh_plan(sql):
+            return
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_explain_loop, name="slow-query-explain", daemon=True)
+            _worker.start()
+    try:
+        _explain_queue.put_nowait((sql, operation, params, pool))
+    except queue.Full:
+        pass  # never make the request path wait on diagnostics
+
+
+def _explain_loop():
+    # Imported here: app.database imports this module for its cursor hook
+    from app.database import get_pool, PoolTimeoutError
+
+    while True:
+        sql, operation, params, pool = _explain_queue.get()
+        with _lock:
+            if _fresh_plan(sql):
+                continue
+        if pool is None:
+            pool = get_pool()
+        try:
+            connection = pool.connect()
+        except (PoolTimeoutError, mysql.connector.Error):
+            continue
+        try:
+            connection.track_slow_queries = False
+            connection.route = "slow-query-explain"
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute("EXPLAIN " + operation, params or ())
+            rows = cursor.fetchall()
+        except mysql.connector.Error as err:
+            rows = [{"error": str(err)}]
+        finally:
+            connection.close()
+        with _lock:
+            _plans[sql] = {"plan": rows, "pool": pool.name, "explained_at": time.time()}
+            _plans.move_to_end(sql)
+            while len(_plans) > config.SLOW_QUERY_PLAN_CACHE_SIZE:
+                _plans.popitem(last=False)
+        logger.warning("EXPLAIN on %s for slow query %s: %s", pool.name, sql, rows)
+
+
+def worst(limit=20):
+    """Slowest captured statements, one per distinct SQL text, with their latest EXPLAIN.
+
+    "pool" is where the slowest run happened, "explain_pool" where the plan was taken.
+    """
+    with _lock:
+        entries = list(_entries)
+        plans = dict(_plans)
+    by_sql = {}
+    for entry in entries:
+        current = by_sql.get(entry["sql"])
+        if current is None:
+            by_sql[entry["sql"]] = current = dict(entry, occurrences=0)
+        elif entry["duration_seconds"] > current["duration_seconds"]:
+            occurrences = current["occurrences"]
+            by_sql[entry["sql"]] = current = dict(entry, occurrences=occurrences)
+        current["occurrences"] += 1
+    result = sorted(by_sql.values(), key=lambda entry: entry["duration_seconds"], reverse=True)[:limit]
+    for entry in result:
+        plan = plans.get(entry["sql"])
+        entry["explain"] = plan["plan"] if plan else None
+        entry["explain_pool"] = plan["pool"] if plan else None
+    return result
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+        _plans.clear()
@@ -0,0 +1,151 @@
+"""Point-in-time branch stock from stored snapshots and the new_stock chain.
+
+Every stock_movements row records the pair's stock after it (new_stock), so
+the stock of an item at time T is the new_stock of its last movement at or
+before T. stock_snapshots (migrations/0005) stores a whole branch's stock at
+one instant; to answer "as of T" we start from the branch's latest snapshot
+at or before T and apply only the movements between the two. That window has
+constant bounds, so it is one range scan on idx_sm_branch_created and prunes
+stock_movements partitions.
+
+A snapshot of each branch is taken every SNAPSHOT_INTERVAL seconds, at
+CHECKPOINT_SETTLE_SECONDS in the past so in-flight movements have committed.
+"""
+import logging
+import threading
+
+import mysql.connector
+
+from app import config
+from app.database import PoolTimeoutError, get_pool
+
+logger = logging.getLogger(__name__)
+
+# Named lock so only one app worker takes snapshots at a time
+_LOCK_NAME = "stock_snapshots"
+# Rows per multi-row INSERT when writing a snapshot
+_INSERT_CHUNK = 1000
+
+_worker = None
+_stop = threading.Event()
+
+
+def _latest_snapshot(cursor, branch_id, as_of):
+    cursor.execute(
+        "SELECT MAX(snapshot_at) FROM stock_snapshots WHERE branch_id = %s AND snapshot_at <= %s",
+        (branch_id, as_of),
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def stock_as_of(connection, branch_id, as_of):
+    """({item_id: stock}, snapshot_at used or None) for a branch at `as_of`.
+
+    Items with no movement at or before `as_of` are left out (their stock was 0).
+    """
+    cursor = connection.cursor()
+    snapshot_at = _latest_snapshot(cursor, branch_id, as_of)
+    if snapshot_at is None:
+        # No snapshot that early: the last movement's new_stock, one index dive
+        # (idx_sm_item_branch_created) per item. Driven by items, not inventory,
+        # so stock that had moved before an inventory row existed (or after it
+        # was deleted) is still found; items are only ever deactivated.
+        cursor.execute("""
+            SELECT i.item_id, (
+                SELECT sm.new_stock FROM stock_movements sm
+                WHERE sm.item_id = i.item_id AND sm.branch_id = %s
+                  AND sm.created_at <= %s
+                ORDER BY sm.created_at DESC, sm.movement_id DESC
+                LIMIT 1
+            )
+            FROM items i
+        """, (branch_id, as_of))
+        return {item_id: stock for item_id, stock in cursor.fetchall() if stock is not None}, None
+
+    cursor.execute(
+        "SELECT item_id, stock FROM stock_snapshots WHERE branch_id = %s AND snapshot_at = %s",
+        (branch_id, snapshot_at),
+    )
+    stock = dict(cursor.fetchall())
+    cursor.execute("""
+        SELECT sm.item_id, sm.new_stock
+        FROM stock_movements sm
+        WHERE sm.branch_id = %s AND sm.created_at > %s AND sm.created_at <= %s
+        ORDER BY sm.created_at, sm.movement_id
+    """, (branch_id, snapshot_at, as_of))
+    for item_id, new_stock in cursor.fetchall():
+        stock[item_id] = new_stock
+    return stock, snapshot_at
+
+
+def take_snapshots(connection, branch_id=None):
+    """Snapshot each branch (or one) as of CHECKPOINT_SETTLE_SECONDS ago; returns rows written."""
+    cursor = connection.cursor()
+    cursor.execute("SELECT NOW() - INTERVAL %s SECOND", (config.CHECKPOINT_SETTLE_SECONDS,))
+    snapshot_at = cursor.fetchone()[0]
+    if branch_id is None:
+        cursor.execute("SELECT branch_id FROM branches ORDER BY branch_id")
+        branch_ids = [row[0] for row in cursor.fetchall()]
+    else:
+        branch_ids = [branch_id]
+    written = 0
+    for current in branch_ids:
+        stock, _ = stock_as_of(connection, current, snapshot_at)
+        rows = list(stock.items())
+        for start in range(0, len(rows), _INSERT_CHUNK):
+            chunk = rows[start:start + _INSERT_CHUNK]
+            cursor.execute(
+                "INSERT IGNORE INTO stock_snapshots (branch_id, snapshot_at, item_id, stock) VALUES "
+                + ", ".join(["(%s, %s, %s, %s)"] * len(chunk)),
+                tuple(value for item_id, item_stock in chunk for value in (current, snapshot_at, item_id, item_stock)),
+            )
+            written += cursor.rowcount
+        connection.commit()
+    return written
+
+
+def run_snapshots():
+    """One take_snapshots() pass on its own connection; logs instead of raising."""
+    try:
+        connection = get_pool().connect()
+    except (PoolTimeoutError, mysql.connector.Error) as err:
+        logger.warning("Skipped stock snapshots, database unavailable: %s", err)
+        return None
+    try:
+        connection.route = "stock-snapshots"
+        cursor = connection.cursor()
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (_LOCK_NAME,))
+        if cursor.fetchone()[0] != 1:
+            return None  # another worker is on it
+        try:
+            written = take_snapshots(connection)
+            logger.info("Wrote %d stock snapshot rows", written)
+            return written
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (_LOCK_NAME,))
+            cursor.fetchall()
+    except mysql.connector.Error as err:
+        logger.warning("Stock snapshots failed: %s", err)
+    finally:
+        connection.close()
+    return None
+
+
+def start_snapshots():
+    """Snapshot every SNAPSHOT_INTERVAL seconds (0 disables)."""
+    global _worker
+    if config.SNAPSHOT_INTERVAL <= 0 or (_worker is not None and _worker.is_alive()):
+        return
+    _stop.clear()
+    _worker = threading.Thread(target=_snapshot_loop, name="stock-snapshots", daemon=True)
+    _worker.start()
+
+
+def _snapshot_loop():
+    while not _stop.wait(config.SNAPSHOT_INTERVAL):
+        run_snapshots()
+
+
+def stop_snapshots():
+    _stop.set()
@@ -0,0 +1,139 @@
+"""Set-based stock mutations.
+
+apply_movements() is the multi-line counterpart of the update_stock stored
+procedure. update_stock locks, writes and commits one (item, branch) pair per
+call, so a document with N lines took N transactions and could stop halfway.
+Here every line of a document is applied in the caller's transaction:
+
+1. one SELECT ... FOR UPDATE locks every affected inventory row, in
+   (item_id, branch_id) order, so two documents touching overlapping rows
+   queue behind each other instead of deadlocking;
+2. the new stock of each pair is computed in Python (several lines for the
+   same pair apply in order) and nothing is written if any would go negative;
+3. one multi-row INSERT ... ON DUPLICATE KEY UPDATE writes the inventory rows;
+4. one multi-row INSERT writes a stock_movements row per line.
+
+Nothing is committed; the caller commits the document as a whole.
+"""
+from app.database import check_insert_ids
+
+# Sign of each movement type's quantity, as in ledger.SIGNED_QUANTITY
+# (ADJUSTMENT quantities are already signed)
+_SIGN = {"IN": 1, "TRANSFER_IN": 1, "OUT": -1, "TRANSFER_OUT": -1, "ADJUSTMENT": 1}
+
+
+class InsufficientStockError(Exception):
+    """A movement would take an (item, branch) pair below zero stock."""
+
+    def __init__(self, shortages):
+        self.shortages = shortages  # [(item_id, branch_id, stock available to the line, line quantity)]
+        super().__init__("Insufficient stock for " + ", ".join(
+            f"item {item_id} at branch {branch_id} ({stock} available, {quantity} requested)"
+            for item_id, branch_id, stock, quantity in shortages
+        ))
+
+
+def lock(connection, pairs):
+    """Lock the inventory rows of (item_id, branch_id) pairs; returns {pair: current_stock}.
+
+    Pairs without an inventory row are left out (their stock is 0).
+    """
+    pairs = sorted(set(pairs))
+    if not pairs:
+        return {}
+    cursor = connection.cursor()
+    cursor.execute(
+        f"""SELECT item_id, branch_id, current_stock FROM inventory
+        WHERE (item_id, branch_id) IN ({", ".join(["(%s, %s)"] * len(pairs))})
+        ORDER BY item_id, branch_id
+        FOR UPDATE""",
+        tuple(value for pair in pairs for value in pair),
+    )
+    return {(item_id, branch_id): stock for item_id, branch_id, stock in cursor.fetchall()}
+
+
+def apply_movements(connection, lines, reference_type, reference_id, user_id, notes=None):
+    """Apply (item_id, branch_id, movement_type, quantity) lines of one document; doesn't commit.
+
+    Returns one dict per line with its previous_stock, new_stock and
+    movement_id. Raises InsufficientStockError before writing anything if a
+    line would leave negative stock.
+    """
+    return apply_lines(connection, [
+        {
+            "item_id": item_id,
+            "branch_id": branch_id,
+            "movement_type": movement_type,
+            "quantity": quantity,
+            "reference_type": reference_type,
+            "reference_id": reference_id,
+            "user_id": user_id,
+            "notes": notes,
+        }
+        for item_id, branch_id, movement_type, quantity in lines
+    ])
+
+
+def apply_lines(connection, lines):
+    """apply_movements() for lines that each carry their own reference, user and notes.
+
+    A line is a dict with item_id, branch_id, movement_type, quantity,
+    reference_type, reference_id, user_id and notes. An ADJUSTMENT line may
+    give set_stock instead of quantity to move the pair to that level; its
+    quantity is then the difference from the stock before it.
+    """
+    lines = list(lines)
+    if not lines:
+        return []
+    stock = lock(connection, [(line["item_id"], line["branch_id"]) for line in lines])
+
+    results, shortages, updated_by = [], [], {}
+    for line in lines:
+        pair = (line["item_id"], line["branch_id"])
+        previous = stock.get(pair, 0)
+        if line.get("set_stock") is not None:
+            quantity = line["set_stock"] - previous
+            new = line["set_stock"]
+        else:
+            quantity = line["quantity"]
+            new = previous + _SIGN[line["movement_type"]] * quantity
+        if new < 0:
+            shortages.append((*pair, previous, quantity))
+        stock[pair] = new
+        updated_by[pair] = line["user_id"]
+        results.append({
+            "item_id": line["item_id"],
+            "branch_id": line["branch_id"],
+            "movement_type": line["movement_type"],
+            "quantity": quantity,
+            "previous_stock": previous,
+            "new_stock": new,
+        })
+    if shortages:
+        raise InsufficientStockError(shortages)
+
+    check_insert_ids(connection)
+    cursor = connection.cursor()
+    final = sorted(updated_by)
+    cursor.execute(
+        f"""INSERT INTO inventory (item_id, branch_id, current_stock, updated_by)
+        VALUES {", ".join(["(%s, %s, %s, %s)"] * len(final))}
+        ON DUPLICATE KEY UPDATE current_stock = VALUES(current_stock), updated_by = VALUES(updated_by)""",
+        tuple(value for pair in final for value in (*pair, stock[pair], updated_by[pair])),
+    )
+    cursor.execute(
+        f"""INSERT INTO stock_movements (item_id, branch_id, movement_type, quantity,
+            previous_stock, new_stock, reference_type, reference_id, notes, created_by)
+        VALUES {", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"] * len(results))}""",
+        tuple(
+            value for line, row in zip(lines, results) for value in (
+                row["item_id"], row["branch_id"], row["movement_type"], row["quantity"],
+                row["previous_stock"], row["new_stock"], line["reference_type"], line["reference_id"],
+                line["notes"], line["user_id"],
+            )
+        ),
+    )
+    # A multi-row VALUES insert gets consecutive auto-increment ids (see check_insert_ids)
+    for position, row in enumerate(results):
+        row["movement_id"] = cursor.lastrowid + position
+    return results
@@ -0,0 +1,363 @@
+"""In-memory item x branch stock matrix for the hot inventory reads.
+
+Current and reserved stock for every (item, branch) are held in NumPy arrays
+next to the item and branch master data the inventory endpoints return. A
+background thread loads everything at startup and then, every
+STOCK_MATRIX_REFRESH_INTERVAL seconds, re-reads only inventory rows whose
+last_updated passed the previous refresh (idx_inventory_last_updated, migration
+0006). The re-read window starts STOCK_MATRIX_OVERLAP_SECONDS early so a
+transaction that commits slightly after its rows were stamped isn't missed.
+Items and branches are reloaded in full every STOCK_MATRIX_RELOAD_INTERVAL
+seconds, or right away after request_reload().
+
+Endpoints call serving() and fall back to SQL when the matrix isn't loaded,
+its last refresh is older than STOCK_MATRIX_MAX_STALENESS, or the client's last
+write (the read-after-write cookie) is newer than that refresh. Responses served from memory carry the
+age of the data in X-Stock-Staleness-Seconds.
+"""
+import logging
+import threading
+import time
+
+import numpy as np
+
+from app import config
+from app.database import get_pool, last_write_at
+
+logger = logging.getLogger(__name__)
+
+STALENESS_HEADER = "X-Stock-Staleness-Seconds"
+
+_matrix = None
+_lock = threading.Lock()  # guards the arrays of _matrix, which are updated in place
+_reload = threading.Event()
+_stop = threading.Event()
+_worker = None
+
+
+def _status(available, minimum):
+    if available == 0:
+        return "OUT_OF_STOCK"
+    if available <= minimum:
+        return "LOW_STOCK"
+    return "NORMAL"
+
+
+class StockMatrix:
+    def __init__(self, items, branches, inventory, loaded_at, refreshed_at):
+        self.item_ids = np.array([row["item_id"] for row in items], dtype=np.int64)
+        self.item_index = {item_id: index for index, item_id in enumerate(self.item_ids.tolist())}
+        self.item_name = [row["item_name"] for row in items]
+        self.item_code = [row["item_code"] for row in items]
+        self.category_name = [row["category_name"] for row in items]
+        # NaN for a NULL minimum: like NULL in SQL it never compares true, so the item is never LOW_STOCK
+        self.minimum = np.array(
+            [np.nan if row["minimum_stock_level"] is None else row["minimum_stock_level"] for row in items],
+            dtype=np.float64,
+        )
+        self.item_active = np.array([bool(row["is_active"]) for row in items], dtype=bool)
+        # MySQL's general_ci collation is case-insensitive; casefold() is close enough for ORDER BY name
+        self.item_order = np.array(sorted(range(len(items)), key=lambda index: self.item_name[index].casefold()), dtype=np.int64)
+
+        self.branch_ids = np.array([row["branch_id"] for row in branches], dtype=np.int64)
+        self.branch_index = {branch_id: index for index, branch_id in enumerate(self.branch_ids.tolist())}
+        self.branch_name = [row["branch_name"] for row in branches]
+        self.branch_code = [row["branch_code"] for row in branches]
+        self.branch_active = np.array([bool(row["is_active"]) for row in branches], dtype=bool)
+        self.branch_order = np.array(sorted(range(len(branches)), key=lambda index: self.branch_name[index].casefold()), dtype=np.int64)
+
+        shape = (len(items), len(branches))
+        self.current = np.zeros(shape, dtype=np.int64)
+        self.reserved = np.zeros(shape, dtype=np.int64)
+        self.present = np.zeros(shape, dtype=bool)  # an inventory row exists
+        self.last_updated = np.full(shape, None, dtype=object)
+        self.loaded_at = loaded_at
+        self.refreshed_at = refreshed_at
+        self.apply(inventory)
+
+    def _minimum(self, index):
+        minimum = self.minimum[index]
+        return None if np.isnan(minimum) else int(minimum)
+
+    def apply(self, rows):
+        """Write inventory rows into the arrays; returns False if one names an unknown item or branch."""
+        known = True
+        for item_id, branch_id, current, reserved, last_updated in rows:
+            item = self.item_index.get(item_id)
+            branch = self.branch_index.get(branch_id)
+            if item is None or branch is None:
+                known = False
+                continue
+            self.current[item, branch] = current
+            self.reserved[item, branch] = reserved
+            self.present[item, branch] = True
+            self.last_updated[item, branch] = last_updated
+        return known
+
+    # Readers: same rows, order and fallbacks as the SQL in routers/inventory.py and utility_query.py
+
+    def branch_stock(self, branch_id):
+        with _lock:
+            branch = self.branch_index.get(branch_id)
+            order = self.item_order[self.item_active[self.item_order]]
+            if branch is None:
+                current = reserved = np.zeros(len(order), dtype=np.int64)
+                last_updated = [None] * len(order)
+            else:
+                current = self.current[order, branch]
+                reserved = self.reserved[order, branch]
+                last_updated = self.last_updated[order, branch].tolist()
+        available = current - reserved
+        return [
+            {
+                "item_id": int(self.item_ids[index]),
+                "item_name": self.item_name[index],
+                "item_code": self.item_code[index],
+                "category_name": self.category_name[index],
+                "current_stock": int(current[position]),
+                "reserved_stock": int(reserved[position]),
+                "available_stock": int(available[position]),
+                "minimum_stock_level": self._minimum(index),
+                "stock_status": _status(available[position], self.minimum[index]),
+                "last_updated": last_updated[position],
+            }
+            for position, index in enumerate(order.tolist())
+        ]
+
+    def low_stock(self, branch_id):
+        branch = self.branch_index.get(branch_id)
+        if branch is None:
+            return []
+        with _lock:
+            available = self.current[:, branch] - self.reserved[:, branch]
+            mask = self.present[:, branch] & self.item_active & (available <= self.minimum)
+        indexes = np.flatnonzero(mask)
+        shortage = self.minimum[indexes] - available[indexes]
+        indexes = indexes[np.argsort(-shortage, kind="stable")]
+        return [
+            {
+                "item_name": self.item_name[index],
+                "item_code": self.item_code[index],
+                "available_stock": int(available[index]),
+                "minimum_stock_level": int(self.minimum[index]),
+                "shortage": int(self.minimum[index] - available[index]),
+            }
+            for index in indexes.tolist()
+        ]
+
+    def out_of_stock(self, branch_id):
+        branch = self.branch_index.get(branch_id)
+        order = self.item_order[self.item_active[self.item_order]]
+        if branch is not None:
+            with _lock:
+                available = self.current[order, branch] - self.reserved[order, branch]
+                present = self.present[order, branch]
+            order = order[~present | (available == 0)]
+        return [
+            {
+                "item_name": self.item_name[index],
+                "item_code": self.item_code[index],
+                "minimum_stock_level": self._minimum(index),
+            }
+            for index in order.tolist()
+        ]
+
+    def item_across_branches(self, item_id):
+        item = self.item_index.get(item_id)
+        if item is None:
+            return []
+        order = self.branch_order[self.branch_active[self.branch_order]]
+        with _lock:
+            current = self.current[item, order]
+            available = current - self.reserved[item, order]
+        return [
+            {
+                "item_name": self.item_name[item],
+                "item_code": self.item_code[item],
+                "branch_name": self.branch_name[index],
+                "branch_code": self.branch_code[index],
+                "current_stock": int(current[position]),
+                "available_stock": int(available[position]),
+            }
+            for position, index in enumerate(order.tolist())
+        ]
+
+    def item_availability(self, item_id, branch_id, required_quantity):
+        item = self.item_index.get(item_id)
+        if item is None:
+            return None
+        branch = self.branch_index.get(branch_id)
+        available = 0
+        if branch is not None:
+            with _lock:
+                available = int(self.current[item, branch] - self.reserved[item, branch])
+        return {
+            "item_name": self.item_name[item],
+            "item_code": self.item_code[item],
+            "available_stock": available,
+            "availability_status": "AVAILABLE" if available >= required_quantity else "INSUFFICIENT",
+        }
+
+    def availability_batch(self, lines):
+        """item_availability() for many (item_id, branch_id, required_quantity) lines at once.
+
+        Each short line also gets the active branch with the most available
+        stock that covers it (lowest branch_id on ties), or None. Unknown
+        items give None in place of the line's result.
+        """
+        items = [self.item_index.get(item_id) for item_id, _, _ in lines]
+        known = [position for position, item in enumerate(items) if item is not None]
+        rows = np.array([items[position] for position in known], dtype=np.int64)
+        with _lock:
+            available = self.current[rows] - self.reserved[rows]  # known lines x branches
+        candidates = np.where(self.branch_active, available, -1)
+        own = np.zeros(len(known), dtype=np.int64)
+        for line, position in enumerate(known):
+            branch = self.branch_index.get(lines[position][1])
+            if branch is not None:
+                own[line] = available[line, branch]
+                candidates[line, branch] = -1  # never suggest the branch itself
+        best = candidates.argmax(axis=1) if len(self.branch_ids) else np.zeros(len(known), dtype=np.int64)
+
+        results = [None] * len(lines)
+        for line, position in enumerate(known):
+            item_id, branch_id, required_quantity = lines[position]
+            item = items[position]
+            alternate = None
+            if own[line] < required_quantity and len(self.branch_ids) and candidates[line, best[line]] >= required_quantity:
+                alternate = int(best[line])
+            results[position] = availability_line(
+                item_id, branch_id, required_quantity, self.item_name[item], self.item_code[item], int(own[line]),
+                None if alternate is None else (
+                    int(self.branch_ids[alternate]), self.branch_name[alternate], int(candidates[line, alternate])
+                ),
+            )
+        return results
+
+
+def availability_line(item_id, branch_id, required_quantity, item_name, item_code, available, alternate):
+    """One line of a batch availability answer; `alternate` is (branch_id, branch_name, available) or None."""
+    alternate_id, alternate_name, alternate_available = alternate or (None, None, None)
+    return {
+        "item_id": item_id,
+        "branch_id": branch_id,
+        "required_quantity": required_quantity,
+        "item_name": item_name,
+        "item_code": item_code,
+        "available_stock": available,
+        "availability_status": "AVAILABLE" if available >= required_quantity else "INSUFFICIENT",
+        "alternate_branch_id": alternate_id,
+        "alternate_branch_name": alternate_name,
+        "alternate_available_stock": alternate_available,
+    }
+
+
+def _db_now(cursor):
+    cursor.execute("SELECT NOW()")
+    return cursor.fetchone()[0]
+
+
+def _inventory_since(cursor, since):
+    if since is None:
+        cursor.execute("SELECT item_id, branch_id, current_stock, reserved_stock, last_updated FROM inventory")
+    else:
+        cursor.execute(
+            """SELECT item_id, branch_id, current_stock, reserved_stock, last_updated
+            FROM inventory WHERE last_updated >= %s - INTERVAL %s SECOND""",
+            (since, config.STOCK_MATRIX_OVERLAP_SECONDS),
+        )
+    return cursor.fetchall()
+
+
+def _load(connection):
+    started = time.time()
+    db_now = _db_now(connection.cursor())
+    cursor = connection.cursor(dictionary=True)
+    cursor.execute("""
+        SELECT i.item_id, i.item_name, i.item_code, c.category_name,
+               i.minimum_stock_level, i.is_active
+        FROM items i
+        JOIN categories c ON i.category_id = c.category_id
+    """)
+    items = cursor.fetchall()
+    cursor.execute("SELECT branch_id, branch_name, branch_code, is_active FROM branches ORDER BY branch_id")
+    branches = cursor.fetchall()
+    inventory = _inventory_since(connection.cursor(), None)
+    return StockMatrix(items, branches, inventory, started, started), db_now
+
+
+def _refresh_loop():
+    global _matrix
+    db_watermark = None
+    while not _stop.is_set():
+        try:
+            connection = get_pool().connect()
+        except Exception as err:
+            logger.warning("Stock matrix refresh skipped, database unavailable: %s", err)
+            _stop.wait(config.STOCK_MATRIX_REFRESH_INTERVAL)
+            continue
+        try:
+            connection.route = "stock-matrix"
+            matrix = _matrix
+            if (
+                matrix is None
+                or _reload.is_set()
+                or time.time() - matrix.loaded_at >= config.STOCK_MATRIX_RELOAD_INTERVAL
+            ):
+                _reload.clear()
+                loaded, db_watermark = _load(connection)
+                _matrix = loaded
+            else:
+                cursor = connection.cursor()
+                started = time.time()
+                db_now = _db_now(cursor)
+                rows = _inventory_since(cursor, db_watermark)
+                with _lock:
+                    known = matrix.apply(rows)
+                if known:
+                    matrix.refreshed_at = started
+                    db_watermark = db_now
+                else:
+                    _reload.set()  # a new item or branch; pick it up with a full load
+            connection.commit()  # end the snapshot so the next pass sees new commits
+        except Exception:
+            logger.exception("Stock matrix refresh failed")
+        finally:
+            connection.close()
+        if not _reload.is_set():
+            _reload.wait(config.STOCK_MATRIX_REFRESH_INTERVAL)
+
+
+def request_reload():
+    """Reload items and branches on the next pass, e.g. after one was created or changed."""
+    _reload.set()
+
+
+def serving(request, response):
+    """The matrix if it may answer this request (and sets the staleness header), else None."""
+    matrix = _matrix
+    if matrix is None:
+        return None
+    # Read-after-write: the client's last write may not be in the arrays yet
+    last_write = last_write_at(request)
+    if last_write is not None and last_write >= matrix.refreshed_at:
+        return None
+    age = time.time() - matrix.refreshed_at
+    if age > config.STOCK_MATRIX_MAX_STALENESS:
+        return None
+    response.headers[STALENESS_HEADER] = f"{age:.3f}"
+    return matrix
+
+
+def start():
+    global _worker
+    if not config.STOCK_MATRIX_ENABLED or (_worker is not None and _worker.is_alive()):
+        return
+    _stop.clear()
+    _worker = threading.Thread(target=_refresh_loop, name="stock-matrix", daemon=True)
+    _worker.start()
+
+
+def stop():
+    _stop.set()
+    _reload.set()  # wake the loop so it sees _stop
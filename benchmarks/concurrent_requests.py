@@ -0,0 +1,83 @@
+"""Concurrent-request throughput benchmark.
+
+Fires a mix of slow report calls and cheap lookups at a running server and
+prints throughput and latency percentiles per endpoint. Run it once against
+a server started from the commit before the non-blocking handler change and
+once against the current tree to compare:
+
+    uvicorn app.main:app --workers 1 &
+    python benchmarks/concurrent_requests.py --base-url http://127.0.0.1:8000 --concurrency 32
+
+With blocking `async def` handlers a single /reports/stock/aging call stalls
+every other request on the worker, so the cheap lookups' p95 tracks the
+report latency. With threaded handlers they interleave.
+"""
+import argparse
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MIX = [
+    # (path, weight)
+    ("/reports/stock/aging", 1),
+    ("/reports/user-activity", 1),
+    ("/inventory/item/1/branch/1", 6),
+    ("/item/1", 4),
+    ("/stock_movement/item/1", 2),
+]
+
+
+def _request(base_url, path, token):
+    req = urllib.request.Request(base_url + path, headers={"Authorization": f"Bearer {token}"})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            resp.read()
+            ok = resp.status < 500
+    except urllib.error.HTTPError as err:
+        ok = err.code < 500
+    except (urllib.error.URLError, TimeoutError):
+        ok = False
+    return path, time.perf_counter() - started, ok
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(base_url, token, concurrency, total, mix):
+    paths = [path for path, weight in mix for _ in range(weight)]
+    plan = [paths[i % len(paths)] for i in range(total)]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda p: _request(base_url, p, token), plan))
+    elapsed = time.perf_counter() - started
+
+    print(f"{total} requests, concurrency {concurrency}: {elapsed:.2f}s, {total / elapsed:.1f} req/s")
+    print(f"{'endpoint':40} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for path, _ in mix:
+        timings = [t for p, t, _ in results if p == path]
+        errors = sum(1 for p, _, ok in results if p == path and not ok)
+        print(
+            f"{path:40} {len(timings):6d} {errors:6d} "
+            f"{statistics.median(timings) * 1000 if timings else 0:9.1f} "
+            f"{_percentile(timings, 95) * 1000:9.1f} "
+            f"{max(timings) * 1000 if timings else 0:9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--token", default="1")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=1000)
+    args = parser.parse_args()
+    run(args.base_url.rstrip("/"), args.token, args.concurrency, args.requests, DEFAULT_MIX)
@@ -0,0 +1,48 @@
+-- Composite indexes for the hot query shapes. InnoDB appends the primary key
+-- to every secondary index, so (x, created_at) also orders by movement_id and
+-- serves the keyset pagination in stock_movement.py without a filesort.
+-- All built online: ALGORITHM=INPLACE, LOCK=NONE keeps the tables writable.
+
+-- stock_movement.py /item/{id}, filters by item + date range, export
+ALTER TABLE `stock_movements`
+  ADD INDEX `idx_sm_item_created` (`item_id`, `created_at`),
+  ALGORITHM=INPLACE, LOCK=NONE;
+
+-- stock_movement.py /branch/{id}, dashboard_activity.py recent activity
+ALTER TABLE `stock_movements`
+  ADD INDEX `idx_sm_branch_created` (`branch_id`, `created_at`),
+  ALGORITHM=INPLACE, LOCK=NONE;
+
+-- stock_movement.py /type/{type}
+ALTER TABLE `stock_movements`
+  ADD INDEX `idx_sm_type_created` (`movement_type`, `created_at`),
+  ALGORITHM=INPLACE, LOCK=NONE;
+
+-- reports.py stock aging: MAX(created_at) per (item, branch) read from the index alone
+ALTER TABLE `stock_movements`
+  ADD INDEX `idx_sm_item_branch_created` (`item_id`, `branch_id`, `created_at`),
+  ALGORITHM=INPLACE, LOCK=NONE;
+
+-- filter_query.py transfer search by status, newest first
+ALTER TABLE `transfer_requests`
+  ADD INDEX `idx_tr_status_date` (`status`, `request_date`),
+  ALGORITHM=INPLACE, LOCK=NONE;
+
+-- dashboard_activity.py summary counts per branch and status
+ALTER TABLE `transfer_requests`
+  ADD INDEX `idx_tr_to_status` (`to_branch_id`, `status`),
+  ALGORITHM=INPLACE, LOCK=NONE;
+
+ALTER TABLE `transfer_requests`
+  ADD INDEX `idx_tr_from_status` (`from_branch_id`, `status`),
+  ALGORITHM=INPLACE, LOCK=NONE;
+
+-- dashboard_activity.py items-in-stock count per branch
+ALTER TABLE `inventory`
+  ADD INDEX `idx_inventory_branch_available` (`branch_id`, `available_stock`),
+  ALGORITHM=INPLACE, LOCK=NONE;
+
+-- reports.py system logs by date range
+ALTER TABLE `system_logs`
+  ADD INDEX `idx_system_logs_created` (`created_at`),
+  ALGORITHM=INPLACE, LOCK=NONE;
@@ -0,0 +1,15 @@
+-- Left prefixes of the composites added in 0001; dropping them saves a
+-- write per movement. The composites also back the item_id/branch_id
+-- foreign keys.
+
+ALTER TABLE `stock_movements`
+  DROP INDEX `idx_stock_movements_item`,
+  ALGORITHM=INPLACE, LOCK=NONE;
+
+ALTER TABLE `stock_movements`
+  DROP INDEX `idx_stock_movements_branch`,
+  ALGORITHM=INPLACE, LOCK=NONE;
+
+ALTER TABLE `stock_movements`
+  DROP INDEX `idx_stock_movements_type`,
+  ALGORITHM=INPLACE, LOCK=NONE;
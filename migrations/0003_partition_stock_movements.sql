@@ -0,0 +1,47 @@
+-- Monthly RANGE partitioning of stock_movements on created_at, managed by
+-- app/partitions.py: it splits the empty p_future partition into pYYYYMM
+-- partitions ahead of time and archives old ones with EXCHANGE PARTITION.
+--
+-- Partitioned InnoDB tables can't have foreign keys, and every unique key
+-- must include the partitioning column, so the item/branch/user foreign keys
+-- go and the primary key becomes (movement_id, created_at). Ids are still
+-- unique through AUTO_INCREMENT; the bulk endpoint checks references itself.
+--
+-- offline
+-- Unlike the other migrations this one can't run online: repartitioning
+-- copies the table under a shared lock (reads continue, writes wait). Run it
+-- in a maintenance window with `python -m app.migrations apply`;
+-- MIGRATIONS_AUTO_APPLY stops before it.
+
+ALTER TABLE `stock_movements`
+  DROP FOREIGN KEY `stock_movements_ibfk_1`;
+
+ALTER TABLE `stock_movements`
+  DROP FOREIGN KEY `stock_movements_ibfk_2`;
+
+ALTER TABLE `stock_movements`
+  DROP FOREIGN KEY `stock_movements_ibfk_3`;
+
+ALTER TABLE `stock_movements`
+  DROP PRIMARY KEY,
+  ADD PRIMARY KEY (`movement_id`, `created_at`),
+  ALGORITHM=INPLACE, LOCK=NONE;
+
+-- created_at is a TIMESTAMP, so UNIX_TIMESTAMP() is the only partitioning
+-- function allowed; range predicates on created_at still prune.
+-- p_history ends with the month the migration is applied in, so p_future
+-- starts out empty and app/partitions.py can split it without moving rows.
+-- Partition bounds must be constants, hence the prepared statement.
+SET @p_history_end = DATE_FORMAT(CURDATE() + INTERVAL 1 MONTH, '%Y-%m-01');
+
+SET @partition_stock_movements = CONCAT(
+  'ALTER TABLE `stock_movements` PARTITION BY RANGE (UNIX_TIMESTAMP(`created_at`)) (',
+  'PARTITION `p_history` VALUES LESS THAN (UNIX_TIMESTAMP(''', @p_history_end, ' 00:00:00'')), ',
+  'PARTITION `p_future` VALUES LESS THAN MAXVALUE)'
+);
+
+PREPARE partition_stock_movements FROM @partition_stock_movements;
+
+EXECUTE partition_stock_movements;
+
+DEALLOCATE PREPARE partition_stock_movements;
@@ -0,0 +1,14 @@
+-- Per (item, branch) ledger balance checkpoints written by app/ledger.py.
+-- A checkpoint is the signed sum of every movement of the pair up to and
+-- including last_movement_id; reconciliation replays only the movements after
+-- the latest one. Older checkpoints are kept for balance-as-of queries.
+
+CREATE TABLE IF NOT EXISTS `stock_balance_checkpoints` (
+  `item_id` int(11) NOT NULL,
+  `branch_id` int(11) NOT NULL,
+  `last_movement_id` int(11) NOT NULL,
+  `last_movement_at` timestamp NOT NULL,
+  `balance` int(11) NOT NULL,
+  `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
+  PRIMARY KEY (`item_id`, `branch_id`, `last_movement_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
@@ -0,0 +1,11 @@
+-- Per-branch stock snapshots written by app/snapshots.py. Stock as of any
+-- time is the latest snapshot at or before it, overridden by the new_stock of
+-- each item's last movement between the snapshot and that time.
+
+CREATE TABLE IF NOT EXISTS `stock_snapshots` (
+  `branch_id` int(11) NOT NULL,
+  `snapshot_at` timestamp NOT NULL,
+  `item_id` int(11) NOT NULL,
+  `stock` int(11) NOT NULL,
+  PRIMARY KEY (`branch_id`, `snapshot_at`, `item_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
@@ -0,0 +1,4 @@
+-- app/stock_matrix.py re-reads inventory rows changed since its last refresh
+ALTER TABLE `inventory`
+  ADD INDEX `idx_inventory_last_updated` (`last_updated`),
+  ALGORITHM=INPLACE, LOCK=NONE;
@@ -0,0 +1,13 @@
+-- Idempotency-Key bookkeeping for the stock-writing endpoints (app/retry.py).
+-- A row is claimed before the handler runs; response_body stays NULL until it
+-- has committed, and rows older than IDEMPOTENCY_KEY_TTL are purged.
+
+CREATE TABLE IF NOT EXISTS `idempotency_keys` (
+  `route` varchar(255) NOT NULL,
+  `idempotency_key` varchar(255) NOT NULL,
+  `request_hash` char(64) NOT NULL,
+  `response_body` mediumtext DEFAULT NULL,
+  `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
+  PRIMARY KEY (`route`, `idempotency_key`),
+  KEY `idx_idempotency_keys_created` (`created_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
@@ -0,0 +1,10 @@
+-- Per-day counters behind TR-/DS-/RS-YYYYMMDD-NNNN document numbers
+-- (app/sequences.py). next_value is the first number not yet handed out;
+-- workers take blocks of numbers from it in short autocommitted updates.
+
+CREATE TABLE IF NOT EXISTS `document_sequences` (
+  `prefix` varchar(8) NOT NULL,
+  `seq_date` date NOT NULL,
+  `next_value` int(11) NOT NULL,
+  PRIMARY KEY (`prefix`, `seq_date`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
@@ -0,0 +1,121 @@
+"""An in-memory stand-in for MySQL, for testing the database code without a server.
+
+FakeDatabase answers only the statements a test registers a handler for
+(anything else fails the test), keeps rows in plain dicts, and undoes a
+connection's uncommitted writes on rollback() or close(), like InnoDB and the
+pool would. Statements run one at a time under a database-wide lock, so each
+one is atomic.
+"""
+import re
+import threading
+
+import mysql.connector
+import pytest
+
+from app import database
+
+_MISSING = object()
+
+
+def mysql_error(errno):
+    return mysql.connector.Error(msg=f"fake error {errno}", errno=errno)
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+        self.rowcount = -1
+        self.lastrowid = None
+
+    def execute(self, operation, params=None):
+        sql = " ".join(operation.split())
+        fake = self.connection.database
+        with fake.lock:
+            fake.statements.append(sql)
+            for pattern, handler in fake.handlers:
+                if pattern.search(sql):
+                    self.rows = list(handler(self, tuple(params or ())) or [])
+                    return
+        raise AssertionError(f"Unexpected statement: {sql}")
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, database):
+        self.database = database
+        self.route = None
+        self.last_insert_id = 0
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = False
+        self._undo = []  # reverts this transaction's writes, newest last
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+    def commit(self):
+        self._undo.clear()
+        self.commits += 1
+
+    def rollback(self):
+        with self.database.lock:
+            while self._undo:
+                self._undo.pop()()
+        self.rollbacks += 1
+
+    def close(self):
+        if self._undo:
+            self.rollback()
+        self.closed = True
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.tables = {}
+        self.handlers = []
+        self.statements = []
+        self.connections = []
+
+    def on(self, pattern, handler):
+        """Answer statements matching `pattern` with handler(cursor, params), which returns the rows."""
+        self.handlers.append((re.compile(pattern), handler))
+
+    def connect(self):
+        connection = FakeConnection(self)
+        with self.lock:
+            self.connections.append(connection)
+        return connection
+
+    def table(self, name):
+        return self.tables.setdefault(name, {})
+
+    def put(self, connection, table, key, value):
+        """Write a row in `connection`'s transaction."""
+        rows = self.table(table)
+        old = rows.get(key, _MISSING)
+        rows[key] = value
+        connection._undo.append(lambda: rows.pop(key) if old is _MISSING else rows.__setitem__(key, old))
+
+    def delete(self, connection, table, key):
+        rows = self.table(table)
+        if key in rows:
+            old = rows.pop(key)
+            connection._undo.append(lambda: rows.__setitem__(key, old))
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    # The auto-increment check needs a real server; the fake numbers rows consecutively
+    monkeypatch.setattr(database, "_insert_ids_checked", True)
+    return FakeDatabase()
@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+from app import coalescer, config, stock
+
+ITEM, BRANCH = 1, 1
+
+
+@pytest.fixture
+def inventory(fake_db, monkeypatch):
+    """The inventory and stock_movements statements of stock.apply_lines(), on the fake database."""
+
+    def lock_rows(cursor, params):
+        rows = fake_db.table("inventory")
+        pairs = zip(params[0::2], params[1::2])
+        return [(*pair, rows[pair]) for pair in pairs if pair in rows]
+
+    def write_inventory(cursor, params):
+        for start in range(0, len(params), 4):
+            item_id, branch_id, current_stock, _ = params[start:start + 4]
+            fake_db.put(cursor.connection, "inventory", (item_id, branch_id), current_stock)
+
+    def write_movements(cursor, params):
+        movements = fake_db.table("stock_movements")
+        cursor.lastrowid = len(movements) + 1
+        for position, start in enumerate(range(0, len(params), 10)):
+            fake_db.put(cursor.connection, "stock_movements", cursor.lastrowid + position, params[start:start + 10])
+
+    fake_db.on(r"^SELECT item_id, branch_id, current_stock FROM inventory", lock_rows)
+    fake_db.on(r"^INSERT INTO inventory", write_inventory)
+    fake_db.on(r"^INSERT INTO stock_movements", write_movements)
+    monkeypatch.setattr(coalescer, "get_connection", fake_db.connect)
+    # Batches flush when full, never on the window, so the tests control what is batched together
+    monkeypatch.setattr(config, "STOCK_COALESCE_WINDOW_MS", 10_000)
+    monkeypatch.setattr(config, "STOCK_COALESCE_MAX_BATCH", 3)
+    return fake_db
+
+
+def _line(movement_type, quantity):
+    return {
+        "item_id": ITEM,
+        "branch_id": BRANCH,
+        "movement_type": movement_type,
+        "quantity": quantity,
+        "reference_type": "ADJUSTMENT",
+        "reference_id": None,
+        "user_id": 7,
+        "notes": None,
+    }
+
+
+def _submit_in_order(lines):
+    """submit() each line from its own thread, in list order, into one batch; returns results or exceptions."""
+    outcomes = [None] * len(lines)
+
+    def submit(position):
+        try:
+            outcomes[position] = coalescer.submit(lines[position])
+        except Exception as err:
+            outcomes[position] = err
+
+    threads = []
+    for position in range(len(lines)):
+        thread = threading.Thread(target=submit, args=(position,))
+        thread.start()
+        threads.append(thread)
+        if position < len(lines) - 1:
+            # Wait for the line to be queued so arrival order is list order
+            deadline = time.monotonic() + 5
+            while len(getattr(coalescer._pending.get((ITEM, BRANCH)), "entries", ())) <= position:
+                assert time.monotonic() < deadline, "line was never queued"
+                time.sleep(0.001)
+    for thread in threads:
+        thread.join(5)
+        assert not thread.is_alive(), "submit() never returned"
+    return outcomes
+
+
+def test_batch_applies_lines_in_arrival_order_with_one_commit(inventory):
+    inventory.table("inventory")[(ITEM, BRANCH)] = 10
+
+    outcomes = _submit_in_order([_line("OUT", 3), _line("IN", 5), _line("OUT", 4)])
+
+    assert [(row["previous_stock"], row["new_stock"]) for row in outcomes] == [(10, 7), (7, 12), (12, 8)]
+    assert [row["movement_id"] for row in outcomes] == [1, 2, 3]
+    assert inventory.table("inventory")[(ITEM, BRANCH)] == 8
+    [connection] = inventory.connections
+    assert (connection.commits, connection.rollbacks, connection.closed) == (1, 0, True)
+
+
+def test_batch_with_a_shortage_falls_back_to_one_by_one(inventory):
+    inventory.table("inventory")[(ITEM, BRANCH)] = 5
+
+    first, short, last = _submit_in_order([_line("OUT", 2), _line("OUT", 10), _line("OUT", 1)])
+
+    # Only the line that can't be covered fails; the others apply as if submitted alone
+    assert (first["previous_stock"], first["new_stock"]) == (5, 3)
+    assert isinstance(short, stock.InsufficientStockError)
+    assert short.shortages == [(ITEM, BRANCH, 3, 10)]
+    assert (last["previous_stock"], last["new_stock"]) == (3, 2)
+    assert inventory.table("inventory")[(ITEM, BRANCH)] == 2
+    assert len(inventory.table("stock_movements")) == 2
+    [connection] = inventory.connections
+    # The batch and the short line are rolled back; the two good lines commit one each
+    assert (connection.commits, connection.rollbacks) == (2, 2)
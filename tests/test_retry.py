@@ -0,0 +1,155 @@
+import pytest
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from app import config, retry
+
+from .conftest import mysql_error
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(retry, "backoff", lambda attempt: 0)
+
+
+def test_run_rolls_back_and_reruns_after_deadlock(fake_db):
+    connection = fake_db.connect()
+    attempts = []
+
+    def work():
+        attempts.append(len(attempts))
+        fake_db.put(connection, "inventory", (1, 1), 10 + len(attempts))
+        if len(attempts) == 1:
+            raise mysql_error(1213)
+        return "done"
+
+    assert retry.run(work, connection) == "done"
+    assert len(attempts) == 2
+    assert connection.rollbacks == 1
+    # The first attempt's write was rolled back, not applied twice
+    assert fake_db.table("inventory") == {(1, 1): 12}
+
+
+def test_run_gives_up_after_the_configured_attempts(fake_db, monkeypatch):
+    monkeypatch.setattr(config, "DB_RETRY_ATTEMPTS", 2)
+    calls = []
+
+    def work():
+        calls.append(1)
+        raise mysql_error(1205)
+
+    with pytest.raises(Exception) as raised:
+        retry.run(work, fake_db.connect())
+    assert raised.value.errno == 1205
+    assert len(calls) == 3
+
+
+def test_run_does_not_retry_other_errors(fake_db):
+    calls = []
+
+    def work():
+        calls.append(1)
+        raise mysql_error(1062)
+
+    with pytest.raises(Exception):
+        retry.run(work, fake_db.connect())
+    assert len(calls) == 1
+
+
+class Adjustment(BaseModel):
+    quantity: int
+
+
+@pytest.fixture
+def client(fake_db, monkeypatch):
+    """An app with one @retry_transaction handler that deadlocks on its first attempt."""
+    keys = fake_db.table("idempotency_keys")
+
+    def claim(cursor, params):
+        route, key, request_hash = params
+        cursor.rowcount = 0
+        if (route, key) not in keys:
+            fake_db.put(cursor.connection, "idempotency_keys", (route, key), [request_hash, None])
+            cursor.rowcount = 1
+
+    def stored(cursor, params):
+        row = keys.get(params)
+        return [tuple(row)] if row else []
+
+    def store(cursor, params):
+        body, route, key = params
+        fake_db.put(cursor.connection, "idempotency_keys", (route, key), [keys[(route, key)][0], body])
+
+    def release(cursor, params):
+        if keys.get(params, [None, None])[1] is None:
+            fake_db.delete(cursor.connection, "idempotency_keys", params)
+
+    fake_db.on(r"^DELETE FROM idempotency_keys WHERE created_at <", lambda cursor, params: None)
+    fake_db.on(r"^DELETE FROM idempotency_keys WHERE .* AND created_at <", lambda cursor, params: None)
+    fake_db.on(r"^INSERT IGNORE INTO idempotency_keys", claim)
+    fake_db.on(r"^SELECT request_hash, response_body FROM idempotency_keys", stored)
+    fake_db.on(r"^UPDATE idempotency_keys SET response_body", store)
+    fake_db.on(r"^DELETE FROM idempotency_keys WHERE .* AND response_body IS NULL", release)
+    monkeypatch.setattr(retry, "get_aux_connection", fake_db.connect)
+
+    def get_connection():
+        connection = fake_db.connect()
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    app = FastAPI()
+    app.state.runs = []
+
+    @app.post("/adjust")
+    @retry.retry_transaction
+    def adjust(adjustment: Adjustment, connection=Depends(get_connection)):
+        app.state.runs.append(adjustment.quantity)
+        if adjustment.quantity < 0:
+            raise HTTPException(status_code=400, detail="negative")
+        stock = fake_db.table("inventory").get((1, 1), 0) + adjustment.quantity
+        fake_db.put(connection, "inventory", (1, 1), stock)
+        if len(app.state.runs) == 1:
+            raise mysql_error(1213)
+        connection.commit()
+        return {"stock": stock}
+
+    return TestClient(app)
+
+
+def test_deadlocked_handler_reruns_and_a_repeated_key_replays_its_response(client, fake_db):
+    headers = {retry.IDEMPOTENCY_HEADER: "key-1"}
+
+    first = client.post("/adjust", json={"quantity": 5}, headers=headers)
+    assert first.status_code == 200
+    assert first.json() == {"stock": 5}
+    assert client.app.state.runs == [5, 5]  # deadlocked once, then re-run
+    assert retry.REPLAYED_HEADER not in first.headers
+
+    again = client.post("/adjust", json={"quantity": 5}, headers=headers)
+    assert again.status_code == 200
+    assert again.json() == {"stock": 5}
+    assert again.headers[retry.REPLAYED_HEADER] == "true"
+    assert client.app.state.runs == [5, 5]  # replayed, not run again
+    assert fake_db.table("inventory") == {(1, 1): 5}
+
+
+def test_key_reused_for_a_different_request_is_rejected(client):
+    headers = {retry.IDEMPOTENCY_HEADER: "key-1"}
+    assert client.post("/adjust", json={"quantity": 5}, headers=headers).status_code == 200
+
+    response = client.post("/adjust", json={"quantity": 6}, headers=headers)
+    assert response.status_code == 422
+    assert client.app.state.runs == [5, 5]
+
+
+def test_failed_request_releases_its_key(client, fake_db):
+    headers = {retry.IDEMPOTENCY_HEADER: "key-1"}
+    assert client.post("/adjust", json={"quantity": -1}, headers=headers).status_code == 400
+    assert fake_db.table("idempotency_keys") == {}
+
+    # Sent again with the same key, the request runs instead of getting a 409
+    assert client.post("/adjust", json={"quantity": -1}, headers=headers).status_code == 400
+    assert client.app.state.runs == [-1, -1]
@@ -0,0 +1,122 @@
+import importlib.util
+import re
+import threading
+from datetime import date
+
+import pytest
+
+from app import config, sequences
+
+
+@pytest.fixture
+def counters(fake_db, monkeypatch):
+    """document_sequences (and the numbers already issued, for seeding) on the fake database."""
+    rows = fake_db.table("document_sequences")
+    issued = fake_db.table("issued")  # document number -> True
+
+    def bump(cursor, params):
+        size, prefix, seq_date = params
+        cursor.rowcount = 0
+        if (prefix, seq_date) in rows:
+            value = rows[(prefix, seq_date)] + size
+            fake_db.put(cursor.connection, "document_sequences", (prefix, seq_date), value)
+            cursor.connection.last_insert_id = value
+            cursor.rowcount = 1
+
+    def seed(cursor, params):
+        prefix = params[0][:-1]  # "TR-20260101-%"
+        numbers = [int(number[-4:]) for number in issued if number.startswith(prefix)]
+        return [(max(numbers, default=0) + 1,)]
+
+    def insert(cursor, params):
+        prefix, seq_date, first, size = params
+        value = rows[(prefix, seq_date)] + size if (prefix, seq_date) in rows else first
+        fake_db.put(cursor.connection, "document_sequences", (prefix, seq_date), value)
+        cursor.connection.last_insert_id = value
+
+    def counter(cursor, params):
+        return [(rows[params],)] if params in rows else []
+
+    fake_db.on(r"^UPDATE document_sequences SET next_value = LAST_INSERT_ID\(next_value \+ %s\)", bump)
+    fake_db.on(r"^SELECT COALESCE\(MAX\(CAST\(SUBSTRING", seed)
+    fake_db.on(r"^INSERT INTO document_sequences", insert)
+    fake_db.on(r"^SELECT LAST_INSERT_ID\(\)", lambda cursor, params: [(cursor.connection.last_insert_id,)])
+    fake_db.on(r"^SELECT next_value FROM document_sequences", counter)
+    monkeypatch.setattr(sequences, "get_aux_connection", fake_db.connect)
+    monkeypatch.setattr(sequences, "_blocks", {})
+    monkeypatch.setattr(config, "DOCUMENT_NUMBER_BLOCK", 4)
+    return fake_db
+
+
+def _today():
+    return date.today().strftime("%Y%m%d")
+
+
+def _second_worker(fake_db):
+    # A separate copy of the module: its own blocks and locks, like another uvicorn worker
+    spec = importlib.util.spec_from_file_location("sequences_second_worker", sequences.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.get_aux_connection = fake_db.connect
+    return module
+
+
+def _take_concurrently(allocators, threads, calls):
+    taken = []
+    lock = threading.Lock()
+
+    def take(allocator, thread):
+        for call in range(calls):
+            numbers = allocator.next_numbers(sequences.TRANSFER, 1 + (thread + call) % 3)
+            with lock:
+                taken.extend(numbers)
+
+    workers = [
+        threading.Thread(target=take, args=(allocators[thread % len(allocators)], thread))
+        for thread in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(10)
+        assert not worker.is_alive()
+    return taken
+
+
+def test_concurrent_next_numbers_never_repeat(counters):
+    taken = _take_concurrently([sequences], threads=8, calls=40)
+
+    assert len(taken) == sum(1 + (thread + call) % 3 for thread in range(8) for call in range(40))
+    assert len(set(taken)) == len(taken)
+    assert all(re.fullmatch(rf"TR-{_today()}-\d{{4}}", number) for number in taken)
+
+
+def test_workers_sharing_the_counter_never_repeat(counters):
+    taken = _take_concurrently([sequences, _second_worker(counters)], threads=8, calls=40)
+
+    assert len(set(taken)) == len(taken)
+
+
+def test_next_numbers_are_consecutive_within_one_call(counters):
+    numbers = sequences.next_numbers(sequences.TRANSFER, 10)
+
+    assert [int(number[-4:]) for number in numbers] == list(range(1, 11))
+
+
+def test_first_block_of_the_day_continues_after_issued_numbers(counters):
+    counters.table("issued")[f"TR-{_today()}-0007"] = True
+    counters.table("issued")[f"DS-{_today()}-0042"] = True
+
+    assert sequences.next_number(sequences.TRANSFER) == f"TR-{_today()}-0008"
+    assert sequences.next_number(sequences.DISPATCH) == f"DS-{_today()}-0043"
+
+
+def test_peek_reads_without_allocating(counters):
+    connection = counters.connect()
+    assert sequences.peek(sequences.TRANSFER, connection) == f"TR-{_today()}-0001"
+    assert counters.table("document_sequences") == {}
+
+    sequences.next_number(sequences.TRANSFER)
+    statements = len(counters.statements)
+    assert sequences.peek(sequences.TRANSFER, connection) == f"TR-{_today()}-0002"
+    assert len(counters.statements) == statements  # served from this worker's block